@@ -0,0 +1,79 @@
+#
+# xml解析性能测试
+# 运行方法: python bench/bench_parse.py
+#
+import os, sys, timeit
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.wxpay_xml import WxPayXmlReader
+
+
+ORDER_QUERY = """<xml>
+<return_code><![CDATA[SUCCESS]]></return_code>
+<return_msg><![CDATA[OK]]></return_msg>
+<appid><![CDATA[wx2421b1c4370ec43b]]></appid>
+<mch_id><![CDATA[10000100]]></mch_id>
+<device_info><![CDATA[1000]]></device_info>
+<nonce_str><![CDATA[TN55wO9Pba5yENl8]]></nonce_str>
+<sign><![CDATA[BDF0099C15FF7BC6B1585FBB110AB635]]></sign>
+<result_code><![CDATA[SUCCESS]]></result_code>
+<openid><![CDATA[oUpF8uN95-Ptaags6E_roPHg7AG0]]></openid>
+<is_subscribe><![CDATA[Y]]></is_subscribe>
+<trade_type><![CDATA[MICROPAY]]></trade_type>
+<bank_type><![CDATA[CCB_DEBIT]]></bank_type>
+<total_fee>1</total_fee>
+<fee_type><![CDATA[CNY]]></fee_type>
+<transaction_id><![CDATA[1008450740201411110005820873]]></transaction_id>
+<out_trade_no><![CDATA[1415757673]]></out_trade_no>
+<attach><![CDATA[订单额外描述]]></attach>
+<time_end><![CDATA[20141111170043]]></time_end>
+<trade_state><![CDATA[SUCCESS]]></trade_state>
+</xml>""".encode('utf-8')
+
+NOTIFY = """<xml>
+<appid><![CDATA[wx2421b1c4370ec43b]]></appid>
+<attach><![CDATA[支付测试]]></attach>
+<bank_type><![CDATA[CFT]]></bank_type>
+<fee_type><![CDATA[CNY]]></fee_type>
+<is_subscribe><![CDATA[Y]]></is_subscribe>
+<mch_id><![CDATA[10000100]]></mch_id>
+<nonce_str><![CDATA[5d2b6c2a8db53831f7eda20af46e531c]]></nonce_str>
+<openid><![CDATA[oUpF8uMEb4qRXf22hE3X68TekukE]]></openid>
+<out_trade_no><![CDATA[1409811653]]></out_trade_no>
+<result_code><![CDATA[SUCCESS]]></result_code>
+<return_code><![CDATA[SUCCESS]]></return_code>
+<sign><![CDATA[B552ED6B279343CB493C5DD0D78AB241]]></sign>
+<sub_mch_id><![CDATA[10000100]]></sub_mch_id>
+<time_end><![CDATA[20140903131540]]></time_end>
+<total_fee>1</total_fee>
+<trade_type><![CDATA[JSAPI]]></trade_type>
+<transaction_id><![CDATA[1004400740201409030005092168]]></transaction_id>
+</xml>""".encode('utf-8')
+
+
+def elementTree(xml):
+    return dict((child.tag, child.text) for child in ET.fromstring(xml))
+
+
+def main(number=20000, repeat=7):
+    reader = WxPayXmlReader()
+    for name, payload in (("orderquery", ORDER_QUERY), ("notify", NOTIFY)):
+        assert reader.read(payload) == elementTree(payload)
+        print("%s: %d bytes" % (name, len(payload)))
+        cases = (("ElementTree", lambda: elementTree(payload)),
+                 ("WxPayXmlReader", lambda: reader.read(payload)))
+        # 交替运行各个用例，减少机器负载波动的影响
+        best = dict((label, None) for label, function in cases)
+        for i in range(repeat):
+            for label, function in cases:
+                seconds = timeit.timeit(function, number=number)
+                if best[label] is None or seconds < best[label]:
+                    best[label] = seconds
+        for label, function in cases:
+            print("  %-16s %8.2f us/payload" % (label, best[label] / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
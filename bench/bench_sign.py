@@ -0,0 +1,36 @@
+#
+# 签名性能测试
+# 运行方法: python bench/bench_sign.py
+#
+import os, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.wxpay_sign import WxPaySigner
+from bench_xml import makeOrder
+
+
+def main(number=50000, repeat=7):
+    inputObj = makeOrder()
+    items = inputObj.SignItems()
+    sign = WxPaySigner.getDefault().sign(items)
+    signer = WxPaySigner.getDefault()
+    cases = (
+        ("MD5 sign", lambda: signer.sign(items)),
+        ("HMAC-SHA256 sign", lambda: signer.sign(items, WxPaySigner.HMAC_SHA256)),
+        ("MD5 verify", lambda: signer.verify(items, sign)),
+        ("MakeSign (object)", inputObj.MakeSign),
+    )
+    # 交替运行各个用例，减少机器负载波动的影响
+    best = dict((label, None) for label, function in cases)
+    for i in range(repeat):
+        for label, function in cases:
+            seconds = timeit.timeit(function, number=number)
+            if best[label] is None or seconds < best[label]:
+                best[label] = seconds
+    for label, function in cases:
+        print("%-20s %8.2f us/call" % (label, best[label] / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
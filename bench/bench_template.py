@@ -0,0 +1,53 @@
+#
+# 请求生成性能测试
+# 运行方法: python bench/bench_template.py
+#
+import os, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.wxpay_config import WxPayConfig
+from lib.wxpay_data import WxPayUnifiedOrder
+from lib.wxpay_api import WxPayApi
+from lib.wxpay_template import WxPayRequestTemplate
+from bench_xml import makeOrder
+
+
+# 原buildUnifiedOrder的写法：在调用方的对象上填充公共字段后签名输出
+def legacyBuild(inputObj):
+    inputObj.Validate()
+    if not inputObj.IsNotify_urlSet():
+        inputObj.SetNotify_url(WxPayConfig.__NOTIFY_URL__)
+    inputObj.SetAppid(WxPayConfig.__APPID__)
+    inputObj.SetMch_id(WxPayConfig.__MCHID__)
+    inputObj.SetSpbill_create_ip("1.1.1.1")
+    inputObj.SetNonce_str(WxPayApi.getNonceStr())
+    inputObj.SetSign()
+    return inputObj.ToXmlBytes()
+
+
+def main(number=20000, repeat=7):
+    inputObj = makeOrder()
+    fields = dict((key, value) for key, value in inputObj.values.items()
+                  if key not in ('appid', 'mch_id', 'nonce_str', 'sign'))
+    order = WxPayUnifiedOrder()
+    order.values = fields
+    template = WxPayRequestTemplate.getDefault('unifiedOrder')
+    cases = (
+        ("legacy build", lambda: legacyBuild(inputObj)),
+        ("template (object)", lambda: template.build(order)),
+        ("template (fields)", lambda: template.build(**fields)),
+    )
+    # 交替运行各个用例，减少机器负载波动的影响
+    best = dict((label, None) for label, function in cases)
+    for i in range(repeat):
+        for label, function in cases:
+            seconds = timeit.timeit(function, number=number)
+            if best[label] is None or seconds < best[label]:
+                best[label] = seconds
+    for label, function in cases:
+        print("%-20s %8.2f us/call" % (label, best[label] / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
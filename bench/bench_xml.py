@@ -0,0 +1,60 @@
+#
+# xml序列化性能测试
+# 运行方法: python bench/bench_xml.py
+#
+import os, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.wxpay_data import WxPayUnifiedOrder, WxPayResults
+
+
+# 原ToXml的写法（修正了结束标签），作为对比
+def legacyToXml(values):
+    xml = "<xml>"
+    for key, value in values.items():
+        if str(value).isnumeric():
+            xml += "<{0}>{1}</{0}>".format(key, value)
+        else:
+            xml += "<{0}><![CDATA[{1}]]></{0}>".format(key, value)
+    xml += "</xml>"
+    return xml.encode('utf-8')
+
+
+def makeOrder():
+    inputObj = WxPayUnifiedOrder()
+    inputObj.SetAppid("wx426b3015555a46be")
+    inputObj.SetMch_id("1900009851")
+    inputObj.SetNonce_str("5K8264ILTKCH16CQ2502SI8ZNMTM67VS")
+    inputObj.SetBody("腾讯充值中心-QQ会员充值")
+    inputObj.SetAttach("深圳分店")
+    inputObj.SetOut_trade_no("20150806125346")
+    inputObj.SetTotal_fee(888)
+    inputObj.SetSpbill_create_ip("123.12.12.123")
+    inputObj.SetTime_start("20091225091010")
+    inputObj.SetTime_expire("20091227091010")
+    inputObj.SetGoods_tag("WXG")
+    inputObj.SetNotify_url("http://www.weixin.qq.com/wxpay/pay.php")
+    inputObj.SetTrade_type("JSAPI")
+    inputObj.SetOpenid("oUpF8uMuAJO_M2pxb1Q9zNjWeS6o")
+    inputObj.values = dict(inputObj.values, sign="C380BEC2BFD727A4B6845133519F3AD6")
+    return inputObj
+
+
+def main(number=100000):
+    inputObj = makeOrder()
+    results = WxPayResults()
+    results.values = inputObj.GetValues()
+    cases = (
+        ("legacy str concat", lambda: legacyToXml(inputObj.values)),
+        ("ToXmlBytes (schema)", inputObj.ToXmlBytes),
+        ("ToXmlBytes (no schema)", results.ToXmlBytes),
+    )
+    print("payload: %d bytes, %d fields" % (len(inputObj.ToXmlBytes()), len(inputObj.values)))
+    for name, function in cases:
+        best = min(timeit.repeat(function, number=number, repeat=5))
+        print("%-24s %8.2f us/payload" % (name, best / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -1,12 +1,26 @@
 from .wxpay_config import WxPayConfig
-from .wxpay_exception import WxPayException
-from .wxpay_data import WxPayResults, WxPayReport
-
-import requests, datetime
+from .wxpay_exception import WxPayException, WxPayNetworkException
+from .wxpay_policy import WxPayEndpointPolicy
+from .wxpay_data import WxPayResults, WxPayReport, WxPayOrderQuery
+from .wxpay_transport import WxPayTransport, WxPayCertTransport
+from .wxpay_reporter import WxPayReporter
+from .wxpay_bill import WxPayBillReader
+from .wxpay_endpoint import WxPayEndpointSelector
+from .wxpay_sign import WxPaySigner
+from .wxpay_id import WxPayIdGenerator
+from .wxpay_metrics import WxPayMetrics
+from .wxpay_template import WxPayRequestTemplate
+from .wxpay_prepay import WxPayPrepayCache
+from .wxpay_dedup import WxPayNotifyDedup
+
+import threading, time
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 
 # 接口访问类，包含所有微信支付API列表的封装，类中方法为static方法，
 # 每个接口有默认超时时间（除提交被扫支付为10s，上报超时时间为1s外，其他均为6s）
+# 超时、重试、对冲请求等调用策略按接口配置在WxPayApi.policies中，调用时传入timeOut会覆盖读取超时
 # @author widyhu
 
 class WxPayApi:
@@ -21,46 +35,63 @@ class WxPayApi:
     #
     """
 
+    # 所有接口共用的长连接传输对象，首次请求时按WxPayConfig创建
+    transport = None
+    # 退款、撤销订单等需要证书的接口共用的传输对象，首次请求时加载证书
+    certTransport = None
+    _transportLock = threading.Lock()
+    # 后台测速上报对象，首次上报时创建
+    reporter = None
+
+    # 各接口的调用策略，按url路径配置，未配置的接口使用默认策略
+    # 非幂等接口（下单、退款、撤销等）只在请求未发出时重试；幂等查询接口可重试并开启对冲请求
+    policies = {
+        '/pay/unifiedorder': WxPayEndpointPolicy(readTimeout=6, retries=1),
+        '/pay/orderquery': WxPayEndpointPolicy(readTimeout=6, retries=2, idempotent=True, hedge=True),
+        '/pay/closeorder': WxPayEndpointPolicy(readTimeout=6, retries=2, idempotent=True),
+        '/secapi/pay/refund': WxPayEndpointPolicy(readTimeout=6, retries=1),
+        '/pay/refundquery': WxPayEndpointPolicy(readTimeout=6, retries=2, idempotent=True, hedge=True),
+        '/pay/downloadbill': WxPayEndpointPolicy(readTimeout=6, retries=1, idempotent=True),
+        '/pay/micropay': WxPayEndpointPolicy(readTimeout=10, retries=1),
+        '/secapi/pay/reverse': WxPayEndpointPolicy(readTimeout=6, retries=1),
+        '/payitil/report': WxPayEndpointPolicy(connectTimeout=1, readTimeout=1),
+        '/tools/shorturl': WxPayEndpointPolicy(readTimeout=6, retries=2, idempotent=True, hedge=True),
+    }
+    defaultPolicy = WxPayEndpointPolicy(readTimeout=30)
+
+    # 接口域名选择，按域名熔断并切换到备用域名
+    selector = WxPayEndpointSelector()
+    # 各接口分阶段耗时统计，getMetrics().exposition()输出Prometheus文本格式
+    metrics = WxPayMetrics()
+    # 统一下单结果缓存，首次下单时按WxPayConfig创建
+    prepayCache = None
+
+    # 订单参数与上次下单相同且prepay_id未过期时直接返回上次的结果，见WxPayPrepayCache
     @staticmethod
-    def unifiedOrder(inputObj, timeOut=6):
-        url = 'https://api.mch.weixin.qq.com/pay/unifiedorder'
-        # 检测必要参数
-        if not inputObj.IsOut_trade_noSet():
-            WxPayException("缺少统一支付接口必填参数out_trade_no！")
-        elif not inputObj.IsBodySet():
-            WxPayException("缺少统一支付接口必填参数body！")
-        elif not inputObj.IsTotal_feeSet():
-            WxPayException("缺少统一支付接口必填参数total_fee！")
-        elif not inputObj.IsTrade_typeSet():
-            WxPayException("缺少统一支付接口必填参数trade_type！")
-
-        # 关联参数
-        if inputObj.GetTrade_type() == "JSAPI" and not inputObj.IsOpenidSet():
-            WxPayException("统一支付接口中，缺少必填参数openid！trade_type为JSAPI时，openid为必填参数！")
-        if inputObj.GetTrade_type() == "NATIVE" and not inputObj.IsProduct_idSet():
-            WxPayException("统一支付接口中，缺少必填参数product_id！trade_type为JSAPI时，product_id为必填参数！")
-
-        # 异步通知url未设置，则使用配置文件中的url
-        if not inputObj.IsNotify_urlSet():
-            inputObj.SetNotify_url(WxPayConfig.__NOTIFY_URL__)
-
-        inputObj.SetAppid(WxPayConfig.__APPID__)  # 公众账号ID
-        inputObj.SetMch_id(WxPayConfig.__MCHID__)  # 商户号
-        inputObj.SetSpbill_create_ip('0.0.0.0')  # 终端IP
-        inputObj.SetSpbill_create_ip("1.1.1.1")
-        inputObj.SetNonce_str(WxPayApi.getNonceStr())
-
-        # 签名
-        inputObj.SetSign()
-        xml = inputObj.ToXml()
-
-        startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
-        response = WxPayApi.postXmlCurl(xml, url, False, timeOut)
-        result = WxPayResults.Init(response)
+    def unifiedOrder(inputObj, timeOut=None):
+        cache = WxPayApi.getPrepayCache()
+        if cache is not None:
+            result = cache.get(inputObj)
+            if result is not None:
+                return result
+        with WxPayApi.metrics.timer() as timer:
+            url, xml = WxPayApi.buildUnifiedOrder(inputObj)
+            startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
+            response = WxPayApi.postXmlBytes(xml, url, False, timeOut)
+            result = WxPayResults.Init(response, WxPayApi.getSignType(inputObj))
+            timer.setResult(result)
         WxPayApi.reportCostTime(url, startTimeStamp, result)
+        if cache is not None:
+            cache.put(inputObj, result)
 
         return result
 
+    # 检测参数并填充公共字段，返回请求url及签名后的xml
+    # 使用预先填好商户参数的请求模板，inputObj不会被修改
+    @staticmethod
+    def buildUnifiedOrder(inputObj):
+        return WxPayRequestTemplate.getDefault('unifiedOrder').build(inputObj)
+
     # 查询订单，WxPayOrderQuery中out_trade_no、transaction_id至少填一个
     # appid、mchid、spbill_create_ip、nonce_str不需要填入
     # @ param WxPayOrderQuery $inputObj
@@ -68,25 +99,70 @@ class WxPayApi:
     # @ throws WxPayException
     # @ return 成功时返回，其他抛异常
     @staticmethod
-    def orderQuery(inputObj, timeOut=6):
-        url = "https://api.mch.weixin.qq.com/pay/orderquery"
-        # 检测必填参数
-        if not inputObj.IsOut_trade_noSet() and not inputObj.IsTransaction_idSet():
-            WxPayException("订单查询接口中，out_trade_no、transaction_id至少填一个！")
-        inputObj.SetAppid(WxPayConfig.__APPID__)  # 公众账号ID
-        inputObj.SetMch_id(WxPayConfig.__MCHID__)  # 商户号
-        inputObj.SetNonce_str(WxPayApi.getNonceStr())  # 随机字符串
-
-        inputObj.SetSign()  # 签名
-        xml = inputObj.ToXml()
-
-        startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
-        response = WxPayApi.postXmlCurl(xml, url, False, timeOut)
-        result = WxPayResults.Init(response)
+    def orderQuery(inputObj, timeOut=None):
+        with WxPayApi.metrics.timer() as timer:
+            url, xml = WxPayApi.buildOrderQuery(inputObj)
+            startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
+            response = WxPayApi.postXmlBytes(xml, url, False, timeOut)
+            result = WxPayResults.Init(response, WxPayApi.getSignType(inputObj))
+            timer.setResult(result)
         WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
 
         return result
 
+    # 检测参数并填充公共字段，返回请求url及签名后的xml
+    # 使用预先填好商户参数的请求模板，inputObj不会被修改
+    @staticmethod
+    def buildOrderQuery(inputObj):
+        return WxPayRequestTemplate.getDefault('orderQuery').build(inputObj)
+
+    # 批量查询订单，多个查询在线程池中并发执行，共用同一个连接池，按完成先后逐个返回结果。
+    # 单个订单查询出错不会中断整批查询，错误随结果一起返回
+    # @ param iterable $values out_trade_no或transaction_id的列表
+    # @ param string $field values对应的字段，out_trade_no或transaction_id
+    # @ param int $concurrency 最大并发查询数，建议不大于WxPayConfig.POOL_MAXSIZE
+    # @ param int $timeOut
+    # @ return 生成器，每项为(value, result, error)，成功时error为None，失败时result为None
+    @staticmethod
+    def orderQueryBatch(values, field="out_trade_no", concurrency=None, timeOut=None):
+        if field not in ("out_trade_no", "transaction_id"):
+            raise WxPayException("批量查询订单中，field只能为out_trade_no或transaction_id！")
+        if concurrency is None:
+            concurrency = WxPayConfig.BATCH_CONCURRENCY
+
+        def query(value):
+            inputObj = WxPayOrderQuery()
+            if field == "out_trade_no":
+                inputObj.SetOut_trade_no(value)
+            else:
+                inputObj.SetTransaction_id(value)
+            return WxPayApi.orderQuery(inputObj, timeOut)
+
+        executor = ThreadPoolExecutor(max_workers=concurrency,
+                                      thread_name_prefix='WxPayOrderQuery')
+        pending = {}
+        values = iter(values)
+        try:
+            while True:
+                # 在途查询数保持在并发数的两倍以内，避免一次性提交全部订单
+                for value in values:
+                    pending[executor.submit(query, value)] = value
+                    if len(pending) >= concurrency * 2:
+                        break
+                if not pending:
+                    break
+                done, notDone = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    value = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        yield value, None, e
+                    else:
+                        yield value, result, None
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
     # 关闭订单，WxPayCloseOrder中out_trade_no必填
     # appid、mchid、spbill_create_ip、nonce_str不需要填入
     # @ param WxPayCloseOrder $inputObj
@@ -94,24 +170,33 @@ class WxPayApi:
     # @ throws WxPayException
     # @ return 成功时返回，其他抛异常
     @staticmethod
-    def closeOrder(inputObj, timeOut=6):
+    def closeOrder(inputObj, timeOut=None):
+        # 订单关闭后prepay_id不能再使用
+        WxPayApi.invalidatePrepay(inputObj.values.get('out_trade_no'))
+        with WxPayApi.metrics.timer() as timer:
+            url, xml = WxPayApi.buildCloseOrder(inputObj)
+            startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
+            response = WxPayApi.postXmlBytes(xml, url, False, timeOut)
+            result = WxPayResults.Init(response, WxPayApi.getSignType(inputObj))
+            timer.setResult(result)
+        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
+
+        return result
+
+    # 检测参数并填充公共字段，返回请求url及签名后的xml
+    @staticmethod
+    def buildCloseOrder(inputObj):
         url = "https://api.mch.weixin.qq.com/pay/closeorder"
         # 检测必填参数
-        if not inputObj.IsOut_trade_noSet():
-            WxPayException("订单查询接口中，out_trade_no必填！")
+        inputObj.Validate()
+
         inputObj.SetAppid(WxPayConfig.__APPID__)  # 公众账号ID
         inputObj.SetMch_id(WxPayConfig.__MCHID__)  # 商户号
         inputObj.SetNonce_str(WxPayApi.getNonceStr())  # 随机字符串
 
         inputObj.SetSign()  # 签名
-        xml = inputObj.ToXml()
-
-        startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
-        response = WxPayApi.postXmlCurl(xml, url, False, timeOut)
-        result = WxPayResults.Init(response)
-        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
-
-        return result
+        xml = inputObj.ToXmlBytes()
+        return url, xml
 
     # 申请退款，WxPayRefund中out_trade_no、transaction_id至少填一个且
     # out_refund_no、total_fee、refund_fee、op_user_id为必填参数
@@ -121,31 +206,31 @@ class WxPayApi:
     # @ throws WxPayException
     # @ return 成功时返回，其他抛异常
     @staticmethod
-    def refund(inputObj, timeOut=6):
+    def refund(inputObj, timeOut=None):
+        with WxPayApi.metrics.timer() as timer:
+            url, xml = WxPayApi.buildRefund(inputObj)
+            startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
+            response = WxPayApi.postXmlBytes(xml, url, True, timeOut)
+            result = WxPayResults.Init(response, WxPayApi.getSignType(inputObj))
+            timer.setResult(result)
+        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
+
+        return result
+
+    # 检测参数并填充公共字段，返回请求url及签名后的xml
+    @staticmethod
+    def buildRefund(inputObj):
         url = "https://api.mch.weixin.qq.com/secapi/pay/refund"
-        # 检测必要参数
-        if not inputObj.IsOut_trade_noSet() and not inputObj.IsTransaction_idSet():
-            WxPayException("退款申请接口中，out_trade_no、transaction_id至少填一个！")
-        elif not inputObj.IsOut_refund_noSet():
-            WxPayException("退款申请接口中，缺少必填参数out_refund_no！")
-        elif not inputObj.IsTotal_feeSet():
-            WxPayException("退款申请接口中，缺少必填参数total_fee！")
-        elif not inputObj.IsRefund_feeSet():
-            WxPayException("退款申请接口中，缺少必填参数refund_fee！")
-        elif not inputObj.IsOp_user_idSet():
-            WxPayException("退款申请接口中，缺少必填参数op_user_id！")
+        # 检测必填参数
+        inputObj.Validate()
+
         inputObj.SetAppid(WxPayConfig.__APPID__)  # 公众账号ID
         inputObj.SetMch_id(WxPayConfig.__MCHID__)  # 商户号
         inputObj.SetNonce_str(WxPayApi.getNonceStr())  # 随机字符串
 
         inputObj.SetSign()  # 签名
-        xml = inputObj.ToXml()
-        startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
-        response = WxPayApi.postXmlCurl(xml, url, False, timeOut)
-        result = WxPayResults.Init(response)
-        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
-
-        return result
+        xml = inputObj.ToXmlBytes()
+        return url, xml
 
     # 查询退款
     # 提交退款申请后，通过调用该接口查询退款状态。退款有一定延时，
@@ -158,26 +243,31 @@ class WxPayApi:
     # @ return 成功时返回，其他抛异常
 
     @staticmethod
-    def refundQuery(inputObj, timeOut=6):
+    def refundQuery(inputObj, timeOut=None):
+        with WxPayApi.metrics.timer() as timer:
+            url, xml = WxPayApi.buildRefundQuery(inputObj)
+            startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
+            response = WxPayApi.postXmlBytes(xml, url, False, timeOut)
+            result = WxPayResults.Init(response, WxPayApi.getSignType(inputObj))
+            timer.setResult(result)
+        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
+
+        return result
+
+    # 检测参数并填充公共字段，返回请求url及签名后的xml
+    @staticmethod
+    def buildRefundQuery(inputObj):
         url = "https://api.mch.weixin.qq.com/pay/refundquery"
-        # 检测必要参数
-        if not inputObj.IsOut_refund_noSet() and \
-                not inputObj.IsOut_trade_noSet() and \
-                not inputObj.IsTransaction_idSet() and \
-                not inputObj.IsRefund_idSet():
-            WxPayException("退款查询接口中，out_refund_no、out_trade_no、transaction_id、refund_id四个参数必填一个！")
+        # 检测必填参数
+        inputObj.Validate()
+
         inputObj.SetAppid(WxPayConfig.__APPID__)  # 公众账号ID
         inputObj.SetMch_id(WxPayConfig.__MCHID__)  # 商户号
         inputObj.SetNonce_str(WxPayApi.getNonceStr())  # 随机字符串
 
         inputObj.SetSign()  # 签名
-        xml = inputObj.ToXml()
-        startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
-        response = WxPayApi.postXmlCurl(xml, url, False, timeOut)
-        result = WxPayResults.Init(response)
-        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
-
-        return result
+        xml = inputObj.ToXmlBytes()
+        return url, xml
 
     # 下载对账单，WxPayDownloadBill中bill_date为必填参数
     # appid、mchid、spbill_create_ip、nonce_str不需要填入
@@ -186,21 +276,40 @@ class WxPayApi:
     # @ throws WxPayException
     # @ return 成功时返回，其他抛异常
     @staticmethod
-    def downloadBill(inputObj, timeOut=6):
+    def downloadBill(inputObj, timeOut=None):
+        url, xml = WxPayApi.buildDownloadBill(inputObj)
+        response = WxPayApi.postXmlBytes(xml, url, False, timeOut)
+        if response[0:5] == b"<xml>":
+            return ""
+        return response.decode('utf-8', 'replace')
+
+    # 流式下载对账单，不在内存中缓存整份对账单，WxPayDownloadBill中bill_date为必填参数
+    # 设置tar_type为GZIP时下载压缩账单并边读边解压
+    # 接口返回错误信息时抛出异常，只读取响应开头的少量数据即可判断
+    # @ param WxPayDownloadBill $inputObj
+    # @ param int $timeOut 每次读取数据的超时时间
+    # @ throws WxPayException
+    # @ return WxPayBillReader，可逐行读取(rows)或写入文件(writeTo)
+    @staticmethod
+    def downloadBillStream(inputObj, timeOut=None):
+        url, xml = WxPayApi.buildDownloadBill(inputObj)
+        response = WxPayApi.postXmlResponse(xml, url, False, timeOut, True)
+        return WxPayBillReader(response.iter_content(65536), response.close)
+
+    # 检测参数并填充公共字段，返回请求url及签名后的xml
+    @staticmethod
+    def buildDownloadBill(inputObj):
         url = "https://api.mch.weixin.qq.com/pay/downloadbill"
-        if not inputObj.IsBill_dateSet():
-            WxPayException("对账单接口中，缺少必填参数bill_date！")
+        # 检测必填参数
+        inputObj.Validate()
+
         inputObj.SetAppid(WxPayConfig.__APPID__)  # 公众账号ID
         inputObj.SetMch_id(WxPayConfig.__MCHID__)  # 商户号
         inputObj.SetNonce_str(WxPayApi.getNonceStr())  # 随机字符串
 
         inputObj.SetSign()  # 签名
-        xml = inputObj.ToXml()
-
-        response = WxPayApi.postXmlCurl(xml, url, False, timeOut)
-        if response[0:5] == "<xml>":
-            return ""
-        return response
+        xml = inputObj.ToXmlBytes()
+        return url, xml
 
     # 提交被扫支付API
     # 收银员使用扫码设备读取微信用户刷卡授权码以后，二维码或条码信息传送至商户收银台，
@@ -210,17 +319,23 @@ class WxPayApi:
     # @ param WxPayWxPayMicroPay $inputObj
     # @ param int $timeOut
     @staticmethod
-    def micropay(inputObj, timeOut=10):
+    def micropay(inputObj, timeOut=None):
+        with WxPayApi.metrics.timer() as timer:
+            url, xml = WxPayApi.buildMicropay(inputObj)
+            startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
+            response = WxPayApi.postXmlBytes(xml, url, False, timeOut)
+            result = WxPayResults.Init(response, WxPayApi.getSignType(inputObj))
+            timer.setResult(result)
+        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
+
+        return result
+
+    # 检测参数并填充公共字段，返回请求url及签名后的xml
+    @staticmethod
+    def buildMicropay(inputObj):
         url = "https://api.mch.weixin.qq.com/pay/micropay"
         # 检测必填参数
-        if not inputObj.IsBodySet():
-            WxPayException("提交被扫支付API接口中，缺少必填参数body！")
-        elif inputObj.IsOut_trade_noSet():
-            WxPayException("提交被扫支付API接口中，缺少必填参数out_trade_no！")
-        elif inputObj.IsTotal_feeSet():
-            WxPayException("提交被扫支付API接口中，缺少必填参数total_fee！")
-        elif inputObj.IsAuth_codeSet():
-            WxPayException("提交被扫支付API接口中，缺少必填参数auth_code！")
+        inputObj.Validate()
 
         inputObj.SetSpbill_create_ip("1.1.1.1")  # 终端ip
         inputObj.SetAppid(WxPayConfig.__APPID__)  # 公众账号ID
@@ -228,14 +343,8 @@ class WxPayApi:
         inputObj.SetNonce_str(WxPayApi.getNonceStr())  # 随机字符串
 
         inputObj.SetSign()  # 签名
-        xml = inputObj.ToXml()
-
-        startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
-        response = WxPayApi.postXmlCurl(xml, url, False, timeOut)
-        result = WxPayResults.Init(response)
-        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
-
-        return result
+        xml = inputObj.ToXmlBytes()
+        return url, xml
 
     # 撤销订单API接口，WxPayReverse中参数out_trade_no和transaction_id必须填写一个
     # appid、mchid、spbill_create_ip、nonce_str不需要填入
@@ -243,23 +352,31 @@ class WxPayApi:
     # @ param int $timeOut
     # @ throws WxPayException
     @staticmethod
-    def reverse(inputObj, timeOut=6):
+    def reverse(inputObj, timeOut=None):
+        with WxPayApi.metrics.timer() as timer:
+            url, xml = WxPayApi.buildReverse(inputObj)
+            startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
+            response = WxPayApi.postXmlBytes(xml, url, True, timeOut)
+            result = WxPayResults.Init(response, WxPayApi.getSignType(inputObj))
+            timer.setResult(result)
+        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
+
+        return result
+
+    # 检测参数并填充公共字段，返回请求url及签名后的xml
+    @staticmethod
+    def buildReverse(inputObj):
         url = "https://api.mch.weixin.qq.com/secapi/pay/reverse"
-        if not inputObj.IsOut_trade_noSet() and not inputObj.IsTransaction_idSet():
-            WxPayException("撤销订单API接口中，参数out_trade_no和transaction_id必须填写一个！")
+        # 检测必填参数
+        inputObj.Validate()
+
         inputObj.SetAppid(WxPayConfig.__APPID__)  # 公众账号ID
         inputObj.SetMch_id(WxPayConfig.__MCHID__)  # 商户号
         inputObj.SetNonce_str(WxPayApi.getNonceStr())  # 随机字符串
 
         inputObj.SetSign()  # 签名
-        xml = inputObj.ToXml()
-
-        startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
-        response = WxPayApi.postXmlCurl(xml, url, False, timeOut)
-        result = WxPayResults.Init(response)
-        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
-
-        return result
+        xml = inputObj.ToXmlBytes()
+        return url, xml
 
     # 测速上报，该方法内部封装在report中，使用时请注意异常流程
     # WxPayReport中interface_url、return_code、result_code、user_ip、execute_time_必填
@@ -269,19 +386,19 @@ class WxPayApi:
     # @ throws WxPayException
     # @ return 成功时返回，其他抛异常
     @staticmethod
-    def report(inputObj, timeOut=1):
+    def report(inputObj, timeOut=None):
+        url, xml = WxPayApi.buildReport(inputObj)
+        startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
+        response = WxPayApi.postXmlCurl(xml, url, False, timeOut)
+        return response
+
+    # 检测参数并填充公共字段，返回请求url及签名后的xml
+    @staticmethod
+    def buildReport(inputObj):
         url = "https://api.mch.weixin.qq.com/payitil/report"
         # 检测必填参数
-        if not inputObj.IsInterface_urlSet():
-            WxPayException("接口URL，缺少必填参数interface_url！")
-        if not inputObj.IsReturn_codeSet():
-            WxPayException("返回状态码，缺少必填参数return_code！")
-        if not inputObj.IsResult_codeSet():
-            WxPayException("业务结果，缺少必填参数result_code！")
-        if not inputObj.IsUser_ipSet():
-            WxPayException("访问接口IP，缺少必填参数user_ip！")
-        if not inputObj.IsExecute_time_Set():
-            WxPayException("接口耗时，缺少必填参数execute_time_！")
+        inputObj.Validate()
+
         inputObj.SetAppid(WxPayConfig.__APPID__)  # 公众账号ID
         inputObj.SetMch_id(WxPayConfig.__MCHID__)  # 商户号
         inputObj.SetUser_ip("1.1.1.1")  # 终端IP
@@ -289,11 +406,8 @@ class WxPayApi:
         inputObj.SetNonce_str(WxPayApi.getNonceStr())
 
         inputObj.SetSign()  # 签名
-        xml = inputObj.ToXml()
-
-        startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
-        response = WxPayApi.postXmlCurl(xml, url, False, timeOut)
-        return response
+        xml = inputObj.ToXmlBytes()
+        return url, xml
 
     # 生成二维码规则, 模式一生成支付二维码
     # appid、mchid、spbill_create_ip、nonce_str不需要填入
@@ -303,8 +417,8 @@ class WxPayApi:
     # @ return 成功时返回，其他抛异常
     @staticmethod
     def bizpayurl(inputObj, timeOut=6):
-        if not inputObj.IsProduct_idSet():
-            WxPayException("生成二维码，缺少必填参数product_id！")
+        # 检测必填参数
+        inputObj.Validate()
 
         inputObj.SetAppid(WxPayConfig.__APPID__)  # 公众账号ID
         inputObj.SetMch_id(WxPayConfig.__MCHID__)  # 商户号
@@ -324,56 +438,172 @@ class WxPayApi:
     # @ throws WxPayException
     # @ return 成功时返回，其他抛异常
     @staticmethod
-    def shorturl(inputObj, timeOut=6):
+    def shorturl(inputObj, timeOut=None):
+        with WxPayApi.metrics.timer() as timer:
+            url, xml = WxPayApi.buildShorturl(inputObj)
+            startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
+            response = WxPayApi.postXmlBytes(xml, url, False, timeOut)
+            result = WxPayResults.Init(response, WxPayApi.getSignType(inputObj))
+            timer.setResult(result)
+        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
+
+        return result
+
+    # 检测参数并填充公共字段，返回请求url及签名后的xml
+    @staticmethod
+    def buildShorturl(inputObj):
         url = "https://api.mch.weixin.qq.com/tools/shorturl"
         # 检测必填参数
-        if not inputObj.IsLong_urlSet():
-            WxPayException("需要转换的URL，签名用原串，传输需URL encode！")
+        inputObj.Validate()
+
         inputObj.SetAppid(WxPayConfig.__APPID__)  # 公众账号ID
         inputObj.SetMch_id(WxPayConfig.__MCHID__)  # 商户号
         inputObj.SetNonce_str(WxPayApi.getNonceStr())  # 随机字符串
 
         inputObj.SetSign()  # 签名
-        xml = inputObj.ToXml()
-
-        startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
-        response = WxPayApi.postXmlCurl(xml, url, False, timeOut)
-        result = WxPayResults.Init(response)
-        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
-
-        return result
+        xml = inputObj.ToXmlBytes()
+        return url, xml
 
     # 支付结果通用通知
-    # @ param function $callback
-    # 直接回调函数使用方法: notify(you_function);
-    # 回调类成员函数方法: notify(array($this, you_function));
-    # $callback 原型为：function function_name($data){}
+    # @ param function $callback 业务处理函数，参数为验证通过的通知参数字典，
+    # 返回True表示处理成功；返回False或抛出WxPayException表示处理失败
+    # @ param bytes|string $xml 通知的原始请求体
+    # @ param WxPayNotifyDedup $dedup 去重缓存，已处理成功的重复通知直接返回成功，不验证签名也不调用callback
+    # @ param WxPayNotifyQueue $queue 持久化队列，传入时验证通过的通知写入队列后立即返回成功，
+    # 由队列的处理线程调用业务处理，callback可以为None
+    # 使用方法: ok, msg = WxPayApi.notify(you_function, xml)
+    # @ return (是否成功, 失败原因)，成功时为(True, "OK")
     @staticmethod
-    def notify(callback, msg):
-        # 获取通知的数据
-        xml = ''
-
+    def notify(callback, xml, dedup=None, queue=None):
         # 如果返回成功则验证签名
         try:
-            result = WxPayResults.Init(xml)
+            result = WxPayApi.parseNotify(xml)
+            # 去重键同时用于持久化队列，没有传入dedup时也要计算
+            key = WxPayNotifyDedup.key(result)
+            if dedup is not None:
+                if dedup.isDone(key):
+                    return True, "OK"
+            WxPayApi.checkNotify(result)
+            if queue is not None:
+                queue.put(result, key)
+                WxPayApi._markNotify(dedup, key, True)
+                return True, "OK"
+            # 去重存储不可用时返回失败，由微信稍后重新通知
+            if dedup is not None and not dedup.claim(key):
+                return False, "通知正在处理中"
         except WxPayException as e:
-            msg = e.errorMessage()
-            return False
-        return callback(result)
+            return False, e.errorMessage()
+        try:
+            ok = callback(result) is not False
+            msg = "OK" if ok else "FAIL"
+        except WxPayException as e:
+            ok, msg = False, e.errorMessage()
+        except Exception:
+            WxPayApi._markNotify(dedup, key, False)
+            raise
+        WxPayApi._markNotify(dedup, key, ok)
+        return ok, msg
+
+    # 记录通知的去重状态，处理成功时记为已处理，失败时释放占用；
+    # 去重存储写入失败不改变处理结果（已处理的记录保存在本地，释放失败的占用在pendingTtl秒后过期）
+    @staticmethod
+    def _markNotify(dedup, key, ok):
+        if dedup is None:
+            return
+        try:
+            if ok:
+                dedup.done(key)
+            else:
+                dedup.release(key)
+        except WxPayException:
+            pass
+
+    # 解析并验证一条支付通知，return_code不是SUCCESS或签名错误时抛出异常
+    # @ param bytes|string $xml 通知的原始请求体
+    # @ param WxPaySigner $signer 签名对象，默认WxPaySigner.getDefault()
+    # @ throws WxPayException
+    # @ return 通知参数字典
+    @staticmethod
+    def verifyNotify(xml, signer=None):
+        return WxPayApi.checkNotify(WxPayApi.parseNotify(xml), signer)
+
+    # 解析支付通知，不验证签名
+    # @ throws WxPayException
+    # @ return 通知参数字典
+    @staticmethod
+    def parseNotify(xml):
+        with WxPayMetrics.phase('parse'):
+            return WxPayResults().FromXml(xml)
+
+    # 验证已解析的支付通知，return_code不是SUCCESS或签名错误时抛出异常
+    # @ param dict $values parseNotify的返回值
+    # @ param WxPaySigner $signer 签名对象，默认WxPaySigner.getDefault()
+    # @ throws WxPayException
+    # @ return values
+    @staticmethod
+    def checkNotify(values, signer=None):
+        if values.get('return_code') != 'SUCCESS':
+            raise WxPayException("通知的return_code不是SUCCESS！")
+        obj = WxPayResults()
+        obj.values = values
+        with WxPayMetrics.phase('verify'):
+            obj.CheckSign(signer=signer)
+        return values
+
+    # 批量验证支付通知，解析及验证签名按组分配到多个进程并行执行，用于积压通知的追赶处理
+    # @ param iterable $payloads 原始通知xml（bytes或str）
+    # @ param int $workers 进程数，默认为CPU核数
+    # @ param Executor $executor 自定义的进程池或线程池，传入时不再创建进程池，也不会关闭
+    # @ param int $chunkSize 每个任务验证的通知数，通知数不超过该值且未传入executor时直接在当前线程验证
+    # @ return 与payloads顺序一致的列表，每项为(ok, values, error)，
+    # ok为True表示return_code为SUCCESS且签名正确，error为WxPayException
+    @staticmethod
+    def verifyNotifyBatch(payloads, workers=None, executor=None, chunkSize=256):
+        key = WxPayConfig.__KEY__
+        payloads = list(payloads)
+        chunks = [payloads[i:i + chunkSize] for i in range(0, len(payloads), chunkSize)]
+        if executor is None and len(chunks) <= 1:
+            return _verifyNotifyChunk(key, payloads)
+
+        ownExecutor = executor is None
+        if ownExecutor:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            verdicts = []
+            for chunk in executor.map(_verifyNotifyChunk, [key] * len(chunks), chunks):
+                verdicts.extend(chunk)
+            return verdicts
+        finally:
+            if ownExecutor:
+                executor.shutdown()
+
+    # 请求使用的签名类型，返回结果按同样的类型验证签名
+    # @ param $inputObj 请求对象
+    # @ return MD5或HMAC-SHA256
+    @staticmethod
+    def getSignType(inputObj):
+        return inputObj.GetValues().get('sign_type') or WxPaySigner.MD5
 
     # 产生随机字符串，不长于32位
     # @ param int $length
     # @ return 产生的随机字符串
     @staticmethod
     def getNonceStr(length=32):
-        chars = "abcdefghijklmnopqrstuvwxyz0123456789"
-        wx_str = ""
+        return WxPayIdGenerator.getDefault().nonce(length)
+
+    # 产生商户订单号，按时间递增，多线程、多进程之间不重复，详见WxPayIdGenerator
+    # @ param string $prefix 前缀，不超过4位字母或数字
+    # @ return 不长于32位的商户订单号
+    @staticmethod
+    def getOutTradeNo(prefix=""):
+        return WxPayIdGenerator.getDefault().outTradeNo(prefix)
 
-        import random
-        for i in range(length):
-            rand_num = random.randint(0, len(chars) - 1)
-            wx_str += chars[rand_num]
-        return wx_str
+    # 产生商户退款单号，与商户订单号使用同一序列
+    # @ param string $prefix 前缀，不超过4位字母或数字
+    # @ return 不长于32位的商户退款单号
+    @staticmethod
+    def getOutRefundNo(prefix=""):
+        return WxPayIdGenerator.getDefault().outRefundNo(prefix)
 
     # 直接输出xml
     @staticmethod
@@ -381,21 +611,51 @@ class WxPayApi:
         return xml
 
     # 上报数据， 上报的时候将屏蔽所有异常流程
+    # 上报数据放入后台队列后立即返回，由WxPayReporter异步发送，队列满时丢弃
     # @ param string $usrl
     # @ param int $startTimeStamp
     # @ param array $data
     @staticmethod
     def reportCostTime(url, startTimeStamp, data):
+        objInput = WxPayApi.buildCostReport(url, startTimeStamp, data)
+        if objInput is None:
+            return
+        WxPayApi.getReporter().put(objInput)
+
+    # 注入自定义的上报对象，传入None时恢复为按WxPayConfig创建的默认对象
+    # @ param WxPayReporter $reporter
+    @staticmethod
+    def setReporter(reporter):
+        with WxPayApi._transportLock:
+            old = WxPayApi.reporter
+            WxPayApi.reporter = reporter
+        if old is not None and old is not reporter:
+            old.close(0)
+
+    # 获取后台上报对象，可通过getReporter().stats()查看上报计数
+    @staticmethod
+    def getReporter():
+        reporter = WxPayApi.reporter
+        if reporter is None:
+            with WxPayApi._transportLock:
+                if WxPayApi.reporter is None:
+                    WxPayApi.reporter = WxPayReporter(WxPayApi.report)
+                reporter = WxPayApi.reporter
+        return reporter
+
+    # 按上报等级生成上报数据，不需要上报时返回None
+    @staticmethod
+    def buildCostReport(url, startTimeStamp, data):
         # 如果不需要上报数据
         if WxPayConfig.REPORT_LEVENL == 0:
-            return
+            return None
         # 如果仅上失败上报
         if WxPayConfig.REPORT_LEVENL == 1 and \
                         "return_code" in data.keys() and \
                         data["return_code"] == "SUCCESS" and \
                         "result_code" in data.keys() and \
                         data["result_code"] == "SUCCESS":
-            return
+            return None
 
         # 上报逻辑
         endTimeStamp = WxPayApi.getMillisecond()
@@ -424,11 +684,61 @@ class WxPayApi:
         if "device_info" in data.keys():
             objInput.SetDevice_info(data["device_info"])
 
-        try:
-            WxPayApi.report(objInput)
-        except WxPayException as e:
-            # 不做任何处理
-            pass
+        return objInput
+
+    # 设置某个接口的调用策略
+    # @ param string $path 接口url路径，如/pay/orderquery
+    # @ param WxPayEndpointPolicy $policy
+    @staticmethod
+    def setPolicy(path, policy):
+        WxPayApi.policies[path] = policy
+
+    # 获取接口url对应的调用策略
+    @staticmethod
+    def getPolicy(url):
+        return WxPayApi.policies.get(urlsplit(url).path, WxPayApi.defaultPolicy)
+
+    # 注入自定义的传输对象（连接池配置），传入None时恢复为按WxPayConfig创建的默认对象
+    # @ param WxPayTransport $transport
+    @staticmethod
+    def setTransport(transport):
+        with WxPayApi._transportLock:
+            old = WxPayApi.transport
+            WxPayApi.transport = transport
+        if old is not None and old is not transport:
+            old.close()
+
+    # 获取共用的传输对象
+    @staticmethod
+    def getTransport():
+        transport = WxPayApi.transport
+        if transport is None:
+            with WxPayApi._transportLock:
+                if WxPayApi.transport is None:
+                    WxPayApi.transport = WxPayTransport()
+                transport = WxPayApi.transport
+        return transport
+
+    # 注入自定义的证书传输对象，传入None时恢复为按WxPayConfig创建的默认对象
+    # @ param WxPayCertTransport $transport
+    @staticmethod
+    def setCertTransport(transport):
+        with WxPayApi._transportLock:
+            old = WxPayApi.certTransport
+            WxPayApi.certTransport = transport
+        if old is not None and old is not transport:
+            old.close()
+
+    # 获取共用的证书传输对象
+    @staticmethod
+    def getCertTransport():
+        transport = WxPayApi.certTransport
+        if transport is None:
+            with WxPayApi._transportLock:
+                if WxPayApi.certTransport is None:
+                    WxPayApi.certTransport = WxPayCertTransport()
+                transport = WxPayApi.certTransport
+        return transport
 
     # 以post方式提交xml到对应的接口url
     #
@@ -438,40 +748,131 @@ class WxPayApi:
     # @ param int $second url执行超时时间，默认30s
     # @ throws WxPayException
     @staticmethod
-    def postXmlCurl(xml, url, useCert=False, second=30):
-        url = url
-        # 是否严格校验
-        verify = True
-        # 设置超时
-        timeout = second
+    def postXmlCurl(xml, url, useCert=False, second=None):
+        return WxPayApi.postXmlBytes(xml, url, useCert, second).decode('utf-8', 'replace')
+
+    # 以post方式提交xml到对应的接口url，返回响应体的原始字节串。
+    # 接口返回的都是UTF-8，不经过requests的字符集检测（Content-Type为text/plain时会按ISO-8859-1解码，
+    # 没有charset时逐字节猜测编码），直接交给WxPayResults.Init解析，解析时只解码一次
+    # @ throws WxPayException
+    @staticmethod
+    def postXmlBytes(xml, url, useCert=False, second=None):
+        response = WxPayApi.postXmlResponse(xml, url, useCert, second)
+        return response.content
+
+    # 以post方式提交xml到对应的接口url，返回响应对象
+    # @ param bool $stream 为True时不预先读取响应体，由调用方按块读取
+    # @ throws WxPayException
+    @staticmethod
+    def postXmlResponse(xml, url, useCert=False, second=None, stream=False):
         # 如果有配置代理这里就设置代理
-        proxies = {}
+        proxies = None
         if WxPayConfig.CURL_PROXY_HOST != "0.0.0.0" and \
                         WxPayConfig.CURL_PROXY_PORT != 0:
+            proxy = WxPayConfig.CURL_PROXY_HOST + ":" + str(WxPayConfig.CURL_PROXY_PORT)
             proxies = {
-                "http": "http://" + WxPayConfig.CURL_PROXY_HOST + ":" + WxPayConfig.CURL_PROXY_PORT,
-                "https": "https://" + WxPayConfig.CURL_PROXY_HOST + ":" + WxPayConfig.CURL_PROXY_PORT
+                "http": "http://" + proxy,
+                "https": "http://" + proxy
             }
         if useCert:
             # 设置证书
-            # 使用证书：cert与key分别属于两个.pem文件
-            pass
-        # post提交方式
-        response = requests.post(url, data=xml)
-
-        # 返回结果
-        if response.status_code == "200":
-            return response.text
+            # 使用证书：cert与key分别属于两个.pem文件，已加载到证书传输对象的SSLContext中
+            transport = WxPayApi.getCertTransport()
         else:
-            error = response.status_code
-            WxPayException("curl出错，错误码:" + error)
+            transport = WxPayApi.getTransport()
+
+        # 当前接口调用的耗时统计，对冲请求在其他线程中执行时继续计入
+        timer = WxPayMetrics.current()
+        if timer is not None and timer.endpoint is None:
+            timer.endpoint = urlsplit(url).path
+
+        def attempt(timeout):
+            token = None
+            if timer is not None and WxPayMetrics.current() is not timer:
+                token = WxPayMetrics.activate(timer)
+            try:
+                return send(timeout)
+            finally:
+                if token is not None:
+                    WxPayMetrics.deactivate(token)
+
+        def send(timeout):
+            # 按域名熔断状态选择主域名或备用域名
+            hostUrl, host = WxPayApi.selector.select(url)
+            start = time.monotonic()
+            connect = timer.get('connect') if timer is not None else 0
+            # post提交方式，复用共用传输对象中的长连接
+            try:
+                response = transport.post(hostUrl, xml, timeout, proxies, stream)
+            except WxPayNetworkException:
+                WxPayApi.selector.record(host, False)
+                raise
+            finally:
+                # 等待响应的耗时，扣除本次新建连接的耗时（对冲请求并行建连时为近似值）
+                if timer is not None:
+                    timer.add('wait', max(0, time.monotonic() - start - (timer.get('connect') - connect)))
+            # 返回结果
+            if response.status_code == 200:
+                WxPayApi.selector.record(host, True, time.monotonic() - start)
+                return response
+            else:
+                WxPayApi.selector.record(host, False)
+                error = response.status_code
+                response.close()
+                raise WxPayNetworkException("curl出错，错误码:" + str(error))
+
+        # 按接口策略设置超时、重试与对冲请求
+        return WxPayApi.getPolicy(url).execute(attempt, second)
+
+    # 获取接口耗时统计对象
+    @staticmethod
+    def getMetrics():
+        return WxPayApi.metrics
+
+    # 注入自定义的下单结果缓存，传入None时恢复为按WxPayConfig创建的默认对象
+    # @ param WxPayPrepayCache $cache
+    @staticmethod
+    def setPrepayCache(cache):
+        WxPayApi.prepayCache = cache
+
+    # 获取下单结果缓存，WxPayConfig.PREPAY_CACHE_SIZE为0且没有注入时返回None（不缓存）
+    @staticmethod
+    def getPrepayCache():
+        cache = WxPayApi.prepayCache
+        if cache is None and WxPayConfig.PREPAY_CACHE_SIZE > 0:
+            with WxPayApi._transportLock:
+                if WxPayApi.prepayCache is None:
+                    WxPayApi.prepayCache = WxPayPrepayCache()
+                cache = WxPayApi.prepayCache
+        return cache
+
+    # 删除订单缓存的下单结果，订单关闭或已支付后不再返回原来的prepay_id
+    # @ param string $outTradeNo 商户订单号
+    @staticmethod
+    def invalidatePrepay(outTradeNo):
+        cache = WxPayApi.prepayCache
+        if cache is not None and outTradeNo:
+            cache.invalidate(outTradeNo)
 
-    # 获取毫秒级别的时间戳
+    # 获取毫秒级别的时间戳，使用单调时钟，只用于计算耗时
     @staticmethod
     def getMillisecond():
-        # 获取毫秒的时间戳
-        import time
-        now_timestmap = time.time()
-        time_tuple = str(now_timestmap).split('.')
-        new_time = time_tuple[0] + time_tuple[1][0:3]
-        return new_time
+        return time.monotonic_ns() // 1000000
+
+
+# 验证一组支付通知，在WxPayApi.verifyNotifyBatch的进程池中执行，密钥由调用方传入
+def _verifyNotifyChunk(key, payloads):
+    signer = WxPaySigner(key)
+    verdicts = []
+    for xml in payloads:
+        obj = WxPayResults()
+        try:
+            obj.FromXml(xml)
+            if obj.values.get('return_code') != 'SUCCESS':
+                raise WxPayException("通知的return_code不是SUCCESS！")
+            obj.CheckSign(signer=signer)
+        except WxPayException as e:
+            verdicts.append((False, obj.GetValues(), e))
+        else:
+            verdicts.append((True, obj.GetValues(), None))
+    return verdicts
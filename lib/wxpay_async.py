@@ -0,0 +1,195 @@
+#
+# 异步接口访问类
+#
+from .wxpay_config import WxPayConfig
+from .wxpay_exception import WxPayException, WxPayNetworkException
+from .wxpay_data import WxPayResults
+from .wxpay_api import WxPayApi
+from .wxpay_metrics import WxPayMetrics
+
+import asyncio, ssl, time
+from urllib.parse import urlsplit
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+# 基于asyncio的接口访问类，接口与WxPayApi一致，方法均为协程，
+# 请求对象与返回结果使用wxpay_data中相同的数据类。
+# 同一时刻在途的请求数由信号量限制，所有请求共用一个aiohttp连接池
+# @ param int concurrency 最大并发请求数
+# @ param aiohttp.ClientSession session 自定义的会话对象，不传时按WxPayConfig创建
+#
+# 使用方法:
+#   async with AsyncWxPayApi() as api:
+#       result = await api.orderQuery(inputObj)
+class AsyncWxPayApi:
+    def __init__(self, concurrency=None, session=None):
+        if aiohttp is None:
+            raise WxPayException("AsyncWxPayApi需要安装aiohttp！")
+        if concurrency is None:
+            concurrency = WxPayConfig.ASYNC_CONCURRENCY
+        self.concurrency = concurrency
+        self.session = session
+        self._ownSession = session is None
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, excType, excValue, traceback):
+        await self.close()
+
+    # 关闭连接池
+    async def close(self):
+        if self._ownSession and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    # 获取共用的会话对象
+    def getSession(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency,
+                                             limit_per_host=WxPayConfig.POOL_MAXSIZE,
+                                             keepalive_timeout=WxPayConfig.KEEPALIVE_IDLE or None,
+                                             ssl=ssl.create_default_context())
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 headers={'Content-Type': 'text/xml'},
+                                                 trace_configs=[AsyncWxPayApi._traceConfig()])
+        return self.session
+
+    # 统一下单，参数与返回值同WxPayApi.unifiedOrder
+    async def unifiedOrder(self, inputObj, timeOut=None):
+        # 与WxPayApi共用下单结果缓存
+        cache = WxPayApi.getPrepayCache()
+        if cache is not None:
+            result = cache.get(inputObj)
+            if result is not None:
+                return result
+        result = await self._call(WxPayApi.buildUnifiedOrder, inputObj, False, timeOut)
+        if cache is not None:
+            cache.put(inputObj, result)
+        return result
+
+    # 查询订单，参数与返回值同WxPayApi.orderQuery
+    async def orderQuery(self, inputObj, timeOut=None):
+        return await self._call(WxPayApi.buildOrderQuery, inputObj, False, timeOut)
+
+    # 关闭订单，参数与返回值同WxPayApi.closeOrder
+    async def closeOrder(self, inputObj, timeOut=None):
+        WxPayApi.invalidatePrepay(inputObj.values.get('out_trade_no'))
+        return await self._call(WxPayApi.buildCloseOrder, inputObj, False, timeOut)
+
+    # 申请退款，参数与返回值同WxPayApi.refund
+    async def refund(self, inputObj, timeOut=None):
+        return await self._call(WxPayApi.buildRefund, inputObj, True, timeOut)
+
+    # 查询退款，参数与返回值同WxPayApi.refundQuery
+    async def refundQuery(self, inputObj, timeOut=None):
+        return await self._call(WxPayApi.buildRefundQuery, inputObj, False, timeOut)
+
+    # 下载对账单，参数与返回值同WxPayApi.downloadBill
+    async def downloadBill(self, inputObj, timeOut=None):
+        url, xml = WxPayApi.buildDownloadBill(inputObj)
+        response = await self.postXmlBytes(xml, url, False, timeOut)
+        if response[0:5] == b"<xml>":
+            return ""
+        return response.decode('utf-8', 'replace')
+
+    # 提交被扫支付，参数与返回值同WxPayApi.micropay
+    async def micropay(self, inputObj, timeOut=None):
+        return await self._call(WxPayApi.buildMicropay, inputObj, False, timeOut)
+
+    # 撤销订单，参数与返回值同WxPayApi.reverse
+    async def reverse(self, inputObj, timeOut=None):
+        return await self._call(WxPayApi.buildReverse, inputObj, True, timeOut)
+
+    # 转换短链接，参数与返回值同WxPayApi.shorturl
+    async def shorturl(self, inputObj, timeOut=None):
+        return await self._call(WxPayApi.buildShorturl, inputObj, False, timeOut)
+
+    # 测速上报，参数与返回值同WxPayApi.report
+    async def report(self, inputObj, timeOut=None):
+        url, xml = WxPayApi.buildReport(inputObj)
+        return await self.postXml(xml, url, False, timeOut)
+
+    # 以post方式提交xml到对应的接口url
+    # @ param string $xml  需要post的xml数据
+    # @ param string $url url
+    # @ param bool $useCert 是否需要证书，默认不需要
+    # @ param int $second url执行超时时间，默认30s
+    # @ throws WxPayException
+    async def postXml(self, xml, url, useCert=False, second=None):
+        response = await self.postXmlBytes(xml, url, useCert, second)
+        return response.decode('utf-8', 'replace')
+
+    # 以post方式提交xml到对应的接口url，返回响应体的原始字节串，同WxPayApi.postXmlBytes
+    # @ throws WxPayException
+    async def postXmlBytes(self, xml, url, useCert=False, second=None):
+        # 如果有配置代理这里就设置代理
+        proxy = None
+        if WxPayConfig.CURL_PROXY_HOST != "0.0.0.0" and \
+                        WxPayConfig.CURL_PROXY_PORT != 0:
+            proxy = "http://" + WxPayConfig.CURL_PROXY_HOST + ":" + str(WxPayConfig.CURL_PROXY_PORT)
+        # 超时时间按WxPayApi.policies中的接口策略设置
+        connectTimeout, readTimeout = WxPayApi.getPolicy(url).getTimeout(second)
+        timeout = aiohttp.ClientTimeout(sock_connect=connectTimeout, sock_read=readTimeout)
+        # 使用证书时与WxPayApi共用已加载证书的SSLContext，aiohttp按SSLContext区分连接池
+        sslContext = True
+        if useCert:
+            sslContext = WxPayApi.getCertTransport().getSslContext()
+
+        async with self._semaphore:
+            # 与WxPayApi共用域名熔断状态
+            hostUrl, host = WxPayApi.selector.select(url)
+            start = time.monotonic()
+            timer = WxPayMetrics.current()
+            if timer is not None:
+                if timer.endpoint is None:
+                    timer.endpoint = urlsplit(url).path
+                connect = timer.get('connect')
+            try:
+                async with self.getSession().post(hostUrl, data=xml, proxy=proxy, timeout=timeout,
+                                                  ssl=sslContext) as response:
+                    if response.status != 200:
+                        WxPayApi.selector.record(host, False)
+                        raise WxPayNetworkException("curl出错，错误码:" + str(response.status))
+                    body = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                WxPayApi.selector.record(host, False)
+                raise WxPayNetworkException("curl出错，错误信息:" + str(e))
+            finally:
+                # 等待响应的耗时，扣除新建连接的耗时
+                if timer is not None:
+                    timer.add('wait', max(0, time.monotonic() - start - (timer.get('connect') - connect)))
+            WxPayApi.selector.record(host, True, time.monotonic() - start)
+            return body
+
+    # 生成请求、发送请求、解析结果并上报耗时，上报由后台线程发送，各阶段耗时计入WxPayApi.metrics
+    async def _call(self, build, inputObj, useCert, timeOut):
+        with WxPayApi.metrics.timer() as timer:
+            url, xml = build(inputObj)
+            startTimeStamp = WxPayApi.getMillisecond()  # 请求开始时间
+            response = await self.postXmlBytes(xml, url, useCert, timeOut)
+            result = WxPayResults.Init(response, WxPayApi.getSignType(inputObj))
+            timer.setResult(result)
+        WxPayApi.reportCostTime(url, startTimeStamp, result)  # 上报请求花费时间
+        return result
+
+    # 新建连接（含TLS握手）的耗时计入当前接口调用的connect阶段
+    @staticmethod
+    def _traceConfig():
+        async def onStart(session, context, params):
+            context.connectStart = time.perf_counter()
+
+        async def onEnd(session, context, params):
+            timer = WxPayMetrics.current()
+            if timer is not None:
+                timer.add('connect', time.perf_counter() - context.connectStart)
+
+        traceConfig = aiohttp.TraceConfig()
+        traceConfig.on_connection_create_start.append(onStart)
+        traceConfig.on_connection_create_end.append(onEnd)
+        return traceConfig
@@ -0,0 +1,392 @@
+#
+# 对账单读取类
+#
+from .wxpay_exception import WxPayException
+
+import array, calendar, itertools, json, mmap, os, struct, sys, zlib
+
+
+# 流式读取对账单，对账单内容按块读取，不在内存中保留整份对账单。
+# 创建时读取第一块数据，以<xml>开头说明接口返回的是错误信息，直接抛出异常；
+# 以gzip头开头（tar_type为GZIP）时边读边解压
+# @ param iterable chunks 对账单响应体的字节块
+# @ param function close 读取结束后调用，用于释放连接
+#
+# 使用方法:
+#   reader = WxPayApi.downloadBillStream(inputObj)
+#   for row in reader.rows():
+#       ...
+#   reader.summary
+class WxPayBillReader:
+    GZIP_MAGIC = b'\x1f\x8b'
+
+    def __init__(self, chunks, close=None):
+        self._chunks = iter(chunks)
+        self._close = close
+        # 对账单表头，读取第一行后设置
+        self.header = None
+        # 汇总数据的表头与数据，读取完所有行后设置
+        self.summaryHeader = None
+        self.summary = None
+
+        first = b''
+        for chunk in self._chunks:
+            first += chunk
+            if len(first) >= 5:
+                break
+        if first[0:5] == b'<xml>':
+            # 错误信息很短，读完剩余部分后解析return_msg
+            for chunk in self._chunks:
+                first += chunk
+            self.close()
+            raise WxPayException("下载对账单出错:" + WxPayBillReader._errorMessage(first))
+        self._first = first
+        self.gzip = first[0:2] == WxPayBillReader.GZIP_MAGIC
+
+    # 按块返回对账单内容（已解压）
+    def iterBytes(self):
+        try:
+            if self.gzip:
+                chunks = self._gunzip()
+            else:
+                chunks = itertools.chain((self._first,), self._chunks)
+            for data in chunks:
+                if data:
+                    yield data
+        finally:
+            self.close()
+
+    # 把对账单内容写入文件，返回写入的字节数
+    # @ param string path 文件路径
+    def writeTo(self, path):
+        size = 0
+        with open(path, 'wb') as f:
+            for data in self.iterBytes():
+                f.write(data)
+                size += len(data)
+        return size
+
+    # 按行返回对账单文本，不含行尾换行符
+    def lines(self):
+        buff = b''
+        for data in self.iterBytes():
+            buff += data
+            parts = buff.split(b'\n')
+            buff = parts.pop()
+            for line in parts:
+                yield WxPayBillReader._decode(line)
+        if buff:
+            yield WxPayBillReader._decode(buff)
+
+    # 按行返回对账单数据，每行为字段列表，字段已去掉前缀的`符号。
+    # 第一行表头保存到header，末尾的汇总表头与汇总数据保存到summaryHeader、summary
+    def rows(self):
+        for line in self.lines():
+            if not line:
+                continue
+            if line[0] != '`':
+                if self.header is None:
+                    self.header = line.split(',')
+                else:
+                    self.summaryHeader = line.split(',')
+                continue
+            fields = line[1:].split(',`')
+            if self.summaryHeader is not None:
+                self.summary = fields
+                continue
+            yield fields
+
+    # 释放连接
+    def close(self):
+        if self._close is not None:
+            close, self._close = self._close, None
+            close()
+
+    def _gunzip(self):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in itertools.chain((self._first,), self._chunks):
+            while chunk:
+                data = decompressor.decompress(chunk)
+                if data:
+                    yield data
+                if not decompressor.eof:
+                    break
+                # 多段gzip时使用新的解压对象继续解压剩余数据
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = decompressor.flush()
+        if data:
+            yield data
+
+    @staticmethod
+    def _decode(line):
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        if line.startswith(b'\xef\xbb\xbf'):
+            line = line[3:]
+        return line.decode('utf-8')
+
+    @staticmethod
+    def _errorMessage(xml):
+        text = xml.decode('utf-8', 'replace')
+        start = text.find('<return_msg>')
+        end = text.find('</return_msg>')
+        if start < 0 or end < 0:
+            return text
+        msg = text[start + len('<return_msg>'):end]
+        if msg.startswith('<![CDATA[') and msg.endswith(']]>'):
+            msg = msg[9:-3]
+        return msg
+
+
+# 按列存储的对账单，由WxPayBillReader读取的ALL/SUCCESS/REFUND对账单解析而来。
+# 金额以分为单位存入整数数组，交易时间存为秒级时间戳（按账单中的北京时间计，不做时区换算），
+# 交易类型、交易状态存为字典编码，订单号拼接存储并记录偏移。
+# 合计直接对数组求和，分组统计按字典编码逐行累加，可保存为文件后通过mmap加载，无需重新解析文本。
+# 字段数少于表头的残缺行不计入，行号记录在skipped中
+#
+# 使用方法:
+#   bill = WxPayBill.fromReader(WxPayApi.downloadBillStream(inputObj))
+#   bill.totals()
+#   bill.groupBy('trade_type')
+#   bill.save('20150806.bill')
+#   bill = WxPayBill.load('20150806.bill')
+class WxPayBill:
+    MAGIC = b'WXBILL01'
+
+    # 对账单表头到列名的对应关系，同一列在不同账单中名称不同时按顺序取第一个存在的
+    COLUMNS = (
+        ('time', ('交易时间',)),
+        ('trade_type', ('交易类型',)),
+        ('trade_state', ('交易状态',)),
+        ('total_fee', ('总金额', '订单金额', '应结订单金额')),
+        ('refund_fee', ('退款金额', '申请退款金额')),
+        ('poundage', ('手续费',)),
+        ('transaction_id', ('微信订单号',)),
+        ('out_trade_no', ('商户订单号',)),
+    )
+    # 数值列及其数组类型
+    NUMERIC = (('time', 'q'), ('hour', 'B'), ('total_fee', 'q'), ('refund_fee', 'q'),
+               ('poundage', 'q'), ('trade_type', 'H'), ('trade_state', 'H'))
+    # 字典编码列
+    CATEGORY = ('trade_type', 'trade_state')
+    # 字符串列，拼接存储
+    STRING = ('transaction_id', 'out_trade_no')
+
+    def __init__(self, columns, categories, strings, mapped=None, skipped=None):
+        # 数值列：列名 -> array或memoryview
+        self.columns = columns
+        # 字典编码列的取值表：列名 -> 字符串列表
+        self.categories = categories
+        # 字符串列：列名 -> (拼接后的bytes, 偏移数组)
+        self.strings = strings
+        # 跳过的残缺行的行号（数据行从1开始计）
+        self.skipped = skipped or []
+        self._mapped = mapped
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    # 从WxPayBillReader解析对账单
+    @staticmethod
+    def fromReader(reader):
+        rows = reader.rows()
+        # 表头在读取第一行数据时才能确定
+        first = next(rows, None)
+        if first is None:
+            return WxPayBill.parse(reader.header or [], ())
+        return WxPayBill.parse(reader.header, itertools.chain((first,), rows))
+
+    # 从对账单文本文件解析，指定cachePath时优先加载比文本新的缓存文件，否则解析后写入缓存
+    # @ param string path 对账单文本（或gzip压缩）文件路径
+    # @ param string cachePath 缓存文件路径
+    @staticmethod
+    def fromFile(path, cachePath=None):
+        if cachePath is not None:
+            try:
+                if os.stat(cachePath).st_mtime_ns >= os.stat(path).st_mtime_ns:
+                    return WxPayBill.load(cachePath)
+            except (OSError, WxPayException):
+                pass
+        with open(path, 'rb') as f:
+            bill = WxPayBill.fromReader(WxPayBillReader(iter(lambda: f.read(65536), b'')))
+        if cachePath is not None:
+            bill.save(cachePath)
+        return bill
+
+    # 按表头解析对账单数据行
+    # @ param list header 对账单表头
+    # @ param iterable rows 数据行，每行为字段列表
+    @staticmethod
+    def parse(header, rows):
+        index = {}
+        for name, titles in WxPayBill.COLUMNS:
+            for title in titles:
+                if title in header:
+                    index[name] = header.index(title)
+                    break
+        if 'time' not in index and header:
+            raise WxPayException("对账单中缺少交易时间列！")
+
+        columns = dict((name, array.array(code)) for name, code in WxPayBill.NUMERIC)
+        categories = dict((name, []) for name in WxPayBill.CATEGORY)
+        codes = dict((name, {}) for name in WxPayBill.CATEGORY)
+        strings = dict((name, (bytearray(), array.array('q', [0]))) for name in WxPayBill.STRING)
+        dayCache = {}
+        width = len(header)
+        skipped = []
+
+        for number, fields in enumerate(rows, 1):
+            # 字段数少于表头的行（如下载中断造成的残缺行）不计入，记录行号
+            if len(fields) < width:
+                skipped.append(number)
+                continue
+            ts = WxPayBill._timestamp(fields[index['time']], dayCache)
+            columns['time'].append(ts)
+            columns['hour'].append(ts // 3600 % 24)
+            for name in ('total_fee', 'refund_fee', 'poundage'):
+                i = index.get(name)
+                columns[name].append(WxPayBill._fen(fields[i]) if i is not None else 0)
+            for name in WxPayBill.CATEGORY:
+                i = index.get(name)
+                value = fields[i] if i is not None else ''
+                code = codes[name].get(value)
+                if code is None:
+                    code = codes[name][value] = len(categories[name])
+                    categories[name].append(sys.intern(value))
+                columns[name].append(code)
+            for name in WxPayBill.STRING:
+                i = index.get(name)
+                buff, offsets = strings[name]
+                if i is not None:
+                    buff += fields[i].encode('utf-8')
+                offsets.append(len(buff))
+
+        strings = dict((name, (bytes(buff), offsets)) for name, (buff, offsets) in strings.items())
+        return WxPayBill(columns, categories, strings, skipped=skipped)
+
+    # 合计：交易笔数、总金额、退款金额、手续费（分）
+    def totals(self):
+        return {
+            'count': len(self),
+            'total_fee': sum(self.columns['total_fee']),
+            'refund_fee': sum(self.columns['refund_fee']),
+            'poundage': sum(self.columns['poundage']),
+        }
+
+    # 分组合计，返回 分组值 -> (笔数, 金额合计)。
+    # 在Python中逐行遍历一次分组列与金额列，耗时与行数成正比（百万行约0.2秒）；
+    # 标准库没有按分组求和的数组运算，按组筛选后求和（Counter、compress）需要每组遍历一次，实测更慢
+    # @ param string key 分组列，trade_type、trade_state或hour
+    # @ param string column 合计的金额列，total_fee、refund_fee或poundage
+    def groupBy(self, key='trade_type', column='total_fee'):
+        keys = self.columns[key]
+        values = self.columns[column]
+        if key in self.categories:
+            labels = self.categories[key]
+        else:
+            labels = range(24)
+        # 分组值为连续的小整数，直接作为下标累加各组的笔数与金额
+        counts = [0] * len(labels)
+        sums = [0] * len(labels)
+        for code, value in zip(keys, values):
+            counts[code] += 1
+            sums[code] += value
+        return dict((label, (counts[code], sums[code])) for code, label in enumerate(labels) if counts[code])
+
+    # 获取第i行的某个字段，数值列返回整数，字典编码列与字符串列返回字符串
+    def get(self, i, name):
+        if name in self.strings:
+            buff, offsets = self.strings[name]
+            return bytes(buff[offsets[i]:offsets[i + 1]]).decode('utf-8')
+        value = self.columns[name][i]
+        if name in self.categories:
+            return self.categories[name][value]
+        return value
+
+    # 保存为缓存文件：文件头、JSON描述，之后依次为8字节对齐的各列原始数据
+    def save(self, path):
+        blocks = []
+        for name, code in WxPayBill.NUMERIC:
+            blocks.append((name, code, self.columns[name].tobytes()))
+        for name in WxPayBill.STRING:
+            buff, offsets = self.strings[name]
+            blocks.append((name + '.offsets', 'q', offsets.tobytes()))
+            blocks.append((name, 'B', bytes(buff)))
+
+        meta = {'rows': len(self), 'categories': self.categories, 'skipped': self.skipped, 'blocks': []}
+        offset = 0
+        for name, code, data in blocks:
+            meta['blocks'].append([name, code, offset, len(data)])
+            offset += WxPayBill._align(len(data))
+        metaBytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+
+        tmpPath = path + '.tmp'
+        with open(tmpPath, 'wb') as f:
+            f.write(WxPayBill.MAGIC)
+            f.write(struct.pack('<Q', len(metaBytes)))
+            f.write(metaBytes)
+            f.write(b'\0' * (WxPayBill._align(f.tell()) - f.tell()))
+            for name, code, data in blocks:
+                f.write(data)
+                f.write(b'\0' * (WxPayBill._align(len(data)) - len(data)))
+        os.replace(tmpPath, path)
+
+    # 通过mmap加载缓存文件，各列直接映射为memoryview，不复制数据
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < 16:
+                raise WxPayException("对账单缓存文件异常！")
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        if view[0:8] != WxPayBill.MAGIC:
+            raise WxPayException("对账单缓存文件异常！")
+        metaSize = struct.unpack('<Q', view[8:16])[0]
+        meta = json.loads(bytes(view[16:16 + metaSize]).decode('utf-8'))
+        base = WxPayBill._align(16 + metaSize)
+
+        blocks = {}
+        for name, code, offset, length in meta['blocks']:
+            data = view[base + offset:base + offset + length]
+            blocks[name] = data.cast(code)
+
+        columns = dict((name, blocks[name]) for name, code in WxPayBill.NUMERIC)
+        strings = dict((name, (blocks[name], blocks[name + '.offsets'])) for name in WxPayBill.STRING)
+        return WxPayBill(columns, meta['categories'], strings, (mapped, view, blocks), meta.get('skipped'))
+
+    # 释放mmap映射
+    def close(self):
+        if self._mapped is not None:
+            mapped, view, blocks = self._mapped
+            self._mapped = self.columns = self.strings = None
+            for data in blocks.values():
+                data.release()
+            view.release()
+            mapped.close()
+
+    # 金额字符串转为分
+    @staticmethod
+    def _fen(value):
+        if not value:
+            return 0
+        negative = value[0] == '-'
+        if negative:
+            value = value[1:]
+        yuan, dot, cent = value.partition('.')
+        fen = int(yuan or '0') * 100 + int((cent + '00')[0:2])
+        return -fen if negative else fen
+
+    # 交易时间（yyyy-MM-dd HH:mm:ss）转为秒级时间戳，同一天的日期部分只计算一次
+    @staticmethod
+    def _timestamp(value, dayCache):
+        day = value[0:10]
+        base = dayCache.get(day)
+        if base is None:
+            base = dayCache[day] = calendar.timegm((int(day[0:4]), int(day[5:7]), int(day[8:10]), 0, 0, 0))
+        return base + int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19])
+
+    @staticmethod
+    def _align(size):
+        return (size + 7) & ~7
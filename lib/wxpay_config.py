@@ -31,6 +31,9 @@ class WxPayConfig:
     SSLCERT_PATH = '../cert/apiclient_cert.pem'
     SSLKEY_PATH = '../cert/apiclient_key.pem'
 
+    # 证书只加载一次，每隔SSLCERT_CHECK_INTERVAL秒检查一次证书文件，有变化时自动重新加载
+    SSLCERT_CHECK_INTERVAL = 5
+
     # = == == == 【curl代理设置】 == == == == == == == == == == == == == == == == == =
     #
     # TODO：这里设置代理机器，只有需要代理的时候才设置，不需要代理，请设置为0.0.0.0和0
@@ -48,3 +51,95 @@ class WxPayConfig:
     # 上报等级，0.关闭上报; 1.仅错误出错上报; 2.全量上报
 
     REPORT_LEVENL = 1
+
+    # 上报数据放入后台队列异步发送，不占用接口调用时间。
+    # REPORT_QUEUE_SIZE：上报队列最大长度，队列满时丢弃新的上报
+    # REPORT_BATCH_SIZE：后台线程每批取出的上报条数，积压较多时同类上报合并为一条
+    REPORT_QUEUE_SIZE = 1000
+    REPORT_BATCH_SIZE = 50
+
+    # = == == == 【接口域名设置】 == == == == == == == == == == == == == == == == == == =
+    #
+    # 第一个为主域名，其余为备用域名。主域名连续出错或错误率过高时熔断并切换到备用域名，
+    # 熔断一段时间后再探测主域名是否恢复，详见WxPayEndpointSelector
+
+    API_HOSTS = ['api.mch.weixin.qq.com', 'api2.mch.weixin.qq.com']
+
+    # = == == == 【连接池设置】 == == == == == == == == == == == == == == == == == == =
+    #
+    # TODO：所有接口共用一个长连接传输对象（WxPayTransport），按主机维护keep-alive连接池，
+    # 避免每次请求都重新建立TCP连接和TLS握手。如需自定义，可调用WxPayApi.setTransport注入。
+    # POOL_CONNECTIONS：缓存的主机连接池个数
+    # POOL_MAXSIZE：每个主机连接池保留的最大连接数，建议不小于并发调用数
+    # POOL_BLOCK：连接数达到上限时是否等待空闲连接（False时临时新建连接）
+    # KEEPALIVE_IDLE：连接空闲超过该秒数后主动关闭，0表示不主动关闭
+    # ASYNC_CONCURRENCY：异步接口类（AsyncWxPayApi）同时在途的最大请求数
+    # BATCH_CONCURRENCY：批量查询订单（WxPayApi.orderQueryBatch）的默认并发数
+
+    POOL_CONNECTIONS = 4
+    POOL_MAXSIZE = 32
+    POOL_BLOCK = False
+    KEEPALIVE_IDLE = 60
+    ASYNC_CONCURRENCY = 256
+    BATCH_CONCURRENCY = 16
+
+    # = == == == 【xml解析设置】 == == == == == == == == == == == == == == == == == == =
+    #
+    # 接口返回结果和支付通知都是单层xml，解析时只接受<xml>下一层的参数，不允许DTD和实体。
+    # XML_MAX_SIZE：xml最大字节数，超过时直接拒绝
+    # XML_MAX_FIELDS：xml最多包含的参数个数
+
+    XML_MAX_SIZE = 1024 * 1024
+    XML_MAX_FIELDS = 1024
+
+    # = == == == 【单号生成设置】 == == == == == == == == == == == == == == == == == == =
+    #
+    # WxPayApi.getOutTradeNo/getOutRefundNo生成的单号中包含8位节点号。
+    # ID_NODE为None时每个进程随机生成节点号；设置为每台机器不同的3位字母或数字时，
+    # 节点号为ID_NODE + 进程号，可以严格保证多台机器、多个进程生成的单号不重复
+
+    ID_NODE = None
+
+    # = == == == 【下单结果缓存设置】 == == == == == == == == == == == == == == == == == =
+    #
+    # 同一订单参数不变时重复调用统一下单，直接返回缓存的prepay_id（code_url），见WxPayPrepayCache。
+    # PREPAY_CACHE_SIZE：最多缓存的订单数，为0时不缓存
+    # PREPAY_CACHE_TTL：下单结果缓存秒数，prepay_id有效期为2小时，提前10分钟过期给用户留出支付时间
+
+    PREPAY_CACHE_SIZE = 10000
+    PREPAY_CACHE_TTL = 2 * 3600 - 600
+
+    # = == == == 【支付通知设置】 == == == == == == == == == == == == == == == == == == =
+    #
+    # 支付通知应用（WxPayNotifyApp、AsyncWxPayNotifyApp）验证签名后把业务处理交给有界线程池。
+    # NOTIFY_WORKERS：业务处理线程数
+    # NOTIFY_MAX_PENDING：在途（排队及执行中）的业务处理数上限，超过时应答FAIL，由微信稍后重新通知
+    # NOTIFY_WAIT_HANDLER：为True时等待业务处理结果再应答；为False时验证通过后立即应答SUCCESS，
+    # 微信不会再重新通知，只能在配置了持久化通知队列（WxPayNotifyQueue）时使用
+    # NOTIFY_HANDLER_TIMEOUT：等待业务处理的秒数，超时应答FAIL
+    # NOTIFY_DEDUP_SIZE：通知去重缓存（WxPayNotifyDedup）本地最多记录的通知数
+    # NOTIFY_DEDUP_TTL：处理成功的通知记录保存秒数，微信重复通知的时间跨度约为24小时
+    # NOTIFY_DEDUP_PENDING_TTL：处理中的通知记录保存秒数，进程异常退出时超时后允许重新处理
+    # NOTIFY_QUEUE_WORKERS：持久化通知队列（WxPayNotifyQueue）的后台处理线程数
+    # NOTIFY_QUEUE_MAX_ATTEMPTS：队列中每条通知最多处理次数，超过后标记为失败保留在库中
+    # NOTIFY_QUEUE_RETRY_DELAY、NOTIFY_QUEUE_RETRY_MAX_DELAY：处理失败后第一次重试的等待秒数及最长等待秒数
+    # NOTIFY_QUEUE_LEASE：处理中通知的租约秒数，进程异常退出后租约到期重新处理
+    # NOTIFY_PROCESSES：多进程运行（WxPayNotifyRunner）时的工作进程数，为None时等于CPU核数
+    # NOTIFY_GRACE_TIMEOUT：停止时等待工作进程处理完在途请求的秒数，超时后强制结束
+    # NOTIFY_METRICS_INTERVAL：工作进程把统计写入共享状态目录的间隔秒数，工作进程异常退出时丢失最后一个间隔内的统计
+
+    NOTIFY_WORKERS = 16
+    NOTIFY_MAX_PENDING = 1000
+    NOTIFY_WAIT_HANDLER = True
+    NOTIFY_HANDLER_TIMEOUT = 3
+    NOTIFY_DEDUP_SIZE = 100000
+    NOTIFY_DEDUP_TTL = 25 * 3600
+    NOTIFY_DEDUP_PENDING_TTL = 300
+    NOTIFY_QUEUE_WORKERS = 4
+    NOTIFY_QUEUE_MAX_ATTEMPTS = 10
+    NOTIFY_QUEUE_RETRY_DELAY = 5
+    NOTIFY_QUEUE_RETRY_MAX_DELAY = 600
+    NOTIFY_QUEUE_LEASE = 300
+    NOTIFY_PROCESSES = None
+    NOTIFY_GRACE_TIMEOUT = 30
+    NOTIFY_METRICS_INTERVAL = 5
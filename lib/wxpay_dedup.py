@@ -0,0 +1,279 @@
+#
+# 支付通知去重类
+#
+from .wxpay_config import WxPayConfig
+from .wxpay_exception import WxPayException
+
+import abc, collections, os, sqlite3, threading, time
+
+
+# 支付通知去重缓存。微信在收到SUCCESS应答前会重复发送同一笔交易的通知，
+# 处理成功的通知按transaction_id（没有时按out_trade_no）记录在内存LRU中，保存ttl秒，
+# 重复的通知不再验证签名、不再调用业务处理，直接应答SUCCESS。
+# 业务处理开始前先占用（claim），处理中收到的重复通知应答FAIL，由微信稍后重新通知；
+# 处理失败时释放（release），重新通知时再次处理。
+# 多进程部署时传入backend，各进程通过共享存储判断是否已处理，本地LRU作为一级缓存；
+# 共享存储不可用时isDone按未处理返回，claim、done、release抛出WxPayException
+# @ param int maxSize 本地最多记录的通知数，超过时淘汰最久未访问的记录
+# @ param int ttl 处理成功的记录保存秒数
+# @ param int pendingTtl 处理中的记录保存秒数，进程异常退出时超时后允许重新处理
+# @ param WxPayDedupBackend backend 共享存储
+class WxPayNotifyDedup:
+    PENDING = 'PENDING'
+    DONE = 'DONE'
+
+    def __init__(self, maxSize=None, ttl=None, pendingTtl=None, backend=None):
+        if maxSize is None:
+            maxSize = WxPayConfig.NOTIFY_DEDUP_SIZE
+        if ttl is None:
+            ttl = WxPayConfig.NOTIFY_DEDUP_TTL
+        if pendingTtl is None:
+            pendingTtl = WxPayConfig.NOTIFY_DEDUP_PENDING_TTL
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.pendingTtl = pendingTtl
+        self.backend = backend
+        # key -> (状态, 过期时间)，按访问顺序排列
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+        self.errors = 0
+        self.lastError = None
+
+    # 通知的去重键，没有transaction_id和out_trade_no时返回None（不去重）
+    # @ param dict values 通知参数
+    @staticmethod
+    def key(values):
+        transactionId = values.get('transaction_id')
+        if transactionId:
+            return 't:' + transactionId
+        outTradeNo = values.get('out_trade_no')
+        if outTradeNo:
+            return 'o:' + outTradeNo
+        return None
+
+    # 判断通知是否已经处理成功
+    def isDone(self, key):
+        if key is None:
+            return False
+        state = self._get(key)
+        if state is None and self.backend is not None:
+            try:
+                state = self._call(self.backend.get, key)
+            except WxPayException:
+                # 继续验证签名并在claim时再次访问共享存储
+                state = None
+            if state == WxPayNotifyDedup.DONE:
+                self._put(key, state, self.ttl)
+        with self._lock:
+            if state == WxPayNotifyDedup.DONE:
+                self.hits += 1
+                return True
+            self.misses += 1
+        return False
+
+    # 占用通知开始处理，已处理成功或正在处理时返回False
+    # @ throws WxPayException 共享存储不可用
+    def claim(self, key):
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.conflicts += 1
+                return False
+            self._entries[key] = (WxPayNotifyDedup.PENDING, now + self.pendingTtl)
+            self._entries.move_to_end(key)
+            self._evict()
+        if self.backend is None:
+            return True
+        try:
+            claimed = self._call(self.backend.add, key, WxPayNotifyDedup.PENDING, self.pendingTtl)
+        except WxPayException:
+            # 共享存储中没有占用成功，本地也不保留，重新通知时再次尝试
+            with self._lock:
+                self._entries.pop(key, None)
+            raise
+        if not claimed:
+            with self._lock:
+                self._entries.pop(key, None)
+                self.conflicts += 1
+            return False
+        return True
+
+    # 记录通知处理成功
+    # @ throws WxPayException 共享存储不可用，本地已记录
+    def done(self, key):
+        if key is None:
+            return
+        self._put(key, WxPayNotifyDedup.DONE, self.ttl)
+        if self.backend is not None:
+            self._call(self.backend.set, key, WxPayNotifyDedup.DONE, self.ttl)
+
+    # 通知处理失败，释放占用，重新通知时再次处理
+    # @ throws WxPayException 共享存储不可用，本地已释放，共享存储中的占用在pendingTtl秒后过期
+    def release(self, key):
+        if key is None:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backend is not None:
+            self._call(self.backend.delete, key)
+
+    # 获取计数：hits命中已处理的通知、misses未命中、conflicts处理中收到的重复通知、
+    # errors共享存储访问失败、size本地记录数
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'conflicts': self.conflicts,
+                'errors': self.errors,
+                'size': len(self._entries),
+            }
+
+    # 访问共享存储，失败时统计并转为WxPayException
+    def _call(self, method, *args):
+        try:
+            return method(*args)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                self.lastError = e
+            raise WxPayException("去重存储访问失败：" + str(e))
+
+    def _get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _put(self, key, state, ttl):
+        with self._lock:
+            self._entries[key] = (state, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    # 超过maxSize时淘汰最久未访问的记录，调用时已持有锁
+    def _evict(self):
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+
+
+# 去重共享存储接口，多进程部署时实现该接口接入redis、memcached等，
+# 各方法需要是进程间原子的；未实现全部方法的子类不能创建对象
+class WxPayDedupBackend(abc.ABC):
+    # 读取记录，不存在或已过期时返回None
+    @abc.abstractmethod
+    def get(self, key):
+        pass
+
+    # 记录不存在时写入并返回True，已存在时返回False
+    @abc.abstractmethod
+    def add(self, key, value, ttl):
+        pass
+
+    # 写入记录
+    @abc.abstractmethod
+    def set(self, key, value, ttl):
+        pass
+
+    # 删除记录
+    @abc.abstractmethod
+    def delete(self, key):
+        pass
+
+
+# 基于redis的共享存储，传入redis-py（或接口兼容）的客户端对象
+# @ param client redis客户端
+# @ param string prefix 键前缀
+#
+# 使用方法:
+#   dedup = WxPayNotifyDedup(backend=WxPayRedisDedupBackend(redis.Redis()))
+class WxPayRedisDedupBackend(WxPayDedupBackend):
+    def __init__(self, client, prefix='wxpay:notify:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode('ascii')
+        return value
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(self.prefix + key, value, nx=True, ex=max(1, int(ttl))))
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+# 基于SQLite的共享存储，用于同一台机器上的多个进程（如WxPayNotifyRunner的各个工作进程），
+# 不需要额外部署redis。各进程、各线程使用自己的连接，fork后在子进程中重新连接
+# @ param string path 数据库文件路径
+#
+# 使用方法:
+#   dedup = WxPayNotifyDedup(backend=WxPaySqliteDedupBackend('/data/wxpay_dedup.db'))
+class WxPaySqliteDedupBackend(WxPayDedupBackend):
+    # 清理过期记录的间隔秒数
+    PURGE_INTERVAL = 600
+
+    SCHEMA = "CREATE TABLE IF NOT EXISTS wxpay_dedup (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._purgedAt = 0
+        self._connection().execute(WxPaySqliteDedupBackend.SCHEMA)
+
+    def get(self, key):
+        row = self._connection().execute("SELECT value FROM wxpay_dedup WHERE key = ? AND expires > ?",
+                                         (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        self._purge(now)
+        # 记录不存在或已过期时写入，单条语句在进程间是原子的
+        cursor = self._connection().execute(
+            "INSERT INTO wxpay_dedup (key, value, expires) VALUES (?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires"
+            " WHERE wxpay_dedup.expires <= ?", (key, value, now + ttl, now))
+        return cursor.rowcount == 1
+
+    def set(self, key, value, ttl):
+        self._connection().execute("INSERT OR REPLACE INTO wxpay_dedup (key, value, expires) VALUES (?, ?, ?)",
+                                   (key, value, time.time() + ttl))
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM wxpay_dedup WHERE key = ?", (key,))
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # 去重记录丢失只会导致重复处理，不要求每次落盘
+            connection.execute("PRAGMA synchronous=NORMAL")
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def _purge(self, now):
+        if now - self._purgedAt < WxPaySqliteDedupBackend.PURGE_INTERVAL:
+            return
+        self._purgedAt = now
+        self._connection().execute("DELETE FROM wxpay_dedup WHERE expires <= ?", (now,))
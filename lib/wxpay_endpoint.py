@@ -0,0 +1,157 @@
+#
+# 接口域名选择类
+#
+from .wxpay_config import WxPayConfig
+from .wxpay_exception import WxPayNetworkException
+
+import collections, threading, time
+from urllib.parse import urlsplit, urlunsplit
+
+
+# 单个域名的熔断状态
+class WxPayHostState:
+    # 正常
+    CLOSED = 'CLOSED'
+    # 熔断，不再发送请求
+    OPEN = 'OPEN'
+    # 熔断时间已过，允许一个探测请求
+    HALF_OPEN = 'HALF_OPEN'
+
+    def __init__(self, host, window):
+        self.host = host
+        self.state = WxPayHostState.CLOSED
+        # 最近请求的结果，True为成功
+        self.outcomes = collections.deque(maxlen=window)
+        self.consecutiveFailures = 0
+        # 成功请求耗时的指数移动平均（秒），None表示还没有样本
+        self.latency = None
+        self.openedAt = 0
+        self.probing = False
+        self.probeAt = 0
+        self.lastUsed = 0
+
+    def failureRate(self):
+        if not self.outcomes:
+            return 0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+# 接口域名选择，按域名统计错误率与耗时：
+# 主域名连续失败或错误率过高时熔断，请求切换到备用域名；
+# 熔断openSeconds秒后放行一个探测请求，成功则恢复主域名。
+# 所有域名都熔断时立即抛出异常，不再等待超时。
+# 主域名平均耗时超过备用域名latencyFactor倍时也优先使用备用域名
+# @ param list hosts 域名列表，第一个为主域名，默认WxPayConfig.API_HOSTS
+# @ param int window 统计错误率的最近请求数
+# @ param int minRequests 计算错误率所需的最少请求数
+# @ param float failureRate 错误率达到该值时熔断
+# @ param int consecutiveFailures 连续失败达到该次数时熔断
+# @ param float openSeconds 熔断持续秒数
+# @ param float latencyFactor 耗时切换的倍数，0表示不按耗时切换
+class WxPayEndpointSelector:
+    # 耗时移动平均的权重
+    LATENCY_ALPHA = 0.2
+
+    def __init__(self, hosts=None, window=50, minRequests=10, failureRate=0.5,
+                 consecutiveFailures=5, openSeconds=10, latencyFactor=3):
+        if hosts is None:
+            hosts = WxPayConfig.API_HOSTS
+        self.hosts = list(hosts)
+        self.minRequests = minRequests
+        self.failureRate = failureRate
+        self.consecutiveFailures = consecutiveFailures
+        self.openSeconds = openSeconds
+        self.latencyFactor = latencyFactor
+        self.states = collections.OrderedDict((host, WxPayHostState(host, window)) for host in self.hosts)
+        self._lock = threading.Lock()
+
+    # 为请求选择域名，返回替换域名后的url与所选域名；url的域名不在列表中时原样返回，域名为None
+    # @ throws WxPayNetworkException 所有域名都处于熔断状态
+    def select(self, url):
+        parts = urlsplit(url)
+        if parts.hostname not in self.states:
+            return url, None
+        host = self._selectHost()
+        if host is None:
+            raise WxPayNetworkException("接口域名均已熔断，请稍后重试！", False)
+        if host != parts.netloc:
+            url = urlunsplit((parts.scheme, host, parts.path, parts.query, parts.fragment))
+        return url, host
+
+    # 记录请求结果
+    # @ param string host select返回的域名，为None时忽略
+    # @ param bool ok 是否成功
+    # @ param float latency 请求耗时（秒）
+    def record(self, host, ok, latency=None):
+        if host is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            state = self.states[host]
+            state.outcomes.append(ok)
+            if ok:
+                state.consecutiveFailures = 0
+                if latency is not None:
+                    if state.latency is None:
+                        state.latency = latency
+                    else:
+                        alpha = WxPayEndpointSelector.LATENCY_ALPHA
+                        state.latency = state.latency * (1 - alpha) + latency * alpha
+                if state.state == WxPayHostState.HALF_OPEN:
+                    # 探测成功，恢复
+                    state.state = WxPayHostState.CLOSED
+                    state.outcomes.clear()
+                    state.probing = False
+                return
+
+            state.consecutiveFailures += 1
+            if state.state == WxPayHostState.HALF_OPEN:
+                # 探测失败，重新熔断
+                self._open(state, now)
+            elif state.state == WxPayHostState.CLOSED and (
+                    state.consecutiveFailures >= self.consecutiveFailures or
+                    (len(state.outcomes) >= self.minRequests and state.failureRate() >= self.failureRate)):
+                self._open(state, now)
+
+    # 获取各域名的状态：state、failureRate、latency
+    def stats(self):
+        with self._lock:
+            return dict((host, {'state': state.state,
+                                'failureRate': state.failureRate(),
+                                'latency': state.latency})
+                        for host, state in self.states.items())
+
+    def _open(self, state, now):
+        state.state = WxPayHostState.OPEN
+        state.openedAt = now
+        state.probing = False
+
+    def _selectHost(self):
+        now = time.monotonic()
+        with self._lock:
+            available = []
+            for host, state in self.states.items():
+                if state.state == WxPayHostState.OPEN and now - state.openedAt >= self.openSeconds:
+                    state.state = WxPayHostState.HALF_OPEN
+                if state.state == WxPayHostState.HALF_OPEN:
+                    # 探测请求优先发往刚恢复的域名，同一时刻只放行一个，探测无结果时openSeconds后再次探测
+                    if not state.probing or now - state.probeAt >= self.openSeconds:
+                        state.probing = True
+                        state.probeAt = now
+                        state.lastUsed = now
+                        return host
+                    continue
+                if state.state == WxPayHostState.CLOSED:
+                    available.append(state)
+            if not available:
+                return None
+            best = available[0]
+            # 主域名因耗时被跳过时，每openSeconds秒仍发一个请求更新其耗时，以便恢复
+            if self.latencyFactor and best.latency is not None and \
+                    now - best.lastUsed < self.openSeconds:
+                for state in available[1:]:
+                    if state.latency is not None and best.latency > state.latency * self.latencyFactor:
+                        best = state
+                        break
+            best.lastUsed = now
+            return best.host
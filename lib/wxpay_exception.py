@@ -7,7 +7,15 @@
 
 class WxPayException(Exception):
     def __init__(self, msg):
+        Exception.__init__(self, msg)
         self.msg = msg
 
     def errorMessage(self):
-        raise self.msg
+        return self.msg
+
+
+# 网络异常，sent为False表示请求未发出（如连接失败），非幂等接口也可以安全重试
+class WxPayNetworkException(WxPayException):
+    def __init__(self, msg, sent=True):
+        WxPayException.__init__(self, msg)
+        self.sent = sent
@@ -0,0 +1,132 @@
+#
+# 随机字符串与商户单号生成类
+#
+from .wxpay_config import WxPayConfig
+from .wxpay_exception import WxPayException
+
+import os, threading, time
+
+
+# 生成随机字符串（nonce_str）及商户订单号、退款单号。
+# 随机字符串取自os.urandom，一次读取一批缓存起来，按字符表映射时丢弃超出范围的字节，保证均匀分布。
+# 单号格式为 前缀 + yyyyMMddHHmmssSSS（毫秒） + 8位节点号 + 3位序号，最长32位，
+# 同一节点内严格递增，不同节点间按时间排序：
+# 节点号默认为进程启动（或fork）时生成的随机数；配置WxPayConfig.ID_NODE（3位，每台机器不同）时
+# 为ID_NODE + 进程号，多台机器的多个进程之间不需要任何协调即可保证不重复
+class WxPayIdGenerator:
+    CHARS = "abcdefghijklmnopqrstuvwxyz0123456789"
+    NODE_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    # 每次从系统读取的随机字节数
+    BUFFER_SIZE = 4096
+    # 每毫秒最多生成的单号数，超过时提前使用下一毫秒
+    MAX_SEQUENCE = 36 ** 3
+    # 前缀最大长度，单号总长不超过32位
+    MAX_PREFIX = 4
+
+    # 共用对象
+    _default = None
+    _defaultLock = threading.Lock()
+
+    def __init__(self, node=None):
+        # 256以内、字符表长度整数倍以外的字节丢弃，映射后各字符概率相同
+        limit = 256 - 256 % len(WxPayIdGenerator.CHARS)
+        self._table = bytes(ord(WxPayIdGenerator.CHARS[i % len(WxPayIdGenerator.CHARS)]) if i < limit else 0
+                            for i in range(256))
+        self._reject = bytes(range(limit, 256))
+        self._fixedNode = node
+        self._reset()
+
+    # 获取共用的生成对象，fork后的子进程中自动更换节点号并丢弃缓存的随机数
+    @staticmethod
+    def getDefault():
+        if WxPayIdGenerator._default is None:
+            with WxPayIdGenerator._defaultLock:
+                if WxPayIdGenerator._default is None:
+                    WxPayIdGenerator._default = WxPayIdGenerator()
+        return WxPayIdGenerator._default
+
+    # 产生随机字符串
+    # @ param int length 长度
+    def nonce(self, length=32):
+        with self._lock:
+            if len(self._buffer) - self._pos < length:
+                self._fill(length)
+            start = self._pos
+            self._pos += length
+            return self._buffer[start:self._pos]
+
+    # 产生商户订单号
+    # @ param string prefix 前缀，不超过4位字母或数字
+    def outTradeNo(self, prefix=""):
+        return self._next(prefix)
+
+    # 产生商户退款单号，与订单号使用同一序列，不会与订单号重复
+    # @ param string prefix 前缀，不超过4位字母或数字
+    def outRefundNo(self, prefix=""):
+        return self._next(prefix)
+
+    def _next(self, prefix):
+        if len(prefix) > WxPayIdGenerator.MAX_PREFIX or (prefix and not prefix.isalnum()):
+            raise WxPayException("单号前缀只能是不超过" + str(WxPayIdGenerator.MAX_PREFIX) + "位的字母或数字！")
+        with self._lock:
+            now = time.time_ns() // 1000000
+            if now > self._lastMs:
+                self._lastMs = now
+                self._sequence = 0
+            else:
+                # 同一毫秒内或时钟回拨时沿用上一次的时间，继续递增序号
+                self._sequence += 1
+                if self._sequence >= WxPayIdGenerator.MAX_SEQUENCE:
+                    self._lastMs += 1
+                    self._sequence = 0
+            ms = self._lastMs
+            sequence = self._sequence
+            node = self._node
+        seconds, millis = divmod(ms, 1000)
+        return prefix + time.strftime("%Y%m%d%H%M%S", time.localtime(seconds)) + "%03d" % millis + \
+            node + WxPayIdGenerator._base36(sequence, 3)
+
+    # 补充随机字符，保留未用完的部分
+    def _fill(self, length):
+        chars = self._buffer[self._pos:]
+        while len(chars) < length:
+            data = os.urandom(max(WxPayIdGenerator.BUFFER_SIZE, length * 2))
+            chars += data.translate(self._table, self._reject).decode('ascii')
+        self._buffer = chars
+        self._pos = 0
+
+    # 初始化节点号、序号及缓存，fork后在子进程中调用（父进程中的锁可能正被其他线程持有，一并重建）
+    def _reset(self):
+        node = self._fixedNode
+        if node is None:
+            node = WxPayConfig.ID_NODE
+        if node is None:
+            node = WxPayIdGenerator._base36(int.from_bytes(os.urandom(6), 'big'), 8)
+        else:
+            if len(node) != 3 or not node.isalnum():
+                raise WxPayException("WxPayConfig.ID_NODE必须为3位字母或数字！")
+            node = node.upper() + WxPayIdGenerator._base36(os.getpid(), 5)
+        self._lock = threading.Lock()
+        self._node = node
+        self._lastMs = 0
+        self._sequence = 0
+        self._buffer = ""
+        self._pos = 0
+
+    # 固定宽度的36进制（数字在前，保证字典序与数值顺序一致）
+    @staticmethod
+    def _base36(value, width):
+        chars = []
+        for i in range(width):
+            value, digit = divmod(value, 36)
+            chars.append(WxPayIdGenerator.NODE_CHARS[digit])
+        return "".join(reversed(chars))
+
+
+def _resetAfterFork():
+    if WxPayIdGenerator._default is not None:
+        WxPayIdGenerator._default._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_resetAfterFork)
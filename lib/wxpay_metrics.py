@@ -0,0 +1,188 @@
+#
+# 接口调用耗时统计类
+#
+import bisect, contextvars, threading, time
+
+
+# 当前线程（或协程）正在统计的接口调用
+_current = contextvars.ContextVar('wxpay_call_timer', default=None)
+
+
+# 单次接口调用的分阶段耗时（秒，time.perf_counter计时），阶段包括：
+# sign 签名、serialize 输出xml、connect 建立连接（含TLS握手，复用长连接时没有该阶段）、
+# wait 发出请求到读完响应（不含connect）、parse 解析xml、verify 验证签名、total 总耗时。
+# 重试及对冲请求的耗时累加到同一阶段
+# @ param WxPayMetrics metrics 调用结束时记录到的统计对象
+class WxPayCallTimer:
+    def __init__(self, metrics):
+        self.metrics = metrics
+        # 接口路径，如/pay/orderquery，为None时（如参数检查未通过）不记录
+        self.endpoint = None
+        self.result = None
+        self.errCode = ''
+        self.phases = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        _current.reset(self._token)
+        if excValue is not None and self.result is None:
+            self.result = 'ERROR'
+            self.errCode = excType.__name__
+        self.add('total', time.perf_counter() - self._start)
+        if self.endpoint is not None:
+            self.metrics.record(self)
+        return False
+
+    # 累加一个阶段的耗时
+    def add(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    # 获取一个阶段已累计的耗时
+    def get(self, phase):
+        return self.phases.get(phase, 0)
+
+    # 按接口返回结果设置result、err_code标签
+    # @ param dict result WxPayResults.Init的返回值
+    def setResult(self, result):
+        self.result = result.get('result_code') or result.get('return_code') or ''
+        self.errCode = result.get('err_code') or ''
+
+
+# 统计一个阶段的耗时，当前没有正在统计的接口调用时不做任何事
+# 使用方法:
+#   with WxPayMetrics.phase('sign'):
+#       inputObj.SetSign()
+class WxPayPhase:
+    __slots__ = ('name', 'timer', 'start')
+
+    def __init__(self, name, timer=None):
+        self.name = name
+        self.timer = _current.get() if timer is None else timer
+        self.start = 0
+
+    def __enter__(self):
+        if self.timer is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if self.timer is not None:
+            self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# 按接口、阶段、结果、错误码聚合的耗时直方图，可输出Prometheus文本格式
+# @ param tuple buckets 直方图分桶上限（秒）
+#
+# 使用方法:
+#   text = WxPayApi.getMetrics().exposition()
+class WxPayMetrics:
+    NAME = 'wxpay_request_phase_seconds'
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, buckets=None):
+        if buckets is None:
+            buckets = WxPayMetrics.BUCKETS
+        self.buckets = tuple(sorted(buckets))
+        # (endpoint, phase, result, err_code) -> [各分桶计数（最后一个为+Inf）, 耗时总和]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    # 开始统计一次接口调用，在with块中执行
+    def timer(self):
+        return WxPayCallTimer(self)
+
+    # 当前正在统计的接口调用，没有时返回None
+    @staticmethod
+    def current():
+        return _current.get()
+
+    # 在其他线程中继续统计同一次接口调用（如对冲请求），返回值传给deactivate
+    @staticmethod
+    def activate(timer):
+        return _current.set(timer)
+
+    @staticmethod
+    def deactivate(token):
+        _current.reset(token)
+
+    # 统计当前接口调用的一个阶段
+    @staticmethod
+    def phase(name):
+        return WxPayPhase(name)
+
+    # 记录一次结束的接口调用
+    def record(self, timer):
+        buckets = self.buckets
+        with self._lock:
+            for phase, seconds in timer.phases.items():
+                key = (timer.endpoint, phase, timer.result or '', timer.errCode or '')
+                series = self._series.get(key)
+                if series is None:
+                    series = [[0] * (len(buckets) + 1), 0.0]
+                    self._series[key] = series
+                series[0][bisect.bisect_left(buckets, seconds)] += 1
+                series[1] += seconds
+
+    # 导出统计数据，用于多进程之间汇总：[(endpoint, phase, result, err_code), 各分桶计数, 耗时总和]的列表
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(series[0]), series[1]] for key, series in self._series.items()]
+
+    # 累加其他进程导出的统计数据，分桶须与本对象一致
+    # @ param list snapshot snapshot的返回值
+    def merge(self, snapshot):
+        size = len(self.buckets) + 1
+        with self._lock:
+            for key, counts, total in snapshot:
+                if len(counts) != size:
+                    continue
+                key = tuple(key)
+                series = self._series.get(key)
+                if series is None:
+                    series = [[0] * size, 0.0]
+                    self._series[key] = series
+                for i, count in enumerate(counts):
+                    series[0][i] += count
+                series[1] += total
+
+    # 清空统计数据
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    # 输出Prometheus文本格式
+    def exposition(self):
+        with self._lock:
+            snapshot = [(key, list(series[0]), series[1]) for key, series in self._series.items()]
+        snapshot.sort()
+        name = WxPayMetrics.NAME
+        lines = ['# HELP ' + name + ' WeChat Pay API call latency by phase in seconds.',
+                 '# TYPE ' + name + ' histogram']
+        bounds = [WxPayMetrics._number(bound) for bound in self.buckets] + ['+Inf']
+        for (endpoint, phase, result, errCode), counts, total in snapshot:
+            labels = 'endpoint="%s",phase="%s",result="%s",err_code="%s"' % (
+                WxPayMetrics._escape(endpoint), WxPayMetrics._escape(phase),
+                WxPayMetrics._escape(result), WxPayMetrics._escape(errCode))
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+            lines.append('%s_sum{%s} %s' % (name, labels, repr(total)))
+            lines.append('%s_count{%s} %d' % (name, labels, cumulative))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _number(value):
+        return repr(float(value))
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
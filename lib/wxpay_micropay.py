@@ -0,0 +1,219 @@
+#
+# 刷卡支付（被扫支付）流程驱动类
+#
+from .wxpay_exception import WxPayException, WxPayNetworkException
+from .wxpay_data import WxPayOrderQuery, WxPayReverse
+from .wxpay_api import WxPayApi
+
+import heapq, itertools, threading, time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+# 单笔刷卡支付的状态，由WxPayMicroPayDriver推进
+class WxPayMicroPayTask:
+    # 提交支付
+    PAYING = 'PAYING'
+    # 用户支付中（输入密码等），轮询订单状态
+    QUERYING = 'QUERYING'
+    # 超时或支付失败，撤销订单
+    REVERSING = 'REVERSING'
+    # 终态：支付成功
+    SUCCESS = 'SUCCESS'
+    # 终态：支付失败，无需撤销
+    FAILED = 'FAILED'
+    # 终态：已撤销
+    REVERSED = 'REVERSED'
+    # 终态：撤销失败，需要人工处理
+    ERROR = 'ERROR'
+
+    FINAL = (SUCCESS, FAILED, REVERSED, ERROR)
+
+    def __init__(self, inputObj, deadline):
+        self.inputObj = inputObj
+        self.outTradeNo = inputObj.GetOut_trade_no()
+        self.state = WxPayMicroPayTask.PAYING
+        # 最后一次接口返回的结果
+        self.result = None
+        # 最后一次接口调用的异常
+        self.error = None
+        self.deadline = deadline
+        self.queryCount = 0
+        self.reverseCount = 0
+        self.future = Future()
+
+    def done(self):
+        return self.state in WxPayMicroPayTask.FINAL
+
+
+# 刷卡支付流程驱动，按状态机推进 提交支付 → 轮询订单（退避） → 超时撤销 的流程。
+# 等待期间不占用线程：所有任务共用一个定时线程，到期的步骤交给有界线程池执行接口调用，
+# 一个进程可以同时处理数百笔刷卡支付
+# @ param int workers 执行接口调用的线程数
+# @ param float deadline 从提交支付起等待用户完成支付的最长秒数，超时后撤销订单
+# @ param float queryInterval 首次轮询间隔秒数
+# @ param float queryBackoff 轮询间隔的增长倍数
+# @ param float queryMaxInterval 轮询间隔上限秒数
+# @ param int reverseTimes 撤销订单的最多尝试次数
+#
+# 使用方法:
+#   driver = WxPayMicroPayDriver()
+#   task = driver.submit(inputObj)
+#   task.future.add_done_callback(...)   或   driver.submit(inputObj).future.result()
+class WxPayMicroPayDriver:
+    def __init__(self, workers=16, deadline=30, queryInterval=1, queryBackoff=1.5,
+                 queryMaxInterval=5, reverseTimes=10):
+        self.deadline = deadline
+        self.queryInterval = queryInterval
+        self.queryBackoff = queryBackoff
+        self.queryMaxInterval = queryMaxInterval
+        self.reverseTimes = reverseTimes
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='WxPayMicroPay')
+        self._timers = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._runTimers, name='WxPayMicroPayTimer', daemon=True)
+        self._thread.start()
+
+    # 提交一笔刷卡支付，立即返回任务对象，最终状态通过task.future获取
+    # @ param WxPayMicroPay $inputObj
+    def submit(self, inputObj):
+        task = WxPayMicroPayTask(inputObj, time.monotonic() + self.deadline)
+        self._schedule(0, self._pay, task)
+        return task
+
+    # 停止驱动，wait为True时等待进行中的接口调用完成
+    def close(self, wait=True):
+        with self._cond:
+            self._closed = True
+            timers, self._timers = self._timers, []
+            self._cond.notify()
+        # 尚未执行的步骤直接结束，需要人工处理
+        for when, seq, step, task in timers:
+            self._finish(task, WxPayMicroPayTask.ERROR)
+        self._executor.shutdown(wait=wait)
+
+    # 提交支付
+    def _pay(self, task):
+        try:
+            # 参数错误时请求不会发出，直接结束，不需要查询和撤销
+            task.inputObj.Validate()
+        except WxPayException as e:
+            task.error = e
+            return self._finish(task, WxPayMicroPayTask.FAILED)
+        try:
+            result = WxPayApi.micropay(task.inputObj)
+        except WxPayNetworkException as e:
+            task.error = e
+            if not e.sent:
+                return self._finish(task, WxPayMicroPayTask.FAILED)
+            # 请求已发出，无法确定支付结果，转为查询
+            return self._query(task, 0)
+        except Exception as e:
+            # 应答解析、验证签名失败等，请求已发出，无法确定支付结果，转为查询
+            task.error = e
+            return self._query(task, 0)
+        task.result = result
+        if result.get('return_code') == 'SUCCESS' and result.get('result_code') == 'SUCCESS':
+            return self._finish(task, WxPayMicroPayTask.SUCCESS)
+        if result.get('return_code') == 'SUCCESS' and result.get('result_code') == 'FAIL' and \
+                result.get('err_code') not in ('USERPAYING', 'SYSTEMERROR', 'BANKERROR'):
+            return self._finish(task, WxPayMicroPayTask.FAILED)
+        # 用户支付中或系统错误，轮询订单状态
+        self._query(task, self.queryInterval)
+
+    # 安排下一次查询，超过截止时间时改为撤销
+    def _query(self, task, delay):
+        if time.monotonic() + delay >= task.deadline:
+            task.state = WxPayMicroPayTask.REVERSING
+            self._schedule(0, self._reverse, task)
+            return
+        task.state = WxPayMicroPayTask.QUERYING
+        self._schedule(delay, self._doQuery, task)
+
+    def _doQuery(self, task):
+        task.queryCount += 1
+        queryObj = WxPayOrderQuery()
+        queryObj.SetOut_trade_no(task.outTradeNo)
+        delay = min(self.queryInterval * (self.queryBackoff ** task.queryCount), self.queryMaxInterval)
+        try:
+            result = WxPayApi.orderQuery(queryObj)
+        except Exception as e:
+            task.error = e
+            return self._query(task, delay)
+        task.result = result
+        if result.get('return_code') == 'SUCCESS' and result.get('result_code') == 'SUCCESS':
+            tradeState = result.get('trade_state')
+            if tradeState == 'SUCCESS':
+                return self._finish(task, WxPayMicroPayTask.SUCCESS)
+            if tradeState != 'USERPAYING':
+                # 订单已失败（如PAYERROR、CLOSED），撤销订单
+                task.state = WxPayMicroPayTask.REVERSING
+                return self._schedule(0, self._reverse, task)
+        elif result.get('err_code') not in (None, 'SYSTEMERROR'):
+            # 业务错误（如订单不存在），撤销订单
+            task.state = WxPayMicroPayTask.REVERSING
+            return self._schedule(0, self._reverse, task)
+        self._query(task, delay)
+
+    # 撤销订单，recall为Y时需要重试
+    def _reverse(self, task):
+        task.reverseCount += 1
+        reverseObj = WxPayReverse()
+        reverseObj.SetOut_trade_no(task.outTradeNo)
+        try:
+            result = WxPayApi.reverse(reverseObj)
+        except Exception as e:
+            task.error = e
+            result = None
+        if result is not None:
+            task.result = result
+            if result.get('return_code') == 'SUCCESS' and result.get('result_code') == 'SUCCESS':
+                return self._finish(task, WxPayMicroPayTask.REVERSED)
+            if result.get('return_code') == 'SUCCESS' and result.get('recall') != 'Y':
+                return self._finish(task, WxPayMicroPayTask.ERROR)
+        if task.reverseCount >= self.reverseTimes:
+            return self._finish(task, WxPayMicroPayTask.ERROR)
+        self._schedule(self.queryInterval, self._reverse, task)
+
+    def _finish(self, task, state):
+        task.state = state
+        if not task.future.done():
+            task.future.set_result(task)
+
+    # 在delay秒后把step交给线程池执行
+    def _schedule(self, delay, step, task):
+        with self._cond:
+            if self._closed:
+                task.error = WxPayException("刷卡支付驱动已关闭！")
+                self._finish(task, WxPayMicroPayTask.ERROR)
+                return
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._seq), step, task))
+            self._cond.notify()
+
+    def _runTimers(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    if self._timers and self._timers[0][0] <= now:
+                        break
+                    timeout = self._timers[0][0] - now if self._timers else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                when, seq, step, task = heapq.heappop(self._timers)
+            try:
+                self._executor.submit(self._runStep, step, task)
+            except RuntimeError:
+                # 取出步骤后驱动被关闭，线程池不再接受任务，直接结束该笔支付，需要人工处理
+                task.error = WxPayException("刷卡支付驱动已关闭！")
+                self._finish(task, WxPayMicroPayTask.ERROR)
+
+    def _runStep(self, step, task):
+        try:
+            step(task)
+        except Exception as e:
+            task.error = e
+            self._finish(task, WxPayMicroPayTask.ERROR)
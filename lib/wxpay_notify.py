@@ -1,11 +1,420 @@
 #
 # 回调基础类
 #
+from .wxpay_config import WxPayConfig
+from .wxpay_exception import WxPayException
 from .wxpay_api import WxPayApi
 from .wxpay_data import WxPayNotifyReply
+from .wxpay_dedup import WxPayNotifyDedup
 
+import asyncio, inspect, threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
+
+# 支付通知处理基础类，继承后重写NotifyProcess处理业务逻辑，每条通知使用一个新对象
+# 使用方法:
+#   class PayNotify(WxPayNotify):
+#       def NotifyProcess(self, data):
+#           ...
+#           return True
+#   reply = PayNotify().Handle(body)
 class WxPayNotify(WxPayNotifyReply):
-    def Handle(self, needSign=True):
-        msg = "OK"
-        result = WxPayApi.notify()
+    __slots__ = ()
+
+    # 处理一条通知，返回应答xml
+    # @ param bytes|string xml 通知的原始请求体
+    # @ param bool needSign 处理成功时应答是否签名
+    # @ param WxPayNotifyDedup dedup 去重缓存，已处理成功的重复通知直接应答SUCCESS
+    def Handle(self, xml, needSign=True, dedup=None):
+        result, msg = WxPayApi.notify(self.NotifyCallBack, xml, dedup)
+        if result is False:
+            self.SetReturn_code("FAIL")
+            self.SetReturn_msg(msg)
+            return self.ReplyNotify(False)
+        self.SetReturn_code("SUCCESS")
+        self.SetReturn_msg("OK")
+        return self.ReplyNotify(needSign)
+
+    # 业务处理，继承后重写
+    # 返回True表示处理成功；返回False或抛出WxPayException（异常信息作为应答的return_msg）表示处理失败
+    # @ param dict data 验证通过的通知参数
+    def NotifyProcess(self, data):
+        return True
+
+    # 回调入口
+    def NotifyCallBack(self, data):
+        return self.NotifyProcess(data)
+
+    # 生成应答xml
+    def ReplyNotify(self, needSign=True):
+        if needSign and self.GetReturn_code() == "SUCCESS":
+            self.SetSign()
+        return WxPayApi.replyNotify(self.ToXmlBytes())
+
+
+# 支付通知分发对象，WSGI与ASGI应用共用：
+# 验证签名在收到通知的线程（ASGI中为默认线程池，不阻塞事件循环）中完成，业务处理交给有界线程池（协程函数为有界任务数）。
+# 等待业务处理结果后再应答，超过handlerTimeout仍未完成时应答FAIL，由微信稍后重新通知；
+# 应答SUCCESS后微信不再通知，业务处理失败或进程退出会丢失通知，因此只有配置了持久化队列时才能提前应答。
+# 在途的业务处理达到maxPending时直接应答FAIL，不再排队。
+# 传入dedup时，已处理成功的重复通知不验证签名直接应答SUCCESS，处理中的重复通知应答FAIL；
+# 去重存储无法占用通知时应答FAIL，业务处理完成后记录去重状态失败不影响应答。
+# 传入queue时验证通过的通知写入持久化队列后立即应答SUCCESS，业务处理由队列的处理线程执行，handler可以为None
+# @ param function handler 业务处理函数或协程函数，参数为通知参数字典，返回值同WxPayNotify.NotifyProcess
+# @ param int workers 业务处理线程数
+# @ param int maxPending 在途（排队及执行中）的业务处理数上限
+# @ param bool waitHandler 是否等待业务处理结果后再应答，为False时必须传入queue
+# @ param float handlerTimeout 等待业务处理的秒数
+# @ param WxPayNotifyDedup dedup 去重缓存
+# @ param WxPayNotifyQueue queue 持久化队列
+class WxPayNotifyDispatcher:
+    # 通知处理成功的应答，预先生成，不需要签名
+    SUCCESS = b'<xml><return_code><![CDATA[SUCCESS]]></return_code><return_msg><![CDATA[OK]]></return_msg></xml>'
+
+    def __init__(self, handler, workers=None, maxPending=None, waitHandler=None, handlerTimeout=None,
+                 dedup=None, queue=None):
+        if workers is None:
+            workers = WxPayConfig.NOTIFY_WORKERS
+        if maxPending is None:
+            maxPending = WxPayConfig.NOTIFY_MAX_PENDING
+        if waitHandler is None:
+            waitHandler = WxPayConfig.NOTIFY_WAIT_HANDLER
+        if handlerTimeout is None:
+            handlerTimeout = WxPayConfig.NOTIFY_HANDLER_TIMEOUT
+        if not waitHandler and queue is None:
+            raise WxPayException("不等待业务处理直接应答时必须配置持久化队列（queue）！")
+        self.handler = handler
+        self.isCoroutine = inspect.iscoroutinefunction(handler)
+        self.maxPending = maxPending
+        self.waitHandler = waitHandler
+        self.handlerTimeout = handlerTimeout
+        self.dedup = dedup
+        self.queue = queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='WxPayNotify')
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._backgroundLoop = None
+
+        self.received = 0
+        self.rejected = 0
+        self.busy = 0
+        self.handled = 0
+        self.failed = 0
+        self.timeout = 0
+        self.duplicate = 0
+        self.queued = 0
+        self.pending = 0
+        self.lastError = None
+
+    # 处理一条通知，返回应答xml，在WSGI等线程模型中调用
+    # @ param bytes body 通知的原始请求体
+    def dispatch(self, body):
+        try:
+            data, key = self._check(body)
+            if data is None:
+                return WxPayNotifyDispatcher.SUCCESS
+            if self.queue is not None:
+                self._enqueue(data, key)
+                return WxPayNotifyDispatcher.SUCCESS
+            self._acquire(key)
+        except WxPayException as e:
+            return self.reply(False, e.errorMessage())
+        if self.isCoroutine:
+            future = asyncio.run_coroutine_threadsafe(self._runAsync(data, key), self._loop())
+        else:
+            future = self.executor.submit(self._run, data, key)
+        try:
+            return self.reply(*future.result(self.handlerTimeout))
+        except FutureTimeoutError:
+            self._count('timeout')
+            return self.reply(False, "通知处理超时")
+
+    # 处理一条通知，返回应答xml，在ASGI应用的事件循环中调用
+    # @ param bytes body 通知的原始请求体
+    async def dispatchAsync(self, body):
+        loop = asyncio.get_running_loop()
+        try:
+            # 验证签名及去重存储（redis、SQLite）的读写都在线程池中执行，不阻塞事件循环
+            data, key = await loop.run_in_executor(None, self._check, body)
+            if data is None:
+                return WxPayNotifyDispatcher.SUCCESS
+            if self.queue is not None:
+                await loop.run_in_executor(self.executor, self._enqueue, data, key)
+                return WxPayNotifyDispatcher.SUCCESS
+            if self.dedup is None:
+                self._acquire(key)
+            else:
+                await loop.run_in_executor(None, self._acquire, key)
+        except WxPayException as e:
+            return self.reply(False, e.errorMessage())
+        if self.isCoroutine:
+            future = asyncio.ensure_future(self._runAsync(data, key))
+            # 保留任务的引用，避免未完成时被回收
+            self._tasks.add(future)
+            future.add_done_callback(self._tasks.discard)
+        else:
+            future = loop.run_in_executor(self.executor, self._run, data, key)
+        try:
+            return self.reply(*await asyncio.wait_for(asyncio.shield(future), self.handlerTimeout))
+        except asyncio.TimeoutError:
+            self._count('timeout')
+            return self.reply(False, "通知处理超时")
+
+    # 生成应答xml
+    # @ param bool ok 是否处理成功
+    # @ param string msg 失败原因
+    @staticmethod
+    def reply(ok, msg="OK"):
+        if ok:
+            return WxPayNotifyDispatcher.SUCCESS
+        reply = WxPayNotifyReply()
+        reply.SetReturn_code("FAIL")
+        reply.SetReturn_msg(msg)
+        return reply.ToXmlBytes()
+
+    # 获取计数：received收到的通知、rejected验证失败、busy因在途处理过多被拒绝、
+    # handled处理成功、failed处理失败、timeout等待处理超时、duplicate已处理成功的重复通知、
+    # queued写入持久化队列、pending当前在途的处理数
+    def stats(self):
+        with self._lock:
+            return {
+                'received': self.received,
+                'rejected': self.rejected,
+                'busy': self.busy,
+                'handled': self.handled,
+                'failed': self.failed,
+                'timeout': self.timeout,
+                'duplicate': self.duplicate,
+                'queued': self.queued,
+                'pending': self.pending,
+            }
+
+    # 关闭线程池
+    # @ param bool wait 是否等待在途的业务处理完成
+    def close(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    # 解析并验证通知，返回(通知参数, 去重键)，已处理成功的重复通知返回(None, None)
+    # @ throws WxPayException 验证失败
+    def _check(self, body):
+        self._count('received')
+        # 解析、验证签名的耗时计入WxPayApi.metrics，接口路径为notify
+        with WxPayApi.metrics.timer() as timer:
+            timer.endpoint = 'notify'
+            try:
+                data = WxPayApi.parseNotify(body)
+                # 去重键同时用于持久化队列，没有配置dedup时也要计算
+                key = WxPayNotifyDedup.key(data)
+                if self.dedup is not None:
+                    if self.dedup.isDone(key):
+                        self._count('duplicate')
+                        timer.result = 'DUPLICATE'
+                        return None, None
+                WxPayApi.checkNotify(data)
+            except WxPayException:
+                self._count('rejected')
+                timer.result = 'REJECTED'
+                raise
+            timer.setResult(data)
+            return data, key
+
+    # 占用一个在途处理名额，名额已满或重复通知正在处理时抛出异常
+    def _acquire(self, key):
+        with self._lock:
+            if self.pending >= self.maxPending:
+                self.busy += 1
+                raise WxPayException("通知处理繁忙，请稍后重试")
+            self.pending += 1
+        if self.dedup is None:
+            return
+        try:
+            claimed = self.dedup.claim(key)
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            raise
+        if not claimed:
+            with self._lock:
+                self.pending -= 1
+            raise WxPayException("通知正在处理中")
+
+    # 写入持久化队列，落盘后即可应答SUCCESS
+    def _enqueue(self, data, key):
+        isNew = self.queue.put(data, key)
+        self._count('queued' if isNew else 'duplicate')
+        if self.dedup is not None:
+            try:
+                self.dedup.done(key)
+            except WxPayException as e:
+                # 通知已落盘，重复通知由队列按去重键忽略
+                self._setError(e)
+
+    def _run(self, data, key):
+        try:
+            result = self.handler(data)
+        except Exception as e:
+            return self._finish(key, False, e)
+        return self._finish(key, result, None)
+
+    async def _runAsync(self, data, key):
+        error = None
+        try:
+            result = await self.handler(data)
+        except Exception as e:
+            result, error = False, e
+        if self.dedup is None:
+            return self._finish(key, result, error)
+        return await asyncio.get_running_loop().run_in_executor(None, self._finish, key, result, error)
+
+    # 释放在途处理名额、记录去重状态并统计业务处理结果，返回(是否成功, 失败原因)
+    def _finish(self, key, result, error):
+        ok = error is None and result is not False
+        try:
+            if self.dedup is not None:
+                if ok:
+                    self.dedup.done(key)
+                else:
+                    self.dedup.release(key)
+        except WxPayException as e:
+            # 业务处理已完成，去重状态写入失败不改变应答
+            self._setError(e)
+        finally:
+            with self._lock:
+                self.pending -= 1
+        with self._lock:
+            if ok:
+                self.handled += 1
+                return True, "OK"
+            self.failed += 1
+            self.lastError = error
+        if isinstance(error, WxPayException):
+            return False, error.errorMessage()
+        return False, "FAIL"
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _setError(self, error):
+        with self._lock:
+            self.lastError = error
+
+    # WSGI中使用协程函数处理业务时，在后台线程中运行的事件循环
+    def _loop(self):
+        with self._lock:
+            loop = self._backgroundLoop
+            if loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='WxPayNotifyLoop', daemon=True).start()
+                self._backgroundLoop = loop
+        return loop
+
+
+# 支付通知WSGI应用，可直接挂在gunicorn、uWSGI等WSGI服务器上
+# @ param function handler 业务处理函数，其他参数同WxPayNotifyDispatcher
+#
+# 使用方法:
+#   def onPaid(data):
+#       ...
+#       return True
+#   application = WxPayNotifyApp(onPaid)
+class WxPayNotifyApp:
+    def __init__(self, handler, **kwargs):
+        self.dispatcher = WxPayNotifyDispatcher(handler, **kwargs)
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') != 'POST':
+            return WxPayNotifyApp._respond(start_response, '405 Method Not Allowed', b'')
+        maxSize = WxPayConfig.XML_MAX_SIZE
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or -1)
+        except ValueError:
+            length = -1
+        if length > maxSize:
+            return WxPayNotifyApp._respond(start_response, '413 Request Entity Too Large', b'')
+        # 没有Content-Length时最多读取maxSize + 1字节，超出部分交给解析时拒绝
+        body = environ['wsgi.input'].read(length if length >= 0 else maxSize + 1)
+        reply = self.dispatcher.dispatch(body)
+        return WxPayNotifyApp._respond(start_response, '200 OK', reply)
+
+    # 获取计数，同WxPayNotifyDispatcher.stats
+    def stats(self):
+        return self.dispatcher.stats()
+
+    def close(self, wait=True):
+        self.dispatcher.close(wait)
+
+    @staticmethod
+    def _respond(start_response, status, body):
+        start_response(status, [('Content-Type', 'text/xml'), ('Content-Length', str(len(body)))])
+        return [body]
+
+
+# 支付通知ASGI应用，可直接挂在uvicorn、hypercorn等ASGI服务器上。
+# 请求体在事件循环中分块读取，不占用线程；业务处理可以是协程函数或普通函数（在有界线程池中执行）
+# @ param function handler 业务处理函数或协程函数，其他参数同WxPayNotifyDispatcher
+#
+# 使用方法:
+#   async def onPaid(data):
+#       ...
+#       return True
+#   application = AsyncWxPayNotifyApp(onPaid)
+class AsyncWxPayNotifyApp:
+    HEADERS = [(b'content-type', b'text/xml')]
+
+    def __init__(self, handler, **kwargs):
+        self.dispatcher = WxPayNotifyDispatcher(handler, **kwargs)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if scope.get('method') != 'POST':
+            await self._respond(send, 405, b'')
+            return
+        maxSize = WxPayConfig.XML_MAX_SIZE
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > maxSize:
+                await self._respond(send, 413, b'')
+                return
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        body = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        reply = await self.dispatcher.dispatchAsync(body)
+        await self._respond(send, 200, reply)
+
+    # 获取计数，同WxPayNotifyDispatcher.stats
+    def stats(self):
+        return self.dispatcher.stats()
+
+    def close(self, wait=True):
+        self.dispatcher.close(wait)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # 等待在途的业务处理完成后退出
+                if self.dispatcher._tasks:
+                    await asyncio.wait(list(self.dispatcher._tasks))
+                await asyncio.get_running_loop().run_in_executor(None, self.close)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _respond(send, status, body):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': AsyncWxPayNotifyApp.HEADERS + [(b'content-length', str(len(body)).encode('ascii'))]})
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,159 @@
+#
+# 接口调用策略类
+#
+from .wxpay_exception import WxPayException, WxPayNetworkException
+
+import collections, random, threading, time
+import concurrent.futures
+
+
+# 单个接口的调用策略：连接/读取超时、重试次数与退避、总截止时间，
+# 以及幂等查询接口的对冲请求（第一次请求超过历史p95耗时仍未返回时再发一次，取先返回的结果）。
+# 对冲请求使用每个接口自己的线程池，只在有空闲线程时对冲，不排队：线程全忙时第一次请求直接在调用线程中发送，
+# 不再对冲，因此对冲最多增加hedgeWorkers个在途请求，也不会因排队等待而误判超时
+# @ param float connectTimeout 连接超时秒数
+# @ param float readTimeout 读取超时秒数，调用接口时传入timeOut会覆盖该值
+# @ param int retries 最多重试次数
+# @ param float backoff 首次重试前的等待秒数，之后每次翻倍（带随机抖动）
+# @ param float backoffMax 重试等待秒数上限
+# @ param float deadline 包含重试在内的总耗时上限秒数，None表示不限制
+# @ param bool idempotent 接口是否幂等。非幂等接口（下单、退款等）只在连接失败、请求未发出时重试
+# @ param bool hedge 是否启用对冲请求，仅对幂等接口生效
+# @ param float hedgeDelay 历史耗时样本不足时使用的对冲等待秒数
+# @ param float hedgeQuantile 对冲等待时间取历史耗时的分位数
+# @ param int hedgeWorkers 对冲请求的线程数，即该接口同时以可对冲方式发送的请求数上限
+class WxPayEndpointPolicy:
+    # 保留的历史耗时样本数
+    SAMPLES = 256
+    # 样本数少于该值时使用hedgeDelay
+    MIN_SAMPLES = 20
+
+    def __init__(self, connectTimeout=2, readTimeout=6, retries=0, backoff=0.1, backoffMax=1,
+                 deadline=None, idempotent=False, hedge=False, hedgeDelay=0.5, hedgeQuantile=0.95,
+                 hedgeWorkers=16):
+        self.connectTimeout = connectTimeout
+        self.readTimeout = readTimeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoffMax = backoffMax
+        self.deadline = deadline
+        self.idempotent = idempotent
+        self.hedge = hedge and idempotent
+        self.hedgeDelay = hedgeDelay
+        self.hedgeQuantile = hedgeQuantile
+        self.hedgeWorkers = hedgeWorkers
+
+        # 对冲线程池在第一次对冲调用时创建，空闲线程数由_slots记录
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(hedgeWorkers)
+        self._samples = collections.deque(maxlen=WxPayEndpointPolicy.SAMPLES)
+        self._sorted = None
+        self._lock = threading.Lock()
+
+    # 按策略执行一次接口调用
+    # @ param function attempt 发送一次请求的函数，参数为(连接超时, 读取超时)，失败时抛出WxPayException
+    # @ param float readTimeout 调用方指定的读取超时，None时使用策略的readTimeout
+    # @ return attempt的返回值
+    def execute(self, attempt, readTimeout=None):
+        deadline = None
+        if self.deadline is not None:
+            deadline = time.monotonic() + self.deadline
+        tries = 0
+        while True:
+            timeout = self.getTimeout(readTimeout, deadline)
+            start = time.monotonic()
+            try:
+                if self.hedge:
+                    result = self._hedged(attempt, timeout)
+                else:
+                    result = attempt(timeout)
+            except WxPayException as e:
+                if tries >= self.retries or not self._retryable(e):
+                    raise
+                tries += 1
+                wait = random.uniform(0, min(self.backoff * (2 ** (tries - 1)), self.backoffMax))
+                if deadline is not None and time.monotonic() + wait >= deadline:
+                    raise
+                time.sleep(wait)
+                continue
+            self.record(time.monotonic() - start)
+            return result
+
+    # 记录一次成功调用的耗时
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._sorted = None
+
+    # 对冲等待时间，取历史耗时的hedgeQuantile分位数
+    def getHedgeDelay(self):
+        with self._lock:
+            if len(self._samples) < WxPayEndpointPolicy.MIN_SAMPLES:
+                return self.hedgeDelay
+            if self._sorted is None:
+                self._sorted = sorted(self._samples)
+            samples = self._sorted
+        return samples[min(int(len(samples) * self.hedgeQuantile), len(samples) - 1)]
+
+    # 本次请求的(连接超时, 读取超时)，不超过剩余的截止时间
+    # @ param float readTimeout 调用方指定的读取超时，None时使用策略的readTimeout
+    # @ param float deadline 截止时间（time.monotonic），None表示不限制
+    def getTimeout(self, readTimeout=None, deadline=None):
+        if readTimeout is None:
+            readTimeout = self.readTimeout
+        connectTimeout = self.connectTimeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise WxPayNetworkException("接口调用超过截止时间！", False)
+            connectTimeout = min(connectTimeout, remaining) if connectTimeout else remaining
+            readTimeout = min(readTimeout, remaining) if readTimeout else remaining
+        return connectTimeout, readTimeout
+
+    # 幂等接口任何网络错误都可以重试；非幂等接口只在请求未发出时重试，避免重复下单、重复退款
+    def _retryable(self, e):
+        if self.idempotent:
+            return True
+        return isinstance(e, WxPayNetworkException) and not e.sent
+
+    # 发出第一次请求，超过对冲等待时间仍未返回时再发一次，取先成功的结果；
+    # 没有空闲的对冲线程时第一次请求在当前线程发送，第二次请求没有空闲线程时继续等待第一次请求
+    def _hedged(self, attempt, timeout):
+        first = self._submit(attempt, timeout)
+        if first is None:
+            return attempt(timeout)
+        # 占用的是空闲线程，请求提交后立即开始执行，对冲等待时间从此时计算
+        try:
+            return first.result(self.getHedgeDelay())
+        except concurrent.futures.TimeoutError:
+            pass
+        second = self._submit(attempt, timeout)
+        if second is None:
+            return first.result()
+        error = None
+        for future in concurrent.futures.as_completed((first, second)):
+            try:
+                return future.result()
+            except WxPayException as e:
+                error = e
+        raise error
+
+    # 有空闲的对冲线程时提交一次请求，否则返回None
+    def _submit(self, attempt, timeout):
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            future = self._getExecutor().submit(attempt, timeout)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        return future
+
+    def _getExecutor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.hedgeWorkers, thread_name_prefix='WxPayHedge')
+        return self._executor
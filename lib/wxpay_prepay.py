@@ -0,0 +1,117 @@
+#
+# 预支付交易会话缓存类
+#
+from .wxpay_config import WxPayConfig
+
+import calendar, collections, threading, time
+
+
+# 统一下单结果缓存。用户刷新收银页时同一个out_trade_no会反复下单，
+# 订单参数没有变化且prepay_id（code_url）仍在有效期内时直接返回上次的下单结果，不再请求接口。
+# 按out_trade_no记录在内存LRU中，同时保存订单参数的指纹，金额、商品描述、交易类型、openid等参数变化时重新下单。
+# 只缓存下单成功（含prepay_id）的结果，保存ttl秒，订单设置了time_expire时不超过订单失效时间
+# @ param int maxSize 最多记录的订单数，超过时淘汰最久未访问的记录
+# @ param int ttl 下单结果保存秒数，应小于prepay_id的有效期（2小时）
+#
+# 使用方法:
+#   WxPayApi.setPrepayCache(WxPayPrepayCache(maxSize=50000))
+#   result = WxPayApi.unifiedOrder(inputObj)  # 参数相同的重复下单直接返回缓存的结果
+class WxPayPrepayCache:
+    # 参与指纹计算的订单参数，nonce_str、sign、time_start等每次下单都可能不同的参数除外
+    FIELDS = ('total_fee', 'body', 'trade_type', 'openid', 'product_id', 'fee_type', 'detail', 'attach',
+              'goods_tag', 'notify_url', 'time_expire', 'device_info', 'sign_type')
+
+    # time_expire为北京时间
+    TIMEZONE_OFFSET = 8 * 3600
+
+    def __init__(self, maxSize=None, ttl=None):
+        if maxSize is None:
+            maxSize = WxPayConfig.PREPAY_CACHE_SIZE
+        if ttl is None:
+            ttl = WxPayConfig.PREPAY_CACHE_TTL
+        self.maxSize = maxSize
+        self.ttl = ttl
+        # out_trade_no -> (指纹, 下单结果, 过期时间)，按访问顺序排列
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.changes = 0
+
+    # 订单参数的指纹，商户号、公众账号ID变化时也不会命中
+    # @ param dict values 订单参数
+    @staticmethod
+    def fingerprint(values):
+        return (WxPayConfig.__APPID__, WxPayConfig.__MCHID__) + \
+            tuple(values.get(key) for key in WxPayPrepayCache.FIELDS)
+
+    # 获取参数相同且未过期的下单结果，没有时返回None
+    # @ param WxPayUnifiedOrder inputObj
+    def get(self, inputObj):
+        values = inputObj.values
+        outTradeNo = values.get('out_trade_no')
+        if not outTradeNo:
+            return None
+        fingerprint = WxPayPrepayCache.fingerprint(values)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(outTradeNo)
+            if entry is None or entry[2] <= now:
+                if entry is not None:
+                    del self._entries[outTradeNo]
+                self.misses += 1
+                return None
+            if entry[0] != fingerprint:
+                self.changes += 1
+                return None
+            self._entries.move_to_end(outTradeNo)
+            self.hits += 1
+        # 返回副本，调用方修改结果不影响缓存
+        return dict(entry[1])
+
+    # 记录下单结果，下单失败或没有prepay_id时不记录
+    # @ param WxPayUnifiedOrder inputObj
+    # @ param dict result unifiedOrder的返回值
+    def put(self, inputObj, result):
+        values = inputObj.values
+        outTradeNo = values.get('out_trade_no')
+        if not outTradeNo or result.get('result_code') != 'SUCCESS' or not result.get('prepay_id'):
+            return
+        ttl = self.ttl
+        timeExpire = values.get('time_expire')
+        if timeExpire:
+            ttl = min(ttl, WxPayPrepayCache._secondsUntil(timeExpire))
+        if ttl <= 0:
+            return
+        entry = (WxPayPrepayCache.fingerprint(values), dict(result), time.monotonic() + ttl)
+        with self._lock:
+            self._entries[outTradeNo] = entry
+            self._entries.move_to_end(outTradeNo)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+
+    # 删除订单的下单结果，订单关闭或已支付后调用
+    # @ param string outTradeNo 商户订单号
+    def invalidate(self, outTradeNo):
+        with self._lock:
+            self._entries.pop(outTradeNo, None)
+
+    # 获取计数：hits命中、misses未命中、changes订单参数变化后重新下单、size记录数
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'changes': self.changes,
+                'size': len(self._entries),
+            }
+
+    # 距订单失效时间（yyyyMMddHHmmss，北京时间）的秒数，格式不正确时不限制
+    @staticmethod
+    def _secondsUntil(timeExpire):
+        try:
+            expireAt = calendar.timegm(time.strptime(timeExpire, '%Y%m%d%H%M%S')) - WxPayPrepayCache.TIMEZONE_OFFSET
+        except (TypeError, ValueError):
+            return float('inf')
+        return expireAt - time.time()
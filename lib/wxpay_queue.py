@@ -0,0 +1,375 @@
+#
+# 支付通知持久化队列类
+#
+from .wxpay_config import WxPayConfig
+from .wxpay_exception import WxPayException
+from .wxpay_dedup import WxPayNotifyDedup
+
+import json, sqlite3, threading, time
+
+
+# 支付通知的本地持久化队列，验证通过的通知写入SQLite（WAL模式）后立即应答SUCCESS，
+# 由后台线程按自己的节奏调用业务处理，进程重启后继续处理未完成的通知。
+# 写入采用组提交：并发的put由一个写线程合并到同一个事务中提交，每批只需一次fsync，
+# put在所在批次落盘后返回。
+# 业务处理失败时按指数退避重试，超过maxAttempts后标记为失败，保留在库中供人工处理；
+# 处理中的通知带有租约，领取后（含同批等待处理的通知）由续约线程定期延长，进程异常退出后租约到期
+# 由其他线程（或进程）重新处理；调用业务处理前确认租约仍属于自己，处理结果也只在租约仍属于自己时写入。
+# 同一笔交易（去重键相同）只会入队一次，处理完成的记录保留keepSeconds秒用于去重
+# @ param string path 数据库文件路径
+# @ param function handler 业务处理函数，参数为通知参数字典，返回值同WxPayNotify.NotifyProcess
+# @ param int workers 后台处理线程数，为0时不启动，可调用processBatch自行处理
+# @ param int maxAttempts 最多处理次数
+# @ param float retryDelay 第一次重试的等待秒数，之后每次加倍，最长retryMaxDelay
+# @ param float lease 处理中通知的租约秒数，应大于单条通知的最长处理时间
+# @ param int keepSeconds 处理完成的记录保留秒数
+#
+# 使用方法:
+#   queue = WxPayNotifyQueue('/data/wxpay_notify.db', onPaid)
+#   application = WxPayNotifyApp(None, queue=queue)
+class WxPayNotifyQueue:
+    PENDING = 0
+    PROCESSING = 1
+    DONE = 2
+    FAILED = 3
+
+    # 每次组提交最多合并的通知数
+    MAX_BATCH = 256
+    # 每个处理线程每次领取的通知数
+    CLAIM_SIZE = 16
+    # 队列为空时处理线程的最长等待秒数
+    IDLE_WAIT = 1.0
+    # 清理处理完成的记录的间隔秒数
+    PURGE_INTERVAL = 600
+    # put等待落盘时检查写线程是否存活的间隔秒数
+    WRITER_CHECK_INTERVAL = 1.0
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS wxpay_notify ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " dedup_key TEXT UNIQUE,"
+        " data TEXT NOT NULL,"
+        " state INTEGER NOT NULL DEFAULT 0,"
+        " attempts INTEGER NOT NULL DEFAULT 0,"
+        " next_at REAL NOT NULL,"
+        " created_at REAL NOT NULL,"
+        " updated_at REAL NOT NULL,"
+        " last_error TEXT)",
+        "CREATE INDEX IF NOT EXISTS wxpay_notify_ready ON wxpay_notify (state, next_at)",
+    )
+
+    def __init__(self, path, handler, workers=None, maxAttempts=None, retryDelay=None,
+                 retryMaxDelay=None, lease=None, keepSeconds=None):
+        if workers is None:
+            workers = WxPayConfig.NOTIFY_QUEUE_WORKERS
+        if maxAttempts is None:
+            maxAttempts = WxPayConfig.NOTIFY_QUEUE_MAX_ATTEMPTS
+        if retryDelay is None:
+            retryDelay = WxPayConfig.NOTIFY_QUEUE_RETRY_DELAY
+        if retryMaxDelay is None:
+            retryMaxDelay = WxPayConfig.NOTIFY_QUEUE_RETRY_MAX_DELAY
+        if lease is None:
+            lease = WxPayConfig.NOTIFY_QUEUE_LEASE
+        if keepSeconds is None:
+            keepSeconds = WxPayConfig.NOTIFY_DEDUP_TTL
+        self.path = path
+        self.handler = handler
+        self.maxAttempts = maxAttempts
+        self.retryDelay = retryDelay
+        self.retryMaxDelay = retryMaxDelay
+        self.lease = lease
+        self.keepSeconds = keepSeconds
+
+        # 写线程使用的连接，创建时即检查数据库是否可用
+        connection = self._connect()
+        for statement in WxPayNotifyQueue.SCHEMA:
+            connection.execute(statement)
+
+        self.queued = 0
+        self.duplicate = 0
+        self.handled = 0
+        self.retried = 0
+        self.failed = 0
+        self.lost = 0
+        self.lastError = None
+
+        self._cond = threading.Condition(threading.Lock())
+        self._writes = []
+        self._closed = False
+        self._purgedAt = 0
+        # 已领取（等待处理及处理中）的通知，id -> 租约序号（领取后的attempts）
+        self._active = {}
+        self._writer = threading.Thread(target=self._writeLoop, args=(connection,),
+                                        name='WxPayNotifyQueueWriter', daemon=True)
+        self._writer.start()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._renewer = threading.Thread(target=self._renewLoop, name='WxPayNotifyQueueRenewer', daemon=True)
+        self._renewer.start()
+        self._workers = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._workLoop, name='WxPayNotifyQueue-%d' % i, daemon=True)
+            thread.start()
+            self._workers.append(thread)
+
+    # 写入一条验证通过的通知，落盘后返回
+    # @ param dict data 通知参数
+    # @ param string key 去重键，同一去重键只入队一次，默认WxPayNotifyDedup.key(data)
+    # @ throws WxPayException 写入失败
+    # @ return True为新入队，False为重复通知
+    def put(self, data, key=None):
+        if key is None:
+            key = WxPayNotifyDedup.key(data)
+        write = [key, json.dumps(data, ensure_ascii=False), threading.Event(), None]
+        with self._cond:
+            if self._closed:
+                raise WxPayException("通知队列已关闭！")
+            if not self._writer.is_alive():
+                raise WxPayException("通知队列写线程已退出！")
+            self._writes.append(write)
+            self._cond.notify()
+        # 写线程异常退出时不再等待
+        while not write[2].wait(WxPayNotifyQueue.WRITER_CHECK_INTERVAL):
+            if not self._writer.is_alive():
+                with self._cond:
+                    if write in self._writes:
+                        self._writes.remove(write)
+                raise WxPayException("通知队列写线程已退出！")
+        if isinstance(write[3], BaseException):
+            raise WxPayException("通知写入队列失败：" + str(write[3]))
+        with self._cond:
+            if write[3]:
+                self.queued += 1
+            else:
+                self.duplicate += 1
+        if write[3]:
+            self._wakeup.set()
+        return write[3]
+
+    # 领取并处理一批到期的通知，返回处理的条数
+    # @ param int limit 最多处理的条数
+    def processBatch(self, limit=None, connection=None):
+        ownConnection = connection is None
+        if ownConnection:
+            connection = self._connect()
+        try:
+            rows = self._claim(connection, limit or WxPayNotifyQueue.CLAIM_SIZE)
+            try:
+                for rowId, data, attempts in rows:
+                    # 领取时attempts已加1，作为本次租约的序号
+                    self._process(connection, rowId, json.loads(data), attempts + 1)
+            finally:
+                with self._cond:
+                    for row in rows:
+                        self._active.pop(row[0], None)
+            return len(rows)
+        finally:
+            if ownConnection:
+                connection.close()
+
+    # 获取计数：queued新入队、duplicate重复通知、handled处理成功、retried等待重试、
+    # failed超过最多处理次数、lost租约已被重新领取而放弃的处理，以及库中各状态的记录数
+    def stats(self):
+        connection = self._connect()
+        try:
+            counts = dict(connection.execute("SELECT state, COUNT(*) FROM wxpay_notify GROUP BY state"))
+        finally:
+            connection.close()
+        with self._cond:
+            return {
+                'queued': self.queued,
+                'duplicate': self.duplicate,
+                'handled': self.handled,
+                'retried': self.retried,
+                'failed': self.failed,
+                'lost': self.lost,
+                'pending': counts.get(WxPayNotifyQueue.PENDING, 0),
+                'processing': counts.get(WxPayNotifyQueue.PROCESSING, 0),
+                'done': counts.get(WxPayNotifyQueue.DONE, 0),
+                'dead': counts.get(WxPayNotifyQueue.FAILED, 0),
+            }
+
+    # 停止写线程及处理线程，已领取的通知处理完后返回
+    # @ param float timeout 等待各线程退出的秒数
+    def close(self, timeout=None):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._wakeup.set()
+        self._writer.join(timeout)
+        for thread in self._workers:
+            thread.join(timeout)
+        self._stopped.set()
+        self._renewer.join(timeout)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # 应答SUCCESS前必须已经落盘
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    # 写线程：每次取出全部等待写入的通知，在一个事务中提交
+    def _writeLoop(self, connection):
+        batch = []
+        try:
+            while True:
+                with self._cond:
+                    while not self._writes and not self._closed:
+                        self._cond.wait()
+                    if not self._writes:
+                        return
+                    batch = self._writes[:WxPayNotifyQueue.MAX_BATCH]
+                    del self._writes[:WxPayNotifyQueue.MAX_BATCH]
+                self._commit(connection, batch)
+                batch = []
+        except BaseException as e:
+            # 写线程异常退出，正在提交及等待中的put全部失败
+            with self._cond:
+                batch = batch + self._writes
+                self._writes = []
+                self.lastError = e
+            for write in batch:
+                write[3] = e
+                write[2].set()
+            raise
+        finally:
+            connection.close()
+
+    def _commit(self, connection, batch):
+        now = time.time()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for write in batch:
+                    cursor = connection.execute(
+                        "INSERT OR IGNORE INTO wxpay_notify (dedup_key, data, next_at, created_at, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?)", (write[0], write[1], now, now, now))
+                    write[3] = cursor.rowcount == 1
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            for write in batch:
+                write[3] = e
+        for write in batch:
+            write[2].set()
+
+    # 处理线程
+    def _workLoop(self):
+        connection = self._connect()
+        try:
+            while not self._closed:
+                try:
+                    count = self.processBatch(connection=connection)
+                    self._purge(connection)
+                except sqlite3.Error as e:
+                    self.lastError = e
+                    count = 0
+                if count == 0:
+                    self._wakeup.wait(WxPayNotifyQueue.IDLE_WAIT)
+                    self._wakeup.clear()
+        finally:
+            connection.close()
+
+    # 领取到期的待处理通知及租约到期的处理中通知，领取的通知全部加入续约
+    def _claim(self, connection, limit):
+        now = time.time()
+        rows = None
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT id, data, attempts FROM wxpay_notify"
+                " WHERE state IN (?, ?) AND next_at <= ? ORDER BY next_at LIMIT ?",
+                (WxPayNotifyQueue.PENDING, WxPayNotifyQueue.PROCESSING, now, limit)).fetchall()
+            if rows:
+                connection.executemany(
+                    "UPDATE wxpay_notify SET state = ?, attempts = attempts + 1, next_at = ?, updated_at = ?"
+                    " WHERE id = ?",
+                    [(WxPayNotifyQueue.PROCESSING, now + self.lease, now, row[0]) for row in rows])
+                with self._cond:
+                    for rowId, data, attempts in rows:
+                        self._active[rowId] = attempts + 1
+            connection.execute("COMMIT")
+        except BaseException:
+            with self._cond:
+                for row in rows or ():
+                    self._active.pop(row[0], None)
+            connection.execute("ROLLBACK")
+            raise
+        return rows
+
+    # 调用业务处理并记录结果，租约已被其他线程（或进程）重新领取时不写入
+    # @ param int attempts 领取后的处理次数，同时作为租约序号
+    def _process(self, connection, rowId, data, attempts):
+        lease = (rowId, WxPayNotifyQueue.PROCESSING, attempts)
+        # 确认租约仍属于自己并重新计时，已被其他线程（或进程）领取时不再处理
+        cursor = connection.execute("UPDATE wxpay_notify SET next_at = ? WHERE id = ? AND state = ? AND attempts = ?",
+                                    (time.time() + self.lease,) + lease)
+        if cursor.rowcount != 1:
+            return self._count('lost')
+        error = None
+        try:
+            ok = self.handler(data) is not False
+        except Exception as e:
+            ok = False
+            error = e
+        finally:
+            with self._cond:
+                self._active.pop(rowId, None)
+        now = time.time()
+        if ok:
+            cursor = connection.execute(
+                "UPDATE wxpay_notify SET state = ?, data = '', updated_at = ?, last_error = NULL"
+                " WHERE id = ? AND state = ? AND attempts = ?", (WxPayNotifyQueue.DONE, now) + lease)
+            return self._count('handled' if cursor.rowcount == 1 else 'lost')
+        message = str(error) if error is not None else "FAIL"
+        if attempts >= self.maxAttempts:
+            cursor = connection.execute("UPDATE wxpay_notify SET state = ?, updated_at = ?, last_error = ?"
+                                        " WHERE id = ? AND state = ? AND attempts = ?",
+                                        (WxPayNotifyQueue.FAILED, now, message) + lease)
+            return self._count('failed' if cursor.rowcount == 1 else 'lost', error)
+        delay = min(self.retryDelay * 2 ** (attempts - 1), self.retryMaxDelay)
+        cursor = connection.execute("UPDATE wxpay_notify SET state = ?, next_at = ?, updated_at = ?, last_error = ?"
+                                    " WHERE id = ? AND state = ? AND attempts = ?",
+                                    (WxPayNotifyQueue.PENDING, now + delay, now, message) + lease)
+        self._count('retried' if cursor.rowcount == 1 else 'lost', error)
+
+    def _count(self, name, error=None):
+        with self._cond:
+            setattr(self, name, getattr(self, name) + 1)
+            if error is not None:
+                self.lastError = error
+
+    # 续约线程：每隔三分之一租约延长已领取（等待处理及处理中）的通知的租约，业务处理超过lease秒时不会被重复领取
+    def _renewLoop(self):
+        connection = None
+        try:
+            while not self._stopped.wait(self.lease / 3.0):
+                with self._cond:
+                    active = list(self._active.items())
+                if not active:
+                    continue
+                if connection is None:
+                    connection = self._connect()
+                now = time.time()
+                try:
+                    connection.executemany(
+                        "UPDATE wxpay_notify SET next_at = ? WHERE id = ? AND state = ? AND attempts = ?",
+                        [(now + self.lease, rowId, WxPayNotifyQueue.PROCESSING, attempts)
+                         for rowId, attempts in active])
+                except sqlite3.Error as e:
+                    self.lastError = e
+        finally:
+            if connection is not None:
+                connection.close()
+
+    # 定期删除超过保留时间的已完成记录
+    def _purge(self, connection):
+        now = time.time()
+        if now - self._purgedAt < WxPayNotifyQueue.PURGE_INTERVAL:
+            return
+        self._purgedAt = now
+        connection.execute("DELETE FROM wxpay_notify WHERE state = ? AND updated_at < ?",
+                           (WxPayNotifyQueue.DONE, now - self.keepSeconds))
@@ -0,0 +1,142 @@
+#
+# 后台测速上报类
+#
+from .wxpay_config import WxPayConfig
+
+import collections, os, threading
+
+
+# 后台批量上报对象，接口调用只负责把上报数据放入有界内存队列，
+# 由后台线程批量取出后调用上报接口发送，上报永远不会阻塞支付请求。
+# 队列满时直接丢弃新的上报；积压超过队列一半时，同一批次中
+# 接口、返回状态码、业务结果、错误码都相同的上报合并为一条，耗时取平均值
+# @ param function sender 发送单条上报的函数，参数为WxPayReport
+# @ param int maxQueue 队列最大长度
+# @ param int batchSize 每批最多取出的上报条数
+class WxPayReporter:
+    def __init__(self, sender, maxQueue=None, batchSize=None):
+        if maxQueue is None:
+            maxQueue = WxPayConfig.REPORT_QUEUE_SIZE
+        if batchSize is None:
+            batchSize = WxPayConfig.REPORT_BATCH_SIZE
+        self.sender = sender
+        self.maxQueue = maxQueue
+        self.batchSize = batchSize
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._busy = False
+
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.aggregated = 0
+
+    # 放入一条上报数据，队列已满时丢弃并返回False
+    # @ param WxPayReport $objInput
+    def put(self, objInput):
+        with self._cond:
+            if self._closed or len(self._queue) >= self.maxQueue:
+                self.dropped += 1
+                return False
+            self._queue.append(objInput)
+            self.queued += 1
+            self._ensureWorker()
+            self._cond.notify()
+        return True
+
+    # 获取上报计数：queued已入队、sent已发送、dropped已丢弃、
+    # failed发送失败、aggregated被合并的条数、pending当前积压
+    def stats(self):
+        with self._cond:
+            return {
+                'queued': self.queued,
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'aggregated': self.aggregated,
+                'pending': len(self._queue),
+            }
+
+    # 等待当前积压的上报发送完成
+    # @ param float timeout 最长等待秒数，None表示一直等待
+    def flush(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._busy, timeout)
+
+    # 停止后台线程，未发送的上报在timeout内尽量发送完
+    def close(self, timeout=None):
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    # 后台线程在fork后不会被复制，子进程中首次上报时重新启动
+    def _ensureWorker(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        self._pid = pid
+        self._busy = False
+        self._thread = threading.Thread(target=self._run, name='WxPayReporter', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                batch = []
+                while self._queue and len(batch) < self.batchSize:
+                    batch.append(self._queue.popleft())
+                pressure = len(self._queue) >= self.maxQueue // 2
+                self._busy = True
+
+            if pressure:
+                batch = self._aggregate(batch)
+            for objInput in batch:
+                try:
+                    self.sender(objInput)
+                    ok = True
+                except Exception as e:
+                    # 上报失败不做任何处理，仅计数
+                    ok = False
+                with self._cond:
+                    if ok:
+                        self.sent += 1
+                    else:
+                        self.failed += 1
+
+    # 合并同类上报，耗时取平均值
+    def _aggregate(self, batch):
+        groups = collections.OrderedDict()
+        for objInput in batch:
+            values = objInput.GetValues()
+            key = (values.get('interface_url'), values.get('return_code'),
+                   values.get('result_code'), values.get('err_code'))
+            groups.setdefault(key, []).append(objInput)
+
+        result = []
+        merged = 0
+        for items in groups.values():
+            objInput = items[0]
+            if len(items) > 1:
+                total = sum(int(item.GetValues().get('execute_time_', 0)) for item in items)
+                objInput.SetExecute_time_(total // len(items))
+                merged += len(items) - 1
+            result.append(objInput)
+        if merged:
+            with self._cond:
+                self.aggregated += merged
+        return result
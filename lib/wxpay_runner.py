@@ -0,0 +1,359 @@
+#
+# 支付通知多进程运行类
+#
+from .wxpay_config import WxPayConfig
+from .wxpay_exception import WxPayException
+from .wxpay_api import WxPayApi
+from .wxpay_sign import WxPaySigner
+from .wxpay_template import WxPayRequestTemplate
+from .wxpay_metrics import WxPayMetrics
+
+import json, os, select, shutil, signal, socket, sys, tempfile, threading, time, traceback
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+
+# 预先fork多个工作进程处理支付通知，验证签名等CPU密集的工作分散到多个核上。
+# 主进程绑定监听端口、加载WxPayConfig及商户密钥、证书后再fork，各工作进程共用同一个监听socket；
+# 主进程只负责监控，工作进程退出后自动重新启动，收到SIGTERM或SIGINT时通知各工作进程处理完在途请求后退出。
+# 应用在工作进程中由appFactory创建，线程池、持久化队列的线程等都在fork之后启动。
+# 各进程之间的去重通过共享存储实现，如WxPaySqliteDedupBackend(runner.statePath('dedup.db'))；
+# 各进程定期把WxPayApi.metrics及应用的stats()写入stateDir，访问metricsPath时返回所有进程汇总的统计
+# @ param function appFactory 无参数的函数，返回WSGI应用（如WxPayNotifyApp），在每个工作进程中调用一次
+# @ param string host 监听地址
+# @ param int port 监听端口，为0时由系统分配，可通过address获取
+# @ param int processes 工作进程数，默认WxPayConfig.NOTIFY_PROCESSES，为None时等于CPU核数
+# @ param string stateDir 进程间共享的状态目录，默认创建临时目录，退出时删除
+# @ param string metricsPath 汇总统计的访问路径，为None时不提供
+# @ param int backlog 监听队列长度
+#
+# 使用方法:
+#   runner = WxPayNotifyRunner(lambda: WxPayNotifyApp(onPaid,
+#       dedup=WxPayNotifyDedup(backend=WxPaySqliteDedupBackend('/data/wxpay_dedup.db'))), port=8080)
+#   runner.run()
+class WxPayNotifyRunner:
+    # 工作进程启动后很快退出时，重新启动前等待的秒数，避免反复fork
+    RESPAWN_DELAY = 1.0
+    # 工作进程启动后运行不足该秒数即退出视为启动失败
+    MIN_UPTIME = 1.0
+    # stats()中的瞬时值，不跨进程累加，不计入汇总统计
+    GAUGES = ('pending', 'size')
+
+    def __init__(self, appFactory, host='0.0.0.0', port=8080, processes=None, stateDir=None,
+                 metricsPath='/metrics', backlog=1024):
+        if processes is None:
+            processes = WxPayConfig.NOTIFY_PROCESSES or os.cpu_count() or 1
+        if processes < 1:
+            raise WxPayException("工作进程数必须大于0！")
+        self.appFactory = appFactory
+        self.host = host
+        self.port = port
+        self.processes = processes
+        self.metricsPath = metricsPath
+        self.backlog = backlog
+        self.ownStateDir = stateDir is None
+        self.stateDir = tempfile.mkdtemp(prefix='wxpay-notify-') if stateDir is None else stateDir
+        os.makedirs(self.stateDir, exist_ok=True)
+        self.socket = None
+        self.address = None
+        # pid -> (进程序号, 启动时间)
+        self._workers = {}
+        self._stopping = False
+        self._wakeup = None
+
+    # 状态目录下的文件路径，用于在appFactory中创建各进程共享的去重库、队列库等
+    def statePath(self, name):
+        return os.path.join(self.stateDir, name)
+
+    # 绑定监听端口，run时自动调用；需要在启动前获取实际端口时可以先调用
+    def bind(self):
+        if self.socket is not None:
+            return self.address
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.host, self.port))
+            sock.listen(self.backlog)
+        except OSError as e:
+            sock.close()
+            raise WxPayException("监听" + str(self.host) + ":" + str(self.port) + "出错，错误信息:" + str(e))
+        # 多个进程在同一个socket上accept，没有抢到连接的进程立即返回而不是阻塞
+        sock.setblocking(False)
+        self.socket = sock
+        self.address = sock.getsockname()[:2]
+        return self.address
+
+    # fork前加载商户密钥、请求模板及证书，各工作进程直接共用（写时复制）
+    @staticmethod
+    def preload():
+        WxPaySigner.getDefault()
+        for name in WxPayRequestTemplate._FACTORIES:
+            WxPayRequestTemplate.getDefault(name)
+        if os.path.exists(WxPayConfig.SSLCERT_PATH) and os.path.exists(WxPayConfig.SSLKEY_PATH):
+            WxPayApi.getCertTransport()
+
+    # 启动工作进程并监控，直到收到SIGTERM或SIGINT，所有工作进程退出后返回
+    def run(self):
+        self.bind()
+        WxPayNotifyRunner.preload()
+        # 信号处理函数只写入唤醒管道，主循环在select中等待
+        readFd, writeFd = os.pipe()
+        os.set_blocking(readFd, False)
+        os.set_blocking(writeFd, False)
+        self._wakeup = (readFd, writeFd)
+        previous = {}
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            previous[signum] = signal.signal(signum, self._onSignal)
+        oldWakeupFd = signal.set_wakeup_fd(writeFd)
+        try:
+            self._supervise()
+        finally:
+            signal.set_wakeup_fd(oldWakeupFd)
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            os.close(readFd)
+            os.close(writeFd)
+            self._wakeup = None
+            self.socket.close()
+            self.socket = None
+            if self.ownStateDir:
+                shutil.rmtree(self.stateDir, ignore_errors=True)
+
+    # 通知主进程停止，可在其他线程中调用
+    def stop(self):
+        self._stopping = True
+        if self._wakeup is not None:
+            try:
+                os.write(self._wakeup[1], b'\0')
+            except OSError:
+                pass
+
+    # 所有进程汇总的统计，Prometheus文本格式
+    def exposition(self):
+        metrics = WxPayMetrics(WxPayApi.metrics.buckets)
+        events = {}
+        for name in os.listdir(self.stateDir):
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.stateDir, name), 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            metrics.merge(state.get('metrics', ()))
+            for event, count in state.get('stats', {}).items():
+                events[event] = events.get(event, 0) + count
+        lines = [metrics.exposition()]
+        if events:
+            lines.append('# HELP wxpay_notify_events_total Payment notify events of all worker processes.\n'
+                         '# TYPE wxpay_notify_events_total counter\n')
+            for event in sorted(events):
+                if event not in WxPayNotifyRunner.GAUGES:
+                    lines.append('wxpay_notify_events_total{event="%s"} %d\n' % (event, events[event]))
+        return ''.join(lines)
+
+    def _onSignal(self, signum, frame):
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            self._stopping = True
+
+    def _supervise(self):
+        slots = list(range(self.processes))
+        # 进程序号 -> 允许再次启动的时间
+        delays = {}
+        while True:
+            self._reap(slots, delays)
+            if self._stopping:
+                break
+            now = time.monotonic()
+            for index in sorted(slots):
+                if delays.get(index, 0) <= now:
+                    slots.remove(index)
+                    self._spawn(index)
+            waits = [delays[index] for index in slots if index in delays]
+            timeout = max(0.0, min(waits) - now) if waits else None
+            try:
+                select.select([self._wakeup[0]], [], [], timeout)
+            except InterruptedError:
+                pass
+            self._drainWakeup()
+        # 通知工作进程退出，工作进程处理完在途请求后退出
+        for pid in list(self._workers):
+            WxPayNotifyRunner._kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + WxPayConfig.NOTIFY_GRACE_TIMEOUT
+        while self._workers and time.monotonic() < deadline:
+            self._reap(None, None)
+            if self._workers:
+                try:
+                    select.select([self._wakeup[0]], [], [], 0.1)
+                except InterruptedError:
+                    pass
+                self._drainWakeup()
+        for pid in list(self._workers):
+            WxPayNotifyRunner._kill(pid, signal.SIGKILL)
+        while self._workers:
+            pid, status = os.waitpid(-1, 0)
+            self._workers.pop(pid, None)
+
+    # 回收已退出的工作进程，需要重新启动的放回slots
+    def _reap(self, slots, delays):
+        while self._workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._workers.clear()
+                return
+            if pid == 0:
+                return
+            worker = self._workers.pop(pid, None)
+            if worker is None or slots is None:
+                continue
+            index, startedAt = worker
+            now = time.monotonic()
+            if now - startedAt < WxPayNotifyRunner.MIN_UPTIME:
+                delays[index] = now + WxPayNotifyRunner.RESPAWN_DELAY
+            else:
+                delays.pop(index, None)
+            slots.append(index)
+
+    def _drainWakeup(self):
+        try:
+            while os.read(self._wakeup[0], 4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    @staticmethod
+    def _kill(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid:
+            self._workers[pid] = (index, time.monotonic())
+            return
+        code = 0
+        try:
+            self._serve(index)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    # 工作进程：在继承的监听socket上提供WSGI服务
+    def _serve(self, index):
+        signal.set_wakeup_fd(-1)
+        os.close(self._wakeup[0])
+        os.close(self._wakeup[1])
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        # 终端的Ctrl-C同时发给整个进程组，由主进程统一通知退出
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        WxPayApi.metrics.reset()
+
+        app = self.appFactory()
+        statePath = self.statePath('metrics-%d.json' % index)
+        worker = _WxPayNotifyWorker(self, app, statePath)
+        server = _WxPayWSGIServer(self.socket, self.address, worker)
+        stopped = threading.Event()
+
+        def onTerm(signum, frame):
+            if not stopped.is_set():
+                stopped.set()
+                # shutdown会等待serve_forever退出，不能在serve_forever所在线程中直接调用
+                threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, onTerm)
+        exporter = threading.Thread(target=worker.exportLoop, args=(stopped,), daemon=True)
+        exporter.start()
+        try:
+            server.serve_forever(poll_interval=0.5)
+        finally:
+            stopped.set()
+            server.server_close()
+            if hasattr(app, 'close'):
+                app.close()
+            worker.export()
+
+
+# 工作进程中的应用包装，提供汇总统计的访问路径，并定期导出本进程的统计
+class _WxPayNotifyWorker:
+    def __init__(self, runner, app, statePath):
+        self.runner = runner
+        self.app = app
+        self.statePath = statePath
+        self._lock = threading.Lock()
+        # 同一序号的进程重新启动时接着之前的计数累加，汇总的计数不会变小
+        self.base = _WxPayNotifyWorker._load(statePath)
+
+    def __call__(self, environ, start_response):
+        path = self.runner.metricsPath
+        if path is not None and environ.get('PATH_INFO') == path and environ.get('REQUEST_METHOD') == 'GET':
+            self.export()
+            body = self.runner.exposition().encode('utf-8')
+            start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                                      ('Content-Length', str(len(body)))])
+            return [body]
+        return self.app(environ, start_response)
+
+    # 把本进程的统计写入状态目录
+    def export(self):
+        metrics = WxPayMetrics(WxPayApi.metrics.buckets)
+        metrics.merge(self.base.get('metrics', ()))
+        metrics.merge(WxPayApi.metrics.snapshot())
+        stats = dict(self.base.get('stats', {}))
+        if hasattr(self.app, 'stats'):
+            for event, count in self.app.stats().items():
+                stats[event] = stats.get(event, 0) + count
+        data = json.dumps({'pid': os.getpid(), 'metrics': metrics.snapshot(), 'stats': stats})
+        with self._lock:
+            temp = '%s.%d.tmp' % (self.statePath, os.getpid())
+            with open(temp, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp, self.statePath)
+
+    def exportLoop(self, stopped):
+        while not stopped.wait(WxPayConfig.NOTIFY_METRICS_INTERVAL):
+            try:
+                self.export()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _load(statePath):
+        try:
+            with open(statePath, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        stats = state.get('stats', {})
+        for gauge in WxPayNotifyRunner.GAUGES:
+            stats.pop(gauge, None)
+        return {'metrics': state.get('metrics', []), 'stats': stats}
+
+
+class _WxPayRequestHandler(WSGIRequestHandler):
+    # 不逐条输出访问日志
+    def log_message(self, format, *args):
+        pass
+
+
+# 使用已绑定的监听socket的多线程WSGI服务器，退出时等待在途的请求处理完成
+class _WxPayWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, sock, address, app):
+        WSGIServer.__init__(self, address, _WxPayRequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.server_address = address
+        self.server_name = address[0]
+        self.server_port = address[1]
+        self.setup_environ()
+        self.set_app(app)
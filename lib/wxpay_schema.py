@@ -0,0 +1,129 @@
+#
+# 数据对象字段定义类
+#
+from .wxpay_exception import WxPayException
+from .wxpay_xml import WxPayXmlWriter
+
+import operator
+
+
+# 单个参数的定义
+# @ param string name 参数名
+# @ param string label 参数说明
+# @ param string type 参数类型，WxPayField.STRING或WxPayField.INT
+# @ param int maxLength 最大长度，None表示不限制
+# @ param bool required 是否必填。appid、mch_id、nonce_str等由WxPayApi填充的参数不标记必填
+# @ param string method 生成方法名时使用的名称，默认为参数名首字母大写，如out_trade_no对应SetOut_trade_no
+class WxPayField:
+    STRING = 'String'
+    INT = 'Int'
+
+    def __init__(self, name, label, type=STRING, maxLength=None, required=False, method=None):
+        self.name = name
+        self.label = label
+        self.type = type
+        self.maxLength = maxLength
+        self.required = required
+        if method is None:
+            method = name[0].upper() + name[1:]
+        self.method = method
+
+    # 生成Set/Get/Is方法，返回(方法名, 函数)列表
+    def accessors(self, className):
+        name = self.name
+
+        def setter(self, value):
+            setattr(self, name, value)
+
+        # 未设置（None）时与原来读取values字典一致，抛出KeyError
+        def getter(self):
+            value = getattr(self, name)
+            if value is None:
+                raise KeyError(name)
+            return value
+
+        def checker(self):
+            return getattr(self, name) is not None
+
+        result = []
+        for prefix, suffix, function, doc in (('Set', '', setter, "设置"),
+                                              ('Get', '', getter, "获取"),
+                                              ('Is', 'Set', checker, "判断是否设置了")):
+            function.__name__ = prefix + self.method + suffix
+            function.__qualname__ = className + "." + function.__name__
+            function.__doc__ = doc + self.label
+            result.append((function.__name__, function))
+        return result
+
+
+# 一个接口的全部参数定义及参数规则，必填、关联参数、类型与长度检查在类定义时整理为元组，
+# Validate时按顺序检查一遍
+# @ param string label 接口名称，用于异常信息
+# @ param tuple fields WxPayField列表，顺序即输出xml时的参数顺序
+# @ param tuple oneOf 至少填写一个的参数组，如(('transaction_id', 'out_trade_no'),)
+# @ param tuple requiredIf 关联必填参数，每项为(参数, 取值, 必填参数)，如(('trade_type', 'JSAPI', 'openid'),)
+class WxPaySchema:
+    def __init__(self, label, fields, oneOf=(), requiredIf=()):
+        self.label = label
+        self.fields = tuple(fields)
+        self.names = tuple(field.name for field in self.fields)
+        self.required = tuple(field.name for field in self.fields if field.required)
+        self.oneOf = tuple(tuple(names) for names in oneOf)
+        self.requiredIf = tuple(requiredIf)
+        self.formats = tuple((field.name, field.type == WxPayField.INT, field.maxLength)
+                             for field in self.fields
+                             if field.type == WxPayField.INT or field.maxLength is not None)
+        # 数据对象的全部字段，含sign
+        self.slots = self.names + ('sign',)
+        # 一次读出全部字段的值，按slots顺序返回元组
+        self.getter = operator.attrgetter(*self.slots)
+        # 签名按参数名字典序拼接，预先排好顺序
+        self.signNames = tuple(sorted(self.names))
+        self.signGetter = operator.attrgetter(*self.signNames)
+        # 预先生成全部参数（含sign）标签片段的xml输出
+        self.writer = WxPayXmlWriter(self.slots)
+
+    # 检查数据对象的参数，不通过时抛出异常
+    # @ throws WxPayException
+    def validate(self, obj):
+        self.validateValues(obj.values)
+
+    # 检查参数字典，不通过时抛出异常
+    # @ param dict values 已设置的参数
+    # @ throws WxPayException
+    def validateValues(self, values):
+        for name in self.required:
+            if name not in values:
+                raise WxPayException(self.label + "中，缺少必填参数" + name + "！")
+        for names in self.oneOf:
+            for name in names:
+                if name in values:
+                    break
+            else:
+                raise WxPayException(self.label + "中，" + "、".join(names) + "至少填一个！")
+        for name, value, required in self.requiredIf:
+            if values.get(name) == value and required not in values:
+                raise WxPayException(self.label + "中，缺少必填参数" + required + "！" +
+                                     name + "为" + value + "时，" + required + "为必填参数！")
+        for name, numeric, maxLength in self.formats:
+            value = values.get(name)
+            if value is None:
+                continue
+            if numeric:
+                if isinstance(value, bool) or not (isinstance(value, int) or str(value).isdigit()):
+                    raise WxPayException(self.label + "中，参数" + name + "必须为整数！")
+            elif len(str(value)) > maxLength:
+                raise WxPayException(self.label + "中，参数" + name + "长度不能超过" + str(maxLength) + "！")
+
+
+# 数据对象的元类：类中定义了SCHEMA时按字段生成__slots__（含sign）及Set/Get/Is方法，
+# 类中手写的同名方法优先
+class WxPayDataMeta(type):
+    def __new__(mcs, name, bases, namespace):
+        schema = namespace.get('SCHEMA')
+        if schema is not None:
+            namespace['__slots__'] = schema.slots
+            for field in schema.fields:
+                for methodName, function in field.accessors(name):
+                    namespace.setdefault(methodName, function)
+        return type.__new__(mcs, name, bases, namespace)
@@ -0,0 +1,81 @@
+#
+# 签名类
+#
+from .wxpay_config import WxPayConfig
+from .wxpay_exception import WxPayException
+
+import hashlib, hmac, threading
+
+
+# 签名生成与验证，支持MD5与HMAC-SHA256两种签名类型。
+# 商户密钥只编码一次，HMAC-SHA256预先用密钥初始化，每次签名从副本开始计算；
+# 验证签名使用常量时间比较
+# @ param string key 商户支付密钥，默认WxPayConfig.__KEY__
+class WxPaySigner:
+    MD5 = 'MD5'
+    HMAC_SHA256 = 'HMAC-SHA256'
+
+    # 按WxPayConfig.__KEY__创建的共用对象
+    _default = None
+    _defaultLock = threading.Lock()
+
+    def __init__(self, key=None):
+        if key is None:
+            key = WxPayConfig.__KEY__
+        self.key = key
+        encoded = key.encode('utf-8')
+        self._keySuffix = b'&key=' + encoded
+        self._hmac = hmac.new(encoded, digestmod=hashlib.sha256)
+
+    # 获取共用的签名对象，WxPayConfig.__KEY__修改后自动重新创建
+    @staticmethod
+    def getDefault():
+        signer = WxPaySigner._default
+        if signer is None or signer.key != WxPayConfig.__KEY__:
+            with WxPaySigner._defaultLock:
+                signer = WxPaySigner._default
+                if signer is None or signer.key != WxPayConfig.__KEY__:
+                    signer = WxPaySigner()
+                    WxPaySigner._default = signer
+        return signer
+
+    # 生成签名
+    # @ param iterable items 按参数名字典序排列的(参数名, 值)序列，sign及空值不参与签名
+    # @ param string signType 签名类型，MD5或HMAC-SHA256
+    # @ return 大写的签名
+    def sign(self, items, signType=MD5):
+        # 签名步骤一、二：拼接参数，在后面加入KEY
+        data = self.canonical(items) + self._keySuffix
+        # 签名步骤三：MD5或HMAC-SHA256加密
+        if signType == WxPaySigner.MD5:
+            digest = hashlib.md5(data)
+        elif signType == WxPaySigner.HMAC_SHA256:
+            digest = self._hmac.copy()
+            digest.update(data)
+        else:
+            raise WxPayException("不支持的签名类型" + str(signType) + "！")
+        # 签名步骤四：所有字符转为大写
+        return digest.hexdigest().upper()
+
+    # 验证签名
+    # @ param iterable items 同sign
+    # @ param string sign 待验证的签名
+    # @ param string signType 签名类型，MD5或HMAC-SHA256
+    # @ return bool
+    def verify(self, items, sign, signType=MD5):
+        if not isinstance(sign, str):
+            return False
+        return hmac.compare_digest(self.sign(items, signType).encode('ascii'), sign.encode('utf-8'))
+
+    # 拼接待签名的字节串：key1=value1&key2=value2
+    @staticmethod
+    def canonical(items):
+        parts = []
+        append = parts.append
+        for key, value in items:
+            if key == 'sign' or value is None or value == '' or isinstance(value, dict):
+                continue
+            if type(value) is not str:
+                value = str(value)
+            append(key + '=' + value)
+        return '&'.join(parts).encode('utf-8')
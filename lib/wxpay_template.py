@@ -0,0 +1,125 @@
+#
+# 请求模板类
+#
+from .wxpay_config import WxPayConfig
+from .wxpay_exception import WxPayException
+from .wxpay_data import WxPayUnifiedOrder, WxPayOrderQuery
+from .wxpay_id import WxPayIdGenerator
+from .wxpay_sign import WxPaySigner
+from .wxpay_metrics import WxPayMetrics
+
+import threading
+
+
+# 预先填好商户固定参数的请求模板，创建后不可修改，可以在多个线程中共用。
+# 每次生成请求时依次合并默认参数、调用方的订单参数、固定参数及随机字符串，
+# 检查、签名并输出xml，调用方传入的对象不会被修改
+# @ param class dataClass 请求数据类，如WxPayUnifiedOrder
+# @ param string url 接口url
+# @ param dict fixed 固定参数，覆盖调用方设置的值，如appid、mch_id
+# @ param dict defaults 默认参数，调用方未设置时使用，如notify_url
+#
+# 使用方法:
+#   template = WxPayRequestTemplate.getDefault('unifiedOrder')
+#   url, xml = template.build(out_trade_no="...", body="...", total_fee=1, trade_type="NATIVE", product_id="1")
+class WxPayRequestTemplate:
+    __slots__ = ('dataClass', 'url', 'fixed', 'defaults', 'configKey')
+
+    # 按WxPayConfig创建的共用模板
+    _defaults = {}
+    _defaultLock = threading.Lock()
+
+    def __init__(self, dataClass, url, fixed=None, defaults=None, configKey=None):
+        names = set(dataClass.SCHEMA.names)
+        for key in list(fixed or ()) + list(defaults or ()):
+            if key not in names:
+                raise WxPayException("参数" + key + "不存在！")
+        setter = object.__setattr__
+        setter(self, 'dataClass', dataClass)
+        setter(self, 'url', url)
+        setter(self, 'fixed', tuple((fixed or {}).items()))
+        setter(self, 'defaults', tuple((defaults or {}).items()))
+        setter(self, 'configKey', configKey)
+
+    def __setattr__(self, key, value):
+        raise WxPayException("请求模板不能修改！")
+
+    def __delattr__(self, key):
+        raise WxPayException("请求模板不能修改！")
+
+    # 获取共用的模板，WxPayConfig中的商户参数修改后自动重新创建
+    # @ param string name unifiedOrder或orderQuery
+    @staticmethod
+    def getDefault(name):
+        factory = WxPayRequestTemplate._FACTORIES.get(name)
+        if factory is None:
+            raise WxPayException("不存在" + str(name) + "接口的请求模板！")
+        configKey = WxPayRequestTemplate._configKey()
+        template = WxPayRequestTemplate._defaults.get(name)
+        if template is None or template.configKey != configKey:
+            with WxPayRequestTemplate._defaultLock:
+                template = WxPayRequestTemplate._defaults.get(name)
+                if template is None or template.configKey != configKey:
+                    template = factory(configKey)
+                    WxPayRequestTemplate._defaults[name] = template
+        return template
+
+    # 生成签名后的请求。参数直接合并在字典中检查、签名、输出，不创建请求对象
+    # @ param WxPayDataBase inputObj 订单参数对象，只读取不修改
+    # @ param fields 订单参数，与inputObj同时传入时优先
+    # @ throws WxPayException
+    # @ return (url, xml字节串)
+    def build(self, inputObj=None, **fields):
+        schema = self.dataClass.SCHEMA
+        values = dict(self.defaults)
+        if inputObj is not None:
+            if not isinstance(inputObj, self.dataClass):
+                raise WxPayException("请求模板需要" + self.dataClass.__name__ + "对象！")
+            values.update(inputObj.values)
+        if fields:
+            for key in fields:
+                if key not in schema.names:
+                    raise WxPayException("参数" + key + "不存在！")
+            values.update(fields)
+        values.pop('sign', None)
+        # 检测必填参数
+        schema.validateValues(values)
+        values.update(self.fixed)
+        values['nonce_str'] = WxPayIdGenerator.getDefault().nonce(32)  # 随机字符串
+        # 签名
+        with WxPayMetrics.phase('sign'):
+            sign = WxPaySigner.getDefault().sign(sorted(values.items()),
+                                                 values.get('sign_type') or WxPaySigner.MD5)
+        with WxPayMetrics.phase('serialize'):
+            xml = schema.writer.write([(key, values.get(key)) for key in schema.names] + [('sign', sign)])
+        return self.url, xml
+
+    @staticmethod
+    def _configKey():
+        return WxPayConfig.__APPID__, WxPayConfig.__MCHID__, WxPayConfig.__NOTIFY_URL__
+
+    # 统一下单模板。终端IP用于微信的风控，调用方设置的用户端IP优先，未设置时为1.1.1.1
+    @staticmethod
+    def _unifiedOrder(configKey):
+        appid, mchid, notifyUrl = configKey
+        return WxPayRequestTemplate(WxPayUnifiedOrder, 'https://api.mch.weixin.qq.com/pay/unifiedorder',
+                                    fixed={'appid': appid,  # 公众账号ID
+                                           'mch_id': mchid},  # 商户号
+                                    defaults={'notify_url': notifyUrl,  # 异步通知url
+                                              'spbill_create_ip': "1.1.1.1"},  # 终端IP
+                                    configKey=configKey)
+
+    # 查询订单模板
+    @staticmethod
+    def _orderQuery(configKey):
+        appid, mchid, notifyUrl = configKey
+        return WxPayRequestTemplate(WxPayOrderQuery, "https://api.mch.weixin.qq.com/pay/orderquery",
+                                    fixed={'appid': appid,  # 公众账号ID
+                                           'mch_id': mchid},  # 商户号
+                                    configKey=configKey)
+
+
+WxPayRequestTemplate._FACTORIES = {
+    'unifiedOrder': WxPayRequestTemplate._unifiedOrder,
+    'orderQuery': WxPayRequestTemplate._orderQuery,
+}
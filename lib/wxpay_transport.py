@@ -0,0 +1,251 @@
+#
+# 长连接传输类
+#
+from .wxpay_config import WxPayConfig
+from .wxpay_exception import WxPayException, WxPayNetworkException
+from .wxpay_metrics import WxPayMetrics
+
+import os, queue, ssl, threading, time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# 建立连接（含TLS握手）的耗时计入当前接口调用的connect阶段，复用长连接时不会调用
+class WxPayHTTPConnection(HTTPConnection):
+    def connect(self):
+        with WxPayMetrics.phase('connect'):
+            super().connect()
+
+
+class WxPayHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        with WxPayMetrics.phase('connect'):
+            super().connect()
+
+
+class WxPayHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = WxPayHTTPConnection
+
+
+class WxPayHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = WxPayHTTPSConnection
+
+
+# 连接池适配器，所有主机的连接池共享同一个SSLContext，
+# 证书库只加载一次，握手参数在所有连接间复用；新建连接的耗时计入接口调用统计
+class WxPayHTTPAdapter(HTTPAdapter):
+    POOL_CLASSES = {'http': WxPayHTTPConnectionPool, 'https': WxPayHTTPSConnectionPool}
+
+    def __init__(self, sslContext=None, **kwargs):
+        self.sslContext = sslContext
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.sslContext is not None:
+            pool_kwargs['ssl_context'] = self.sslContext
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = WxPayHTTPAdapter.POOL_CLASSES
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        if not proxy.lower().startswith('socks'):
+            manager.pool_classes_by_scheme = WxPayHTTPAdapter.POOL_CLASSES
+        return manager
+
+
+# 接口访问的长连接传输对象，按主机维护keep-alive连接池，
+# WxPayApi.postXmlCurl及所有接口方法共用同一个实例
+# @ param int poolConnections 缓存的主机连接池个数
+# @ param int poolMaxsize 每个主机连接池保留的最大连接数
+# @ param bool poolBlock 连接数达到上限时是否等待空闲连接
+# @ param int keepAliveIdle 连接空闲超过该秒数后主动关闭，0表示不主动关闭
+# @ param ssl.SSLContext sslContext 自定义的SSL上下文
+class WxPayTransport:
+    def __init__(self, poolConnections=None, poolMaxsize=None, poolBlock=None,
+                 keepAliveIdle=None, sslContext=None):
+        if poolConnections is None:
+            poolConnections = WxPayConfig.POOL_CONNECTIONS
+        if poolMaxsize is None:
+            poolMaxsize = WxPayConfig.POOL_MAXSIZE
+        if poolBlock is None:
+            poolBlock = WxPayConfig.POOL_BLOCK
+        if keepAliveIdle is None:
+            keepAliveIdle = WxPayConfig.KEEPALIVE_IDLE
+        if sslContext is None:
+            sslContext = ssl.create_default_context()
+
+        self.poolConnections = poolConnections
+        self.poolMaxsize = poolMaxsize
+        self.poolBlock = poolBlock
+        self.keepAliveIdle = keepAliveIdle
+        self.sslContext = sslContext
+
+        self.session = requests.Session()
+        self.adapter = None
+        self._mountAdapter(sslContext)
+        self.session.headers['Content-Type'] = 'text/xml'
+        self.session.headers['Connection'] = 'keep-alive'
+
+        self._lastUsed = {}
+        self._lock = threading.Lock()
+
+    # 以post方式提交数据，返回requests的Response对象
+    # @ param string url
+    # @ param string|bytes data
+    # @ param int|tuple timeout 超时时间（秒），或(连接超时, 读取超时)
+    # @ param dict proxies 代理设置
+    def post(self, url, data, timeout=30, proxies=None, stream=False):
+        self._closeIdle(url)
+        try:
+            return self.session.post(url, data=data, timeout=timeout,
+                                     proxies=proxies, stream=stream)
+        except requests.RequestException as e:
+            raise WxPayNetworkException("curl出错，错误信息:" + str(e), WxPayTransport._isSent(e))
+
+    # 判断出错时请求是否已经发出，连接超时、连接失败、TLS握手失败时请求未发出
+    @staticmethod
+    def _isSent(e):
+        if isinstance(e, (requests.exceptions.ConnectTimeout, requests.exceptions.SSLError)):
+            return False
+        if isinstance(e, requests.exceptions.ConnectionError) and \
+                not isinstance(e, requests.exceptions.ProxyError) and e.args:
+            reason = getattr(e.args[0], 'reason', None)
+            if isinstance(reason, NewConnectionError):
+                return False
+        return True
+
+    # 使用新的SSL上下文创建连接池，替换后旧连接池中的空闲连接随即关闭
+    def _mountAdapter(self, sslContext):
+        old = self.adapter
+        self.sslContext = sslContext
+        self.adapter = WxPayHTTPAdapter(sslContext=sslContext,
+                                        pool_connections=self.poolConnections,
+                                        pool_maxsize=self.poolMaxsize,
+                                        pool_block=self.poolBlock)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        if old is not None:
+            old.close()
+
+    # 关闭所有连接
+    def close(self):
+        with self._lock:
+            self._lastUsed.clear()
+        self.session.close()
+
+    # 主机连接空闲超过keepAliveIdle时关闭池中的连接，下次请求时重新建立
+    def _closeIdle(self, url):
+        if not self.keepAliveIdle:
+            return
+        parts = urlsplit(url)
+        hostKey = (parts.scheme, parts.netloc)
+        now = time.monotonic()
+        with self._lock:
+            lastUsed = self._lastUsed.get(hostKey)
+            self._lastUsed[hostKey] = now
+            if lastUsed is None or now - lastUsed <= self.keepAliveIdle:
+                return
+            for pool in self._hostPools(parts):
+                self._drainPool(pool)
+
+    # 查找某主机对应的所有连接池
+    def _hostPools(self, parts):
+        pools = self.adapter.poolmanager.pools
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        result = []
+        for key in pools.keys():
+            if key.key_scheme == parts.scheme and key.key_host == parts.hostname \
+                    and key.key_port == port:
+                pool = pools.get(key)
+                if pool is not None:
+                    result.append(pool)
+        return result
+
+    # 关闭池中的空闲连接，连接对象保留在池中，下次取用时自动重连
+    @staticmethod
+    def _drainPool(pool):
+        if pool.pool is None:
+            return
+        conns = []
+        while True:
+            try:
+                conns.append(pool.pool.get(block=False))
+            except queue.Empty:
+                break
+        for conn in conns:
+            if conn is not None:
+                conn.close()
+            pool.pool.put(conn, block=False)
+
+
+# 双向证书传输对象，用于退款、撤销订单等/secapi接口。
+# 商户证书与私钥只在创建时加载一次到SSLContext，与普通接口使用不同的连接池；
+# 证书文件的修改时间或大小发生变化时自动重新加载
+# @ param string certPath 证书路径，默认WxPayConfig.SSLCERT_PATH
+# @ param string keyPath 私钥路径，默认WxPayConfig.SSLKEY_PATH
+# @ param int checkInterval 检查证书文件变化的间隔秒数，0表示每次请求都检查
+class WxPayCertTransport(WxPayTransport):
+    def __init__(self, certPath=None, keyPath=None, checkInterval=None, **kwargs):
+        if certPath is None:
+            certPath = WxPayConfig.SSLCERT_PATH
+        if keyPath is None:
+            keyPath = WxPayConfig.SSLKEY_PATH
+        if checkInterval is None:
+            checkInterval = WxPayConfig.SSLCERT_CHECK_INTERVAL
+        self.certPath = certPath
+        self.keyPath = keyPath
+        self.checkInterval = checkInterval
+        self._certStamp = self._stat()
+        self._checkedAt = time.monotonic()
+        self._reloadLock = threading.Lock()
+        kwargs['sslContext'] = self._loadContext()
+        super().__init__(**kwargs)
+
+    def post(self, url, data, timeout=30, proxies=None, stream=False):
+        self.checkReload()
+        return super().post(url, data, timeout, proxies, stream)
+
+    # 获取当前的SSL上下文，异步接口类也通过此方法共用证书
+    def getSslContext(self):
+        self.checkReload()
+        return self.sslContext
+
+    # 证书文件有变化时重新加载并替换连接池
+    def checkReload(self):
+        now = time.monotonic()
+        if now - self._checkedAt < self.checkInterval:
+            return
+        with self._reloadLock:
+            if now - self._checkedAt < self.checkInterval:
+                return
+            self._checkedAt = now
+            stamp = self._stat()
+            if stamp == self._certStamp:
+                return
+            sslContext = self._loadContext()
+            self._certStamp = stamp
+            self._mountAdapter(sslContext)
+
+    # 加载商户证书与私钥
+    def _loadContext(self):
+        sslContext = ssl.create_default_context()
+        try:
+            sslContext.load_cert_chain(self.certPath, self.keyPath)
+        except (OSError, ssl.SSLError) as e:
+            raise WxPayException("加载商户证书出错，错误信息:" + str(e))
+        return sslContext
+
+    def _stat(self):
+        stamp = []
+        for path in (self.certPath, self.keyPath):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
@@ -0,0 +1,156 @@
+#
+# xml序列化类
+#
+from .wxpay_config import WxPayConfig
+from .wxpay_exception import WxPayException
+
+import re
+from xml.parsers import expat
+
+
+# 把参数输出为请求体的UTF-8字节串。每个参数名的标签片段在创建时预先生成，
+# 输出时只需一次拼接、一次编码：
+# int类型直接输出数字，其他值放在CDATA中，值中的"]]>"拆分到两个CDATA段里，None值不输出
+# @ param tuple names 预先生成标签片段的参数名，其他参数名在第一次输出时生成并缓存
+class WxPayXmlWriter:
+    # 参数名只允许字母、数字、下划线，避免拼出非法的标签
+    NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+    # 缓存的参数名上限，接口返回结果等参数名不固定的对象超出后不再缓存
+    MAX_NAMES = 1024
+    # 没有任何参数时的输出
+    EMPTY = b'<xml></xml>'
+
+    def __init__(self, names=()):
+        self._fragments = {}
+        for name in names:
+            self._fragment(name)
+
+    # 输出xml字节串
+    # @ param iterable items (参数名, 值)序列
+    def write(self, items):
+        fragments = self._fragments
+        parts = ['<xml>']
+        append = parts.append
+        for key, value in items:
+            if value is None:
+                continue
+            fragment = fragments.get(key)
+            if fragment is None:
+                fragment = self._fragment(key)
+            if type(value) is int:
+                append(fragment[0])
+                append(str(value))
+                append(fragment[1])
+            else:
+                if type(value) is not str:
+                    value = str(value)
+                if ']]>' in value:
+                    value = value.replace(']]>', ']]]]><![CDATA[>')
+                append(fragment[2])
+                append(value)
+                append(fragment[3])
+        append('</xml>')
+        return ''.join(parts).encode('utf-8')
+
+    # 生成参数名的标签片段：(开始标签, 结束标签, CDATA开始, CDATA结束)
+    def _fragment(self, name):
+        if not isinstance(name, str) or not WxPayXmlWriter.NAME.match(name):
+            raise WxPayException("参数名" + str(name) + "不合法！")
+        fragment = ('<' + name + '>', '</' + name + '>',
+                    '<' + name + '><![CDATA[', ']]></' + name + '>')
+        if len(self._fragments) < WxPayXmlWriter.MAX_NAMES:
+            self._fragments[name] = fragment
+        return fragment
+
+
+# 解析接口返回结果和支付通知的单层xml，直接从字节串读取<xml>下一层参数的文本，不构建元素树。
+# 常见的格式（每个参数为纯文本或单个CDATA）用一个正则一次拆分出全部参数，其他格式交给expat解析。
+# 用于解析不可信的通知数据：超过长度或参数个数上限、层级超过两层、包含DTD或实体时抛出异常
+# @ param int maxSize xml最大字节数，默认WxPayConfig.XML_MAX_SIZE
+# @ param int maxFields 最多参数个数，默认WxPayConfig.XML_MAX_FIELDS
+class WxPayXmlReader:
+    # 单个参数：纯文本（不含实体）或单个CDATA
+    FIELD = re.compile(r'<([A-Za-z_][A-Za-z0-9_]*)>(?:<!\[CDATA\[([^\]]*)\]\]>|([^<&\]]*))</\1>')
+    # xml中不允许出现的控制字符，以及需要换行符规范化的\r，出现时交给expat处理
+    SPECIAL = bytes(c for c in range(32) if c not in (9, 10))
+
+    def __init__(self, maxSize=None, maxFields=None):
+        self.maxSize = WxPayConfig.XML_MAX_SIZE if maxSize is None else maxSize
+        self.maxFields = WxPayConfig.XML_MAX_FIELDS if maxFields is None else maxFields
+
+    # 解析xml，返回参数字典，空元素的值为None。
+    # 建议直接传入收到的字节串（WxPayApi.postXmlBytes），整个解析过程只解码一次；
+    # 传入字符串时需要先编码回字节串
+    # @ param bytes|bytearray|memoryview|string xml
+    # @ throws WxPayException
+    def read(self, xml):
+        if type(xml) is not bytes:
+            xml = xml.encode('utf-8') if isinstance(xml, str) else bytes(xml)
+        if len(xml) > self.maxSize:
+            raise WxPayException("xml数据超过长度限制！")
+        try:
+            values = self._scan(xml)
+        except UnicodeDecodeError:
+            raise WxPayException("xml数据异常！编码不是UTF-8")
+        if values is None:
+            values = self._parse(xml)
+        return values
+
+    # 一次匹配出全部参数，参数之外只能是<xml></xml>和空白，否则返回None
+    def _scan(self, xml):
+        if len(xml.translate(None, WxPayXmlReader.SPECIAL)) != len(xml):
+            return None
+        # 按参数拆分，每个参数对应4项：参数之前的内容, 参数名, CDATA, 文本
+        parts = WxPayXmlReader.FIELD.split(xml.decode('utf-8'))
+        if ''.join(''.join(parts[0::4]).split()) != '<xml></xml>':
+            return None
+        if len(parts) // 4 > self.maxFields:
+            raise WxPayException("xml参数个数超过限制！")
+        return dict(zip(parts[1::4], [cdata or text or None
+                                      for cdata, text in zip(parts[2::4], parts[3::4])]))
+
+    # 使用expat解析
+    def _parse(self, xml):
+        values = {}
+        text = []
+        state = [0, None, 0]  # 当前层级, 当前参数名, 参数个数
+        maxFields = self.maxFields
+
+        def start(name, attrs):
+            depth = state[0] + 1
+            state[0] = depth
+            if depth == 2:
+                state[2] += 1
+                if state[2] > maxFields:
+                    raise WxPayException("xml参数个数超过限制！")
+                state[1] = name
+                del text[:]
+            elif depth > 2:
+                raise WxPayException("xml数据层级过深！")
+
+        def end(name):
+            if state[0] == 2:
+                values[state[1]] = ''.join(text) if text else None
+            state[0] -= 1
+
+        def data(chars):
+            if state[0] == 2:
+                text.append(chars)
+
+        def reject(*args):
+            raise WxPayException("xml数据不允许包含DTD或实体！")
+
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.SetParamEntityParsing(expat.XML_PARAM_ENTITY_PARSING_NEVER)
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = data
+        parser.StartDoctypeDeclHandler = reject
+        parser.EntityDeclHandler = reject
+        parser.ExternalEntityRefHandler = reject
+        try:
+            parser.Parse(xml, True)
+        except expat.ExpatError as e:
+            raise WxPayException("xml数据异常！" + str(e))
+        return values
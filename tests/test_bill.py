@@ -0,0 +1,61 @@
+#
+# 对账单解析测试
+# 运行方法: python -m unittest discover -s tests
+#
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.wxpay_bill import WxPayBill, WxPayBillReader
+
+
+HEADER = '交易时间,公众账号ID,商户号,微信订单号,商户订单号,交易类型,交易状态,总金额,退款金额,手续费'
+ROWS = (
+    '`2015-08-06 12:53:46,`wx1,`100,`4001,`T1,`JSAPI,`SUCCESS,`1.00,`0.00,`0.01',
+    '`2015-08-06 13:10:00,`wx1,`100,`4002,`T2,`NATIVE,`SUCCESS,`2.50,`0.00,`0.02',
+    # 下载中断造成的残缺行
+    '`2015-08-06 13:20:00,`wx1,`100,`4003',
+    '`2015-08-06 14:00:00,`wx1,`100,`4004,`T4,`JSAPI,`REFUND,`3.00,`3.00,`0.00',
+    '总交易单数,总交易额,总退款金额,总手续费',
+    '`3,`6.50,`3.00,`0.03',
+)
+
+
+def makeReader(text):
+    data = text.encode('utf-8')
+    return WxPayBillReader([data[i:i + 7] for i in range(0, len(data), 7)])
+
+
+class WxPayBillTest(unittest.TestCase):
+    def setUp(self):
+        self.bill = WxPayBill.fromReader(makeReader('\r\n'.join((HEADER,) + ROWS) + '\r\n'))
+
+    # 字段数少于表头的行不计入，记录行号（从1开始的数据行序号）
+    def testSkipTruncatedRows(self):
+        self.assertEqual(len(self.bill), 3)
+        self.assertEqual(self.bill.skipped, [3])
+        self.assertEqual(self.bill.get(2, 'out_trade_no'), 'T4')
+
+    def testTotals(self):
+        self.assertEqual(self.bill.totals(), {'count': 3, 'total_fee': 650, 'refund_fee': 300, 'poundage': 3})
+
+    def testGroupBy(self):
+        self.assertEqual(self.bill.groupBy('trade_type'), {'JSAPI': (2, 400), 'NATIVE': (1, 250)})
+        self.assertEqual(self.bill.groupBy('trade_state', 'refund_fee'), {'SUCCESS': (2, 0), 'REFUND': (1, 300)})
+        self.assertEqual(self.bill.groupBy('hour'), {12: (1, 100), 13: (1, 250), 14: (1, 300)})
+
+    # 保存后加载的缓存与原账单一致，包括跳过的行号
+    def testSaveLoad(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, '20150806.bill')
+        self.bill.save(path)
+        bill = WxPayBill.load(path)
+        self.assertEqual(bill.skipped, [3])
+        self.assertEqual(bill.groupBy('trade_type'), self.bill.groupBy('trade_type'))
+        self.assertEqual(bill.get(1, 'transaction_id'), '4002')
+        bill.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
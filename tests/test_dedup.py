@@ -0,0 +1,146 @@
+#
+# 支付通知去重测试
+# 运行方法: python -m unittest discover -s tests
+#
+import os, sys, shutil, tempfile, time, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.wxpay_dedup import WxPayNotifyDedup, WxPayDedupBackend, WxPayRedisDedupBackend, WxPaySqliteDedupBackend
+from lib.wxpay_exception import WxPayException
+
+
+# 接口兼容redis-py的内存客户端，只实现后端用到的命令
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, name):
+        entry = self.data.get(name)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0].encode('ascii')
+
+    def set(self, name, value, nx=False, ex=None):
+        if nx and self.get(name) is not None:
+            return None
+        self.data[name] = (value, time.time() + ex)
+        return True
+
+    def delete(self, name):
+        self.data.pop(name, None)
+
+
+# 每次访问都失败的共享存储
+class BrokenBackend(WxPayDedupBackend):
+    def get(self, key):
+        raise ConnectionError("down")
+
+    def add(self, key, value, ttl):
+        raise ConnectionError("down")
+
+    def set(self, key, value, ttl):
+        raise ConnectionError("down")
+
+    def delete(self, key):
+        raise ConnectionError("down")
+
+
+class WxPayNotifyDedupTest(unittest.TestCase):
+    def testKey(self):
+        self.assertEqual(WxPayNotifyDedup.key({'transaction_id': '42', 'out_trade_no': 'T1'}), 't:42')
+        self.assertEqual(WxPayNotifyDedup.key({'out_trade_no': 'T1'}), 'o:T1')
+        self.assertIsNone(WxPayNotifyDedup.key({}))
+
+    def testClaimDoneRelease(self):
+        dedup = WxPayNotifyDedup()
+        self.assertFalse(dedup.isDone('t:1'))
+        self.assertTrue(dedup.claim('t:1'))
+        # 处理中的重复通知不能再占用
+        self.assertFalse(dedup.claim('t:1'))
+        dedup.release('t:1')
+        self.assertTrue(dedup.claim('t:1'))
+        dedup.done('t:1')
+        self.assertTrue(dedup.isDone('t:1'))
+        self.assertFalse(dedup.claim('t:1'))
+        self.assertEqual(dedup.stats()['conflicts'], 2)
+
+    # 没有去重键的通知不去重
+    def testNoneKey(self):
+        dedup = WxPayNotifyDedup()
+        self.assertTrue(dedup.claim(None))
+        self.assertTrue(dedup.claim(None))
+        self.assertFalse(dedup.isDone(None))
+
+    # 处理中的记录超过pendingTtl后允许重新处理
+    def testPendingExpires(self):
+        dedup = WxPayNotifyDedup(pendingTtl=0.05)
+        self.assertTrue(dedup.claim('t:1'))
+        time.sleep(0.1)
+        self.assertTrue(dedup.claim('t:1'))
+
+    def testEvictLeastRecentlyUsed(self):
+        dedup = WxPayNotifyDedup(maxSize=2)
+        for key in ('t:1', 't:2', 't:3'):
+            dedup.done(key)
+        self.assertFalse(dedup.isDone('t:1'))
+        self.assertTrue(dedup.isDone('t:3'))
+        self.assertEqual(dedup.stats()['size'], 2)
+
+    def testAbstractBackend(self):
+        class Partial(WxPayDedupBackend):
+            def get(self, key):
+                return None
+        self.assertRaises(TypeError, Partial)
+
+    # 共享存储不可用时isDone按未处理返回，claim抛出异常且不保留本地占用
+    def testBrokenBackend(self):
+        dedup = WxPayNotifyDedup(backend=BrokenBackend())
+        self.assertFalse(dedup.isDone('t:1'))
+        self.assertRaises(WxPayException, dedup.claim, 't:1')
+        self.assertEqual(dedup.stats()['size'], 0)
+        self.assertRaises(WxPayException, dedup.release, 't:1')
+        # 已处理的记录保存在本地
+        self.assertRaises(WxPayException, dedup.done, 't:1')
+        self.assertTrue(dedup.isDone('t:1'))
+        self.assertEqual(dedup.stats()['errors'], 4)
+
+
+class WxPayDedupBackendTest(unittest.TestCase):
+    # 两个进程（各自的本地缓存）共享同一存储
+    def checkShared(self, first, second):
+        a = WxPayNotifyDedup(backend=first)
+        b = WxPayNotifyDedup(backend=second)
+        self.assertTrue(a.claim('t:1'))
+        self.assertFalse(b.claim('t:1'))
+        a.release('t:1')
+        self.assertTrue(b.claim('t:1'))
+        b.done('t:1')
+        self.assertTrue(a.isDone('t:1'))
+        self.assertFalse(a.claim('t:1'))
+
+    def testRedis(self):
+        client = FakeRedis()
+        self.checkShared(WxPayRedisDedupBackend(client), WxPayRedisDedupBackend(client))
+        self.assertIn('wxpay:notify:t:1', client.data)
+
+    def testSqlite(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, 'dedup.db')
+        self.checkShared(WxPaySqliteDedupBackend(path), WxPaySqliteDedupBackend(path))
+
+    # 过期的记录可以重新写入
+    def testSqliteExpired(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        backend = WxPaySqliteDedupBackend(os.path.join(directory, 'dedup.db'))
+        self.assertTrue(backend.add('t:1', WxPayNotifyDedup.PENDING, 0.05))
+        self.assertFalse(backend.add('t:1', WxPayNotifyDedup.PENDING, 0.05))
+        time.sleep(0.1)
+        self.assertIsNone(backend.get('t:1'))
+        self.assertTrue(backend.add('t:1', WxPayNotifyDedup.PENDING, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#
+# 刷卡支付流程驱动测试
+# 运行方法: python -m unittest discover -s tests
+#
+import os, sys, time, unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.wxpay_api import WxPayApi
+from lib.wxpay_data import WxPayMicroPay
+from lib.wxpay_exception import WxPayException, WxPayNetworkException
+from lib.wxpay_micropay import WxPayMicroPayDriver, WxPayMicroPayTask
+
+
+# 用户支付中的刷卡支付结果，驱动会转为轮询订单
+USERPAYING = {'return_code': 'SUCCESS', 'result_code': 'FAIL', 'err_code': 'USERPAYING'}
+
+
+def makeOrder():
+    inputObj = WxPayMicroPay()
+    inputObj.SetOut_trade_no("20150806125346")
+    inputObj.SetBody("刷卡测试样例")
+    inputObj.SetTotal_fee(1)
+    inputObj.SetAuth_code("120061098828009406")
+    return inputObj
+
+
+class WxPayMicroPayDriverTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(WxPayApi, 'micropay', return_value=USERPAYING)
+        self.micropay = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    # 轮询等待中关闭驱动，任务以ERROR结束
+    def testCloseWhilePollPending(self):
+        driver = WxPayMicroPayDriver(workers=2, queryInterval=10)
+        task = driver.submit(makeOrder())
+        deadline = time.monotonic() + 5
+        while task.state != WxPayMicroPayTask.QUERYING and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(task.state, WxPayMicroPayTask.QUERYING)
+
+        driver.close()
+        self.assertIs(task.future.result(timeout=5), task)
+        self.assertEqual(task.state, WxPayMicroPayTask.ERROR)
+
+    # 定时线程取出步骤后驱动被关闭（线程池已停止），任务以ERROR结束，定时线程不会异常退出
+    def testTimerFiresAfterExecutorShutdown(self):
+        driver = WxPayMicroPayDriver(workers=2, queryInterval=0.05)
+        driver._executor.shutdown()
+        task = driver.submit(makeOrder())
+        self.assertIs(task.future.result(timeout=5), task)
+        self.assertEqual(task.state, WxPayMicroPayTask.ERROR)
+        self.assertIsInstance(task.error, WxPayException)
+        self.assertTrue(driver._thread.is_alive())
+
+        other = driver.submit(makeOrder())
+        self.assertEqual(other.future.result(timeout=5).state, WxPayMicroPayTask.ERROR)
+        driver.close()
+
+    # 参数不完整时请求不会发出，任务直接以FAILED结束，不查询也不撤销
+    def testInvalidOrderFailsImmediately(self):
+        driver = WxPayMicroPayDriver(workers=2, queryInterval=10)
+        self.addCleanup(driver.close)
+        inputObj = WxPayMicroPay()
+        inputObj.SetOut_trade_no("20150806125346")
+        task = driver.submit(inputObj)
+        self.assertIs(task.future.result(timeout=5), task)
+        self.assertEqual(task.state, WxPayMicroPayTask.FAILED)
+        self.assertIsInstance(task.error, WxPayException)
+        self.micropay.assert_not_called()
+
+    # 连接失败（请求未发出）时直接以FAILED结束
+    def testUnsentRequestFails(self):
+        self.micropay.side_effect = WxPayNetworkException("connect failed", sent=False)
+        driver = WxPayMicroPayDriver(workers=2, queryInterval=10)
+        self.addCleanup(driver.close)
+        task = driver.submit(makeOrder())
+        self.assertIs(task.future.result(timeout=5), task)
+        self.assertEqual(task.state, WxPayMicroPayTask.FAILED)
+
+    # 请求已发出但没有收到应答时转为查询
+    def testSentRequestQueries(self):
+        self.micropay.side_effect = WxPayNetworkException("read timeout", sent=True)
+        driver = WxPayMicroPayDriver(workers=2, queryInterval=10)
+        task = driver.submit(makeOrder())
+        deadline = time.monotonic() + 5
+        while task.state == WxPayMicroPayTask.PAYING and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(task.state, WxPayMicroPayTask.QUERYING)
+        driver.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
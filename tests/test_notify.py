@@ -0,0 +1,288 @@
+#
+# 支付通知分发测试
+# 运行方法: python -m unittest discover -s tests
+#
+import io, os, sys, asyncio, shutil, tempfile, threading, time, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.wxpay_api import WxPayApi
+from lib.wxpay_data import WxPayResults
+from lib.wxpay_dedup import WxPayNotifyDedup, WxPayDedupBackend
+from lib.wxpay_exception import WxPayException
+from lib.wxpay_notify import WxPayNotifyDispatcher, WxPayNotifyApp, AsyncWxPayNotifyApp
+from lib.wxpay_queue import WxPayNotifyQueue
+
+
+# 生成签名正确的支付通知
+def makeBody(transactionId):
+    obj = WxPayResults()
+    obj.FromArray(return_code='SUCCESS', result_code='SUCCESS', transaction_id=transactionId,
+                  out_trade_no='T' + transactionId, total_fee='1')
+    obj.SetSign()
+    return obj.ToXmlBytes()
+
+
+def isSuccess(reply):
+    return reply == WxPayNotifyDispatcher.SUCCESS
+
+
+# 可切换为失败的共享存储
+class FlakyBackend(WxPayDedupBackend):
+    def __init__(self):
+        self.broken = set()
+        self.data = {}
+
+    def check(self, name):
+        if name in self.broken:
+            raise ConnectionError("down")
+
+    def get(self, key):
+        self.check('get')
+        return self.data.get(key)
+
+    def add(self, key, value, ttl):
+        self.check('add')
+        if key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    def set(self, key, value, ttl):
+        self.check('set')
+        self.data[key] = value
+
+    def delete(self, key):
+        self.check('delete')
+        self.data.pop(key, None)
+
+
+class WxPayNotifyDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def makeDispatcher(self, handler=None, **kwargs):
+        dispatcher = WxPayNotifyDispatcher(handler or self.calls.append, **kwargs)
+        self.addCleanup(dispatcher.close)
+        return dispatcher
+
+    # 阻塞到测试放行的业务处理
+    def blockingHandler(self, data):
+        self.calls.append(data)
+        self.release.wait(5)
+        return True
+
+    # 在后台线程中分发，返回保存应答的列表及线程
+    def dispatchInThread(self, dispatcher, body):
+        replies = []
+        thread = threading.Thread(target=lambda: replies.append(dispatcher.dispatch(body)))
+        thread.start()
+        deadline = time.monotonic() + 5
+        while not self.calls and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return replies, thread
+
+    def testSignatureError(self):
+        dispatcher = self.makeDispatcher()
+        body = makeBody('1').replace(b'<total_fee><![CDATA[1]]>', b'<total_fee><![CDATA[2]]>')
+        self.assertFalse(isSuccess(dispatcher.dispatch(body)))
+        self.assertEqual(dispatcher.stats()['rejected'], 1)
+        self.assertEqual(self.calls, [])
+
+    # 已处理成功的重复通知直接应答SUCCESS，不再调用业务处理
+    def testDuplicateSuppressed(self):
+        dispatcher = self.makeDispatcher(dedup=WxPayNotifyDedup())
+        for i in range(3):
+            self.assertTrue(isSuccess(dispatcher.dispatch(makeBody('1'))))
+        self.assertEqual(len(self.calls), 1)
+        stats = dispatcher.stats()
+        self.assertEqual(stats['handled'], 1)
+        self.assertEqual(stats['duplicate'], 2)
+
+    # 处理中收到的重复通知应答FAIL，由微信稍后重新通知
+    def testDuplicateWhileProcessing(self):
+        dispatcher = self.makeDispatcher(self.blockingHandler, dedup=WxPayNotifyDedup())
+        replies, thread = self.dispatchInThread(dispatcher, makeBody('1'))
+        self.assertFalse(isSuccess(dispatcher.dispatch(makeBody('1'))))
+        self.release.set()
+        thread.join()
+        self.assertTrue(isSuccess(replies[0]))
+        self.assertEqual(len(self.calls), 1)
+
+    # 在途处理达到maxPending时直接应答FAIL
+    def testBusy(self):
+        dispatcher = self.makeDispatcher(self.blockingHandler, maxPending=1)
+        replies, thread = self.dispatchInThread(dispatcher, makeBody('1'))
+        self.assertFalse(isSuccess(dispatcher.dispatch(makeBody('2'))))
+        self.assertEqual(dispatcher.stats()['busy'], 1)
+        self.release.set()
+        thread.join()
+        self.assertTrue(isSuccess(replies[0]))
+        self.assertTrue(isSuccess(dispatcher.dispatch(makeBody('3'))))
+        self.assertEqual(dispatcher.stats()['pending'], 0)
+
+    # 超过handlerTimeout应答FAIL，业务处理完成后释放在途名额
+    def testTimeout(self):
+        dispatcher = self.makeDispatcher(self.blockingHandler, handlerTimeout=0.05)
+        self.assertFalse(isSuccess(dispatcher.dispatch(makeBody('1'))))
+        self.assertEqual(dispatcher.stats()['timeout'], 1)
+        self.release.set()
+        dispatcher.close()
+        self.assertEqual(dispatcher.stats()['pending'], 0)
+        self.assertEqual(dispatcher.stats()['handled'], 1)
+
+    def testHandlerFailure(self):
+        def handler(data):
+            raise WxPayException("库存不足")
+        dispatcher = self.makeDispatcher(handler)
+        reply = dispatcher.dispatch(makeBody('1'))
+        self.assertFalse(isSuccess(reply))
+        self.assertIn("库存不足".encode('utf-8'), reply)
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+
+    def testCoroutineHandler(self):
+        async def handler(data):
+            self.calls.append(data)
+            return True
+        dispatcher = self.makeDispatcher(handler)
+
+        async def run():
+            return await dispatcher.dispatchAsync(makeBody('1'))
+
+        self.assertTrue(isSuccess(asyncio.run(run())))
+        # WSGI中在后台事件循环中执行
+        self.assertTrue(isSuccess(dispatcher.dispatch(makeBody('2'))))
+        self.assertEqual(len(self.calls), 2)
+
+    # 不等待业务处理时必须配置持久化队列
+    def testNoWaitRequiresQueue(self):
+        self.assertRaises(WxPayException, WxPayNotifyDispatcher, self.calls.append, waitHandler=False)
+
+    # 配置持久化队列时写入队列后应答SUCCESS，重复通知只入队一次
+    def testQueue(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        queue = WxPayNotifyQueue(os.path.join(directory, 'notify.db'), self.calls.append, workers=0)
+        self.addCleanup(queue.close)
+        dispatcher = self.makeDispatcher(None, queue=queue, waitHandler=False)
+        for i in range(2):
+            self.assertTrue(isSuccess(dispatcher.dispatch(makeBody('1'))))
+        stats = dispatcher.stats()
+        self.assertEqual(stats['queued'], 1)
+        self.assertEqual(stats['duplicate'], 1)
+        self.assertEqual(queue.processBatch(), 1)
+        self.assertEqual(len(self.calls), 1)
+
+
+class WxPayNotifyAppTest(unittest.TestCase):
+    def testWsgi(self):
+        calls = []
+        app = WxPayNotifyApp(calls.append)
+        self.addCleanup(app.close)
+        body = makeBody('1')
+        statuses = []
+        environ = {'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body)}
+        reply = app(environ, lambda status, headers: statuses.append(status))
+        self.assertEqual(statuses, ['200 OK'])
+        self.assertTrue(isSuccess(reply[0]))
+        app({'REQUEST_METHOD': 'GET'}, lambda status, headers: statuses.append(status))
+        self.assertEqual(statuses[-1], '405 Method Not Allowed')
+        self.assertEqual(len(calls), 1)
+
+    def testAsgi(self):
+        calls = []
+
+        async def handler(data):
+            calls.append(data)
+            return True
+
+        app = AsyncWxPayNotifyApp(handler)
+        self.addCleanup(app.close)
+        body = makeBody('1')
+        messages = [{'type': 'http.request', 'body': body[:10], 'more_body': True},
+                    {'type': 'http.request', 'body': body[10:]}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(app({'type': 'http', 'method': 'POST'}, receive, send))
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertTrue(isSuccess(sent[1]['body']))
+        self.assertEqual(len(calls), 1)
+
+
+class WxPayNotifyBackendFailureTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = FlakyBackend()
+        self.calls = []
+
+    def makeDispatcher(self, **kwargs):
+        dedup = WxPayNotifyDedup(backend=self.backend)
+        dispatcher = WxPayNotifyDispatcher(self.calls.append, workers=2, maxPending=2, dedup=dedup, **kwargs)
+        self.addCleanup(dispatcher.close)
+        return dispatcher
+
+    # 去重存储无法占用通知时应答FAIL且不占用在途名额，恢复后正常处理
+    def testClaimFailure(self):
+        dispatcher = self.makeDispatcher()
+        self.backend.broken = {'get', 'add'}
+        for i in range(5):
+            self.assertFalse(isSuccess(dispatcher.dispatch(makeBody('1'))))
+        self.assertEqual(dispatcher.stats()['pending'], 0)
+        self.assertEqual(dispatcher.stats()['busy'], 0)
+        self.assertEqual(self.calls, [])
+
+        self.backend.broken = set()
+        self.assertTrue(isSuccess(dispatcher.dispatch(makeBody('1'))))
+        self.assertEqual(len(self.calls), 1)
+
+    def testClaimFailureAsync(self):
+        dispatcher = self.makeDispatcher()
+        self.backend.broken = {'add'}
+
+        async def run():
+            return [await dispatcher.dispatchAsync(makeBody('1')) for i in range(3)]
+
+        self.assertFalse(any(isSuccess(reply) for reply in asyncio.run(run())))
+        self.assertEqual(dispatcher.stats()['pending'], 0)
+
+    # 业务处理成功后记录去重状态失败仍应答SUCCESS，并释放在途名额
+    def testDoneFailure(self):
+        dispatcher = self.makeDispatcher()
+        self.backend.broken = {'set'}
+        for i in range(3):
+            self.assertTrue(isSuccess(dispatcher.dispatch(makeBody(str(i)))))
+        self.assertEqual(dispatcher.stats()['pending'], 0)
+        self.assertEqual(dispatcher.stats()['handled'], 3)
+
+    # 业务处理失败后释放占用失败仍应答FAIL，并释放在途名额
+    def testReleaseFailure(self):
+        dedup = WxPayNotifyDedup(backend=self.backend)
+        dispatcher = WxPayNotifyDispatcher(lambda data: False, workers=2, maxPending=2, dedup=dedup)
+        self.addCleanup(dispatcher.close)
+        self.backend.broken = {'delete'}
+        for i in range(3):
+            self.assertFalse(isSuccess(dispatcher.dispatch(makeBody(str(i)))))
+        self.assertEqual(dispatcher.stats()['pending'], 0)
+        self.assertEqual(dispatcher.stats()['failed'], 3)
+
+    def testApiNotify(self):
+        dedup = WxPayNotifyDedup(backend=self.backend)
+        self.backend.broken = {'add'}
+        ok, msg = WxPayApi.notify(self.calls.append, makeBody('1'), dedup=dedup)
+        self.assertFalse(ok)
+        self.assertEqual(self.calls, [])
+
+        self.backend.broken = {'set'}
+        self.assertEqual(WxPayApi.notify(self.calls.append, makeBody('1'), dedup=dedup), (True, "OK"))
+        self.assertEqual(len(self.calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
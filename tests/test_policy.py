@@ -0,0 +1,75 @@
+#
+# 接口调用策略测试
+# 运行方法: python -m unittest discover -s tests
+#
+import os, sys, threading, time, unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.wxpay_exception import WxPayNetworkException
+from lib.wxpay_policy import WxPayEndpointPolicy
+
+
+# 记录请求数及最大在途请求数的模拟接口
+class FakeEndpoint:
+    def __init__(self, latencies):
+        self.latencies = list(latencies)
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.posts = 0
+
+    def __call__(self, timeout):
+        with self.lock:
+            latency = self.latencies[min(self.posts, len(self.latencies) - 1)]
+            self.posts += 1
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+        time.sleep(latency)
+        with self.lock:
+            self.inFlight -= 1
+        return latency
+
+
+class WxPayEndpointPolicyTest(unittest.TestCase):
+    # 第一次请求超过对冲等待时间仍未返回时再发一次，取先返回的结果
+    def testHedgeSlowAttempt(self):
+        policy = WxPayEndpointPolicy(idempotent=True, hedge=True, hedgeDelay=0.05)
+        endpoint = FakeEndpoint([1.0, 0.01])
+        start = time.monotonic()
+        self.assertEqual(policy.execute(endpoint), 0.01)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(endpoint.posts, 2)
+
+    # 并发超过对冲线程数时不限制在途请求，也不因排队而对冲（调用数少于MIN_SAMPLES，对冲等待时间固定）
+    def testConcurrencyNotCapped(self):
+        policy = WxPayEndpointPolicy(idempotent=True, hedge=True, hedgeDelay=0.2, hedgeWorkers=4)
+        endpoint = FakeEndpoint([0.1])
+        with ThreadPoolExecutor(16) as executor:
+            list(executor.map(lambda i: policy.execute(endpoint), range(16)))
+        self.assertEqual(endpoint.posts, 16)
+        self.assertGreater(endpoint.maxInFlight, 4)
+
+    # 没有空闲的对冲线程时不发第二次请求，等待第一次请求的结果
+    def testNoHedgeWithoutFreeWorker(self):
+        policy = WxPayEndpointPolicy(idempotent=True, hedge=True, hedgeDelay=0.02, hedgeWorkers=1)
+        endpoint = FakeEndpoint([0.1])
+        self.assertEqual(policy.execute(endpoint), 0.1)
+        self.assertEqual(endpoint.posts, 1)
+
+    # 非幂等接口只在请求未发出时重试
+    def testRetryOnlyUnsent(self):
+        policy = WxPayEndpointPolicy(retries=2, backoff=0)
+        calls = []
+
+        def attempt(timeout):
+            calls.append(timeout)
+            raise WxPayNetworkException("reset", sent=len(calls) > 1)
+
+        self.assertRaises(WxPayNetworkException, policy.execute, attempt)
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
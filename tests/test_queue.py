@@ -0,0 +1,134 @@
+#
+# 支付通知持久化队列测试
+# 运行方法: python -m unittest discover -s tests
+#
+import os, sys, shutil, sqlite3, tempfile, threading, time, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.wxpay_queue import WxPayNotifyQueue
+
+
+def makeNotify(transactionId):
+    return {'return_code': 'SUCCESS', 'result_code': 'SUCCESS', 'transaction_id': transactionId,
+            'out_trade_no': 'T' + transactionId, 'total_fee': '1'}
+
+
+class WxPayNotifyQueueTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.path = os.path.join(directory, 'notify.db')
+
+    def makeQueue(self, handler, **kwargs):
+        queue = WxPayNotifyQueue(self.path, handler, **kwargs)
+        self.addCleanup(queue.close)
+        return queue
+
+    # 模拟其他进程在租约到期后重新领取通知
+    def steal(self, transactionId):
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.execute("UPDATE wxpay_notify SET attempts = attempts + 1 WHERE data LIKE ?",
+                               ('%' + transactionId + '%',))
+        connection.close()
+
+    def waitFor(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    # 业务处理超过租约时长，同批领取的通知由续约线程延长租约，每条只处理一次
+    def testLongHandlerOutlivesLease(self):
+        calls = []
+        lock = threading.Lock()
+
+        def handler(data):
+            with lock:
+                calls.append(data['transaction_id'])
+            time.sleep(0.5)
+            return True
+
+        queue = self.makeQueue(handler, workers=0, lease=0.3)
+        for i in range(4):
+            queue.put(makeNotify(str(i)))
+        threads = [threading.Thread(target=queue.processBatch) for i in range(3)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+        # 首批处理结束后其他线程仍可能晚到，再处理一次确认没有遗留
+        queue.processBatch()
+
+        self.assertEqual(sorted(calls), ['0', '1', '2', '3'])
+        stats = queue.stats()
+        self.assertEqual(stats['handled'], 4)
+        self.assertEqual(stats['lost'], 0)
+
+    # 租约已被重新领取时，处理结果不再写入也不计为成功
+    def testFencedAck(self):
+        def handler(data):
+            self.steal(data['transaction_id'])
+            return True
+
+        queue = self.makeQueue(handler, workers=0, lease=30)
+        queue.put(makeNotify('1'))
+        queue.processBatch()
+        stats = queue.stats()
+        self.assertEqual(stats['handled'], 0)
+        self.assertEqual(stats['lost'], 1)
+        self.assertEqual(stats['processing'], 1)
+
+    # 同批领取的通知在处理前租约已被重新领取，不再调用业务处理
+    def testLeaseCheckedBeforeHandler(self):
+        calls = []
+
+        def handler(data):
+            calls.append(data['transaction_id'])
+            if data['transaction_id'] == '1':
+                self.steal('2')
+            return True
+
+        queue = self.makeQueue(handler, workers=0, lease=30)
+        queue.put(makeNotify('1'))
+        queue.put(makeNotify('2'))
+        self.assertEqual(queue.processBatch(), 2)
+        self.assertEqual(calls, ['1'])
+        stats = queue.stats()
+        self.assertEqual(stats['handled'], 1)
+        self.assertEqual(stats['lost'], 1)
+
+    # 同一笔交易只入队一次
+    def testDuplicatePut(self):
+        calls = []
+        queue = self.makeQueue(calls.append, workers=1)
+        self.assertTrue(queue.put(makeNotify('1')))
+        self.assertFalse(queue.put(makeNotify('1')))
+        self.waitFor(lambda: queue.stats()['handled'] == 1)
+        self.assertFalse(queue.put(makeNotify('1')))
+        self.assertEqual(len(calls), 1)
+        stats = queue.stats()
+        self.assertEqual(stats['queued'], 1)
+        self.assertEqual(stats['duplicate'], 2)
+
+    # 处理失败时重试，超过最多处理次数后标记为失败
+    def testRetryThenFail(self):
+        def handler(data):
+            raise ValueError("boom")
+
+        queue = self.makeQueue(handler, workers=0, maxAttempts=2, retryDelay=0)
+        queue.put(makeNotify('1'))
+        self.assertEqual(queue.processBatch(), 1)
+        self.assertEqual(queue.processBatch(), 1)
+        self.assertEqual(queue.processBatch(), 0)
+        stats = queue.stats()
+        self.assertEqual(stats['retried'], 1)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['dead'], 1)
+        self.assertIsInstance(queue.lastError, ValueError)
+
+
+if __name__ == '__main__':
+    unittest.main()